@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Order Adjustments for Bob's Pizza Emporium
+Voids, refunds and amendments as compensating entries, with incrementally kept daily totals
+"""
+
+from collections import Counter
+
+from menu import cart_totals
+from orders import parse_order_items
+from shifts import from_cents, to_cents
+
+KINDS = ('void', 'refund', 'amend')
+
+# Audit action recorded for each kind
+AUDIT_ACTIONS = {'void': 'order voided', 'refund': 'order refunded', 'amend': 'order amended'}
+
+
+def init_adjustment_tables(cursor):
+    """Create the adjustments table and the daily totals rollup"""
+    # Orders are never edited; each change is a row of deltas against one
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_adjustments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            user_id INTEGER,
+            removed TEXT NOT NULL,
+            added TEXT NOT NULL,
+            subtotal_cents INTEGER NOT NULL,
+            tax_cents INTEGER NOT NULL,
+            total_cents INTEGER NOT NULL,
+            reason TEXT NOT NULL DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_order_adjustments_order
+        ON order_adjustments (order_id, id)
+    ''')
+
+    init_daily_totals_table(cursor)
+
+
+def init_daily_totals_table(cursor):
+    """Create the daily totals rollup"""
+    # Net sales per local day; orders add to it, adjustments add their deltas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            day TEXT PRIMARY KEY,
+            order_count INTEGER NOT NULL DEFAULT 0,
+            subtotal_cents INTEGER NOT NULL DEFAULT 0,
+            tax_cents INTEGER NOT NULL DEFAULT 0,
+            total_cents INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+
+
+def record_daily(cursor, subtotal_cents, tax_cents, total_cents, orders=1):
+    """Add to today's totals; the caller owns the transaction"""
+    cursor.execute('''
+        INSERT INTO daily_totals (day, order_count, subtotal_cents, tax_cents, total_cents)
+        VALUES (date('now', 'localtime'), ?, ?, ?, ?)
+        ON CONFLICT (day) DO UPDATE SET
+            order_count = order_count + excluded.order_count,
+            subtotal_cents = subtotal_cents + excluded.subtotal_cents,
+            tax_cents = tax_cents + excluded.tax_cents,
+            total_cents = total_cents + excluded.total_cents
+    ''', (orders, subtotal_cents, tax_cents, total_cents))
+
+
+def daily_totals(cursor, since, until):
+    """Net totals for local days in [since, until) as (orders, subtotal, tax, total)
+
+    A range scan of one row per day on the rollup's primary key.
+    """
+    cursor.execute('''
+        SELECT COALESCE(SUM(order_count), 0), COALESCE(SUM(subtotal_cents), 0),
+               COALESCE(SUM(tax_cents), 0), COALESCE(SUM(total_cents), 0)
+        FROM daily_totals
+        WHERE day >= ? AND day < ?
+    ''', (since, until))
+    orders, subtotal, tax, total = cursor.fetchone()
+    return orders, from_cents(subtotal), from_cents(tax), from_cents(total)
+
+
+def _item_key(item):
+    return repr(sorted(item.items()))
+
+
+def _subtract(items, removed):
+    """Items left after taking `removed` out; raises ValueError if one isn't there"""
+    wanted = Counter(_item_key(item) for item in removed)
+    remaining = []
+    for item in items:
+        key = _item_key(item)
+        if wanted[key]:
+            wanted[key] -= 1
+        else:
+            remaining.append(item)
+    if +wanted:
+        raise ValueError("Item is not on the order")
+    return remaining
+
+
+class OrderAdjuster:
+    """Voids, refunds and amendments that never rewrite an order"""
+
+    def __init__(self, cursor, tax_rate):
+        self.cursor = cursor
+        self.tax_rate = tax_rate
+
+    def net_order(self, order_id):
+        """The order as it stands after its adjustments, or None if there's no such order
+
+        Returns a dict with the current items, cent totals, and whether
+        it was voided.
+        """
+        self.cursor.execute('''
+            SELECT items, subtotal, tax, total, datetime(created_at, 'localtime'), customer_id, order_uuid
+            FROM orders WHERE id = ?
+        ''', (order_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        order = {
+            'order_id': order_id,
+            'items': parse_order_items(row[0]),
+            'subtotal_cents': to_cents(row[1]),
+            'tax_cents': to_cents(row[2]),
+            'total_cents': to_cents(row[3]),
+            'created_at': row[4],
+            'customer_id': row[5],
+            'order_uuid': row[6],
+            'voided': False
+        }
+        self.cursor.execute('''
+            SELECT kind, removed, added, subtotal_cents, tax_cents, total_cents
+            FROM order_adjustments WHERE order_id = ? ORDER BY id
+        ''', (order_id,))
+        for kind, removed, added, subtotal, tax, total in self.cursor.fetchall():
+            order['items'] = _subtract(order['items'], parse_order_items(removed)) + parse_order_items(added)
+            order['subtotal_cents'] += subtotal
+            order['tax_cents'] += tax
+            order['total_cents'] += total
+            order['voided'] = order['voided'] or kind == 'void'
+        return order
+
+    def adjust(self, order_id, kind, user_id, removed=(), added=(), reason=''):
+        """Write a compensating entry and add it to today's totals
+
+        A void removes everything; a refund removes `removed`; an amend
+        also adds `added`. Tax is recomputed on what remains so the net
+        always matches a fresh order of the same items. The caller owns
+        the transaction. Returns the net order before the change and the
+        (subtotal, tax, total) deltas as Decimals.
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown adjustment: {kind}")
+        order = self.net_order(order_id)
+        if order is None:
+            raise ValueError(f"No order #{order_id}")
+        if order['voided']:
+            raise ValueError(f"Order #{order_id} is already voided")
+
+        removed, added = list(removed), list(added) if kind == 'amend' else []
+        if kind == 'void':
+            removed = order['items']
+        elif not removed and not added:
+            raise ValueError("Nothing to change")
+        remaining = _subtract(order['items'], removed) + added
+
+        if kind == 'void':
+            subtotal, tax = -order['subtotal_cents'], -order['tax_cents']
+        else:
+            new_subtotal, new_tax, _ = cart_totals(remaining, self.tax_rate)
+            if new_subtotal < 0:
+                raise ValueError("The order can't be worth less than nothing; remove the reward too")
+            subtotal = to_cents(new_subtotal) - order['subtotal_cents']
+            tax = to_cents(new_tax) - order['tax_cents']
+        total = subtotal + tax
+        if kind == 'refund' and total > 0:
+            raise ValueError("A refund can't increase the order")
+
+        self.cursor.execute('''
+            INSERT INTO order_adjustments
+                (order_id, kind, user_id, removed, added, subtotal_cents, tax_cents, total_cents, reason)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (order_id, kind, user_id, str(removed), str(added), subtotal, tax, total, reason))
+        record_daily(self.cursor, subtotal, tax, total, orders=-1 if kind == 'void' else 0)
+        return order, (from_cents(subtotal), from_cents(tax), from_cents(total))
+
+    def history(self, order_id):
+        """Return (kind, local time, username, total delta, reason) for an order's adjustments"""
+        self.cursor.execute('''
+            SELECT a.kind, datetime(a.created_at, 'localtime'), u.username, a.total_cents, a.reason
+            FROM order_adjustments a
+            LEFT JOIN users u ON u.id = a.user_id
+            WHERE a.order_id = ? ORDER BY a.id
+        ''', (order_id,))
+        return [(kind, at, username, from_cents(total), reason)
+                for kind, at, username, total, reason in self.cursor.fetchall()]
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Order Archive for Bob's Pizza Emporium
+Monthly archive databases for old orders, attached on demand and queried together with the hot table
+
+Usage:
+    python archive.py [--source pizza_pos.db] --run
+    python archive.py [--source pizza_pos.db] --export orders.csv [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+"""
+
+import argparse
+import contextlib
+import csv
+import datetime
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+from order_search import item_names_from_text
+
+HOT_MONTHS = 3  # this month and the two before it stay in pizza_pos.db
+ARCHIVE_CHUNK_SIZE = 500
+ARCHIVE_PAUSE = 0.05  # seconds between chunks so the till can get the write lock
+
+# Tables moved along with their orders, and the column holding the order id
+ARCHIVED_TABLES = (
+    ('orders', 'id'),
+    ('payments', 'order_id'),
+    ('order_adjustments', 'order_id'),
+    ('order_tracking', 'order_id'),
+    ('order_status_history', 'order_id'),
+)
+
+
+def archive_directory(db_path):
+    """Folder the monthly archives of a database live in"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'archive')
+
+
+def archive_filename(month):
+    """File name for a 'YYYY-MM' month's archive"""
+    return f"orders_{month.replace('-', '_')}.db"
+
+
+def add_months(month, count):
+    """'YYYY-MM' `count` months after (or before) `month`"""
+    index = int(month[:4]) * 12 + int(month[5:7]) - 1 + count
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def cutoff_month(today=None, hot_months=HOT_MONTHS):
+    """Oldest month that stays in the hot database"""
+    today = today or datetime.date.today()
+    return add_months(today.strftime('%Y-%m'), 1 - hot_months)
+
+
+def init_archive_tables(cursor):
+    """Create the catalog of archived months"""
+    # Ids grow with time, so each month is (nearly) one id range
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_archives (
+            month TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            order_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def _columns(cursor, schema, table):
+    cursor.execute(f'PRAGMA {schema}.table_info({table})')
+    return {row[1]: row[2] for row in cursor.fetchall()}
+
+
+def _prepare_archive_table(cursor, table):
+    """Give the attached archive the table and indexes the hot database has"""
+    cursor.execute("SELECT type, sql FROM main.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL", (table,))
+    for kind, sql in cursor.fetchall():
+        if kind == 'table':
+            cursor.execute(re.sub(r'^CREATE TABLE ', 'CREATE TABLE IF NOT EXISTS archive.', sql))
+        elif kind == 'index':
+            cursor.execute(re.sub(r'^CREATE (UNIQUE )?INDEX ', r'CREATE \1INDEX IF NOT EXISTS archive.', sql))
+
+    # Columns added to the hot table after this archive was started
+    archived = _columns(cursor, 'archive', table)
+    for column, declared in _columns(cursor, 'main', table).items():
+        if column not in archived:
+            cursor.execute(f'ALTER TABLE archive.{table} ADD COLUMN {column} {declared}')
+
+
+def archive_chunk(conn, directory, cutoff=None, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """Move the next chunk of orders older than the hot window into their month's archive
+
+    Each chunk is one transaction across both databases, with the
+    order's payments, adjustments and status history moving with it.
+    Copies replace, so a chunk cut short after the archive committed is
+    simply moved again. Returns False when nothing is left to move.
+    """
+    cursor = conn.cursor()
+    cutoff = cutoff or cutoff_month()
+    cursor.execute('''
+        SELECT strftime('%Y-%m', created_at, 'localtime') FROM orders
+        WHERE created_at < datetime(?, 'utc')
+        ORDER BY created_at, id LIMIT 1
+    ''', (f"{cutoff}-01",))
+    row = cursor.fetchone()
+    if row is None:
+        return False
+    month = row[0]
+
+    cursor.execute('''
+        SELECT id FROM orders WHERE created_at < datetime(?, 'utc')
+        ORDER BY created_at, id LIMIT ?
+    ''', (f"{add_months(month, 1)}-01", chunk_size))
+    ids = [order_id for (order_id,) in cursor.fetchall()]
+
+    os.makedirs(directory, exist_ok=True)
+    cursor.execute('ATTACH DATABASE ? AS archive', (os.path.join(directory, archive_filename(month)),))
+    try:
+        cursor.execute("SELECT name FROM main.sqlite_master WHERE type = 'table'")
+        present = {name for (name,) in cursor.fetchall()}
+        tables = [(table, key) for table, key in ARCHIVED_TABLES if table in present]
+        for table, _ in tables:
+            _prepare_archive_table(cursor, table)
+
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+        cursor.execute('DELETE FROM temp.archive_batch')
+        cursor.executemany('INSERT INTO temp.archive_batch (id) VALUES (?)', [(order_id,) for order_id in ids])
+
+        if 'sync_outbox' in present:
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM sync_outbox')
+            outbox_mark = cursor.fetchone()[0]
+        for table, key in tables:
+            columns = ', '.join(_columns(cursor, 'main', table))
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table} WHERE {key} IN (SELECT id FROM temp.archive_batch)
+            ''')
+            cursor.execute(f'DELETE FROM main.{table} WHERE {key} IN (SELECT id FROM temp.archive_batch)')
+        if 'sync_outbox' in present:
+            # Archived orders still exist; don't tell the central database they were deleted
+            cursor.execute('''
+                DELETE FROM sync_outbox WHERE id > ? AND table_name = 'orders' AND op = 'delete'
+            ''', (outbox_mark,))
+
+        cursor.execute('''
+            INSERT INTO order_archives (month, filename, first_id, last_id, order_count)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (month) DO UPDATE SET
+                first_id = MIN(first_id, excluded.first_id),
+                last_id = MAX(last_id, excluded.last_id),
+                order_count = order_count + excluded.order_count
+        ''', (month, archive_filename(month), min(ids), max(ids), len(ids)))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute('DETACH DATABASE archive')
+    return True
+
+
+class OrderArchive:
+    """Queries over the hot orders table and the monthly archives as one
+
+    Archives are attached one at a time for as long as a query needs
+    them, so there is no limit on how many months can be kept. Call with
+    no transaction open; SQLite can't attach inside one.
+    """
+
+    def __init__(self, conn, directory):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.directory = directory
+
+    def partitions(self, since=None, until=None, low_id=None, high_id=None):
+        """Archived months that could hold orders in the given range, newest first
+
+        `since`/`until` are 'YYYY-MM-DD' dates and `low_id`/`high_id`
+        order ids; months outside them are never opened. Returns
+        (month, filename, first_id, last_id) rows.
+        """
+        conditions = []
+        params = []
+        if since:
+            # Months are local; a range starting on the 1st can reach the previous month in UTC
+            conditions.append('month >= ?')
+            params.append(add_months(since[:7], -1) if since[8:10] == '01' else since[:7])
+        if until:
+            conditions.append('month <= ?')
+            params.append(until[:7])
+        if low_id is not None:
+            conditions.append('last_id >= ?')
+            params.append(low_id)
+        if high_id is not None:
+            conditions.append('first_id <= ?')
+            params.append(high_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        self.cursor.execute(f'''
+            SELECT month, filename, first_id, last_id FROM order_archives
+            {where}
+            ORDER BY last_id DESC
+        ''', params)
+        return self.cursor.fetchall()
+
+    @contextlib.contextmanager
+    def attached(self, filename):
+        """Attach one archive as `archive` for the duration of a block"""
+        path = os.path.join(self.directory, filename)
+        if not os.path.exists(path):
+            raise sqlite3.OperationalError(f"Order archive {path} is missing")
+        self.cursor.execute('ATTACH DATABASE ? AS archive', (path,))
+        try:
+            yield 'archive'
+        finally:
+            self.cursor.execute('DETACH DATABASE archive')
+
+    def scan(self, sql, params=(), limit=None, since=None, until=None, low_id=None, high_id=None):
+        """Run an orders query over the hot table and each archive that could match
+
+        `{orders}` in `sql` names each partition's orders table in turn.
+        Rows must start with the order id; they come back newest first.
+        With `limit` the SQL ends in LIMIT ?, and older months are only
+        opened while they could still hold one of the newest `limit` rows.
+        """
+        def run(table):
+            self.cursor.execute(sql.format(orders=table),
+                                list(params) + ([limit] if limit is not None else []))
+            return self.cursor.fetchall()
+
+        rows = run('main.orders')
+        for month, filename, first_id, last_id in self.partitions(since, until, low_id, high_id):
+            if limit is not None and len(rows) >= limit and last_id < rows[limit - 1][0]:
+                break
+            with self.attached(filename) as schema:
+                rows += run(f'{schema}.orders')
+            rows.sort(key=lambda row: row[0], reverse=True)
+        return rows[:limit] if limit is not None else rows
+
+
+def export_orders(archive, out, since=None, until=None):
+    """Write orders placed in [since, until) as CSV; returns the number written"""
+    conditions = []
+    params = []
+    if since:
+        conditions.append("o.created_at >= datetime(?, 'utc')")
+        params.append(since)
+    if until:
+        conditions.append("o.created_at < datetime(?, 'utc')")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    rows = archive.scan(f'''
+        SELECT o.id, datetime(o.created_at, 'localtime'), u.username, o.subtotal, o.tax, o.total, o.items
+        FROM {{orders}} o
+        LEFT JOIN users u ON u.id = o.user_id
+        {where}
+        ORDER BY o.id DESC
+    ''', params, since=since, until=until)
+    writer = csv.writer(out)
+    writer.writerow(['order_id', 'created_at', 'staff', 'subtotal', 'tax', 'total', 'items'])
+    for row in reversed(rows):
+        writer.writerow(row[:6] + (item_names_from_text(row[6]),))
+    return len(rows)
+
+
+class ArchiveWorker:
+    """Moves old orders into the monthly archives on a background thread"""
+
+    def __init__(self, db_path, directory=None, chunk_size=ARCHIVE_CHUNK_SIZE, pause=ARCHIVE_PAUSE):
+        self.db_path = db_path
+        self.directory = directory or archive_directory(db_path)
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.error = None
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='order-archive', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop after the current chunk"""
+        self._stop.set()
+        self.thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            while not self._stop.is_set():
+                if not archive_chunk(conn, self.directory, chunk_size=self.chunk_size):
+                    return
+                self._stop.wait(self.pause)
+        except (sqlite3.Error, OSError) as e:
+            # Nothing is lost; the next start carries on from the oldest hot order
+            self.error = e
+        finally:
+            conn.close()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Archive old orders or export orders across archives")
+    parser.add_argument('--source', default='pizza_pos.db', help="Path to the store's database")
+    parser.add_argument('--run', action='store_true', help="Archive every order older than the hot window now")
+    parser.add_argument('--export', metavar='CSV', help="Write orders to a CSV file")
+    parser.add_argument('--since', help="First day to export (YYYY-MM-DD)")
+    parser.add_argument('--until', help="Day after the last one to export (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.source)
+    try:
+        init_archive_tables(conn.cursor())
+        conn.commit()
+        directory = archive_directory(args.source)
+        if args.run:
+            chunks = 0
+            while archive_chunk(conn, directory):
+                chunks += 1
+            print(f"Archived {chunks} chunk(s) into {directory}")
+        if args.export:
+            with open(args.export, 'w', newline='') as out:
+                count = export_orders(OrderArchive(conn, directory), out, args.since, args.until)
+            print(f"Exported {count} order(s) to {args.export}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Audit Log for Bob's Pizza Emporium
+Append-only record of admin actions, voids and price changes with paged, indexed browsing
+"""
+
+import json
+
+PAGE_SIZE = 100
+
+# Stored as the code; only ever append
+ACTIONS = {
+    1: 'user added',
+    2: 'user edited',
+    3: 'user deleted',
+    4: 'PIN reset',
+    5: 'order voided',
+    6: 'price changed',
+    7: 'order refunded',
+    8: 'order amended',
+}
+ACTION_CODES = {name: code for code, name in ACTIONS.items()}
+
+
+def init_audit_tables(cursor):
+    """Create the audit log and its time and actor indexes"""
+    # Integer epoch seconds, action codes and short JSON keep rows small
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS audit_log (
+            id INTEGER PRIMARY KEY,
+            at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            actor_id INTEGER,
+            action INTEGER NOT NULL,
+            target_id INTEGER,
+            detail TEXT
+        )
+    ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_at ON audit_log (at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_actor ON audit_log (actor_id, at, id)')
+
+    for action in ('UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS audit_log_no_{action.lower()}
+            BEFORE {action} ON audit_log
+            BEGIN
+                SELECT RAISE(ABORT, 'audit log is append-only');
+            END
+        ''')
+
+
+def record(cursor, actor_id, action, target_id=None, **detail):
+    """Append an audit entry; the caller owns the transaction
+
+    Write it before committing the change it describes, so the two
+    land or roll back together.
+    """
+    cursor.execute('''
+        INSERT INTO audit_log (actor_id, action, target_id, detail) VALUES (?, ?, ?, ?)
+    ''', (actor_id, ACTION_CODES[action], target_id,
+          json.dumps(detail, separators=(',', ':'), default=str) if detail else None))
+
+
+def describe(detail):
+    """One-line text for an entry's detail"""
+    if not detail:
+        return ''
+    return ', '.join(f"{key}={value}" for key, value in json.loads(detail).items())
+
+
+class AuditLog:
+    """Newest-first keyset pages over the audit log"""
+
+    def __init__(self, cursor, page_size=PAGE_SIZE):
+        self.cursor = cursor
+        self.page_size = page_size
+
+    def page(self, actor_id=None, since=None, until=None, after=None):
+        """Return the next page of (id, local time, actor, action, target, detail, epoch) rows
+
+        `since`/`until` are local 'YYYY-MM-DD' dates (until exclusive)
+        and `after` is the last row of the previous page. Every page is
+        one seek into the (at, id) or (actor_id, at, id) index, however
+        far back it is.
+        """
+        conditions = []
+        params = []
+        if actor_id is not None:
+            conditions.append('a.actor_id = ?')
+            params.append(actor_id)
+        if since:
+            conditions.append("a.at >= CAST(strftime('%s', ?, 'utc') AS INTEGER)")
+            params.append(since)
+        if until:
+            conditions.append("a.at < CAST(strftime('%s', ?, 'utc') AS INTEGER)")
+            params.append(until)
+        if after is not None:
+            # Spelled out rather than as a row value so the index can seek to `after`
+            conditions.append('a.at <= ? AND (a.at < ? OR a.id < ?)')
+            params += [after[-1], after[-1], after[0]]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        self.cursor.execute(f'''
+            SELECT a.id, datetime(a.at, 'unixepoch', 'localtime'), u.username,
+                   a.action, a.target_id, a.detail, a.at
+            FROM audit_log a
+            LEFT JOIN users u ON u.id = a.actor_id
+            {where}
+            ORDER BY a.at DESC, a.id DESC
+            LIMIT ?
+        ''', params + [self.page_size])
+        return [(entry_id, at, actor, ACTIONS.get(action, str(action)), target_id, describe(detail), epoch)
+                for entry_id, at, actor, action, target_id, detail, epoch in self.cursor.fetchall()]
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Backups for Bob's Pizza Emporium
+Online backups in small page steps, checksummed and rotated, with point-in-time restore from the order journal
+
+Usage:
+    python backup.py [--source pizza_pos.db] --backup
+    python backup.py [--source pizza_pos.db] --list | --verify
+    python backup.py [--source pizza_pos.db] --restore [--to "YYYY-MM-DD HH:MM"] [--journal OTHER.db]
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+
+from order_search import item_names_from_text
+
+BACKUP_PAGES = 256     # pages copied per step; the database is only locked during a step
+BACKUP_SLEEP = 0.05    # seconds between steps so the till can write
+KEEP_BACKUPS = 48
+BACKUP_INTERVAL_MS = 60 * 60 * 1000
+
+# Columns written to the order journal for each journaled table
+JOURNALED_COLUMNS = {
+    'orders': ('id', 'order_uuid', 'user_id', 'customer_id', 'items', 'subtotal', 'tax', 'total',
+               'total_cents', 'created_at'),
+    'payments': ('id', 'order_id', 'tender', 'amount_cents', 'tendered_cents', 'change_cents',
+                 'auth_code', 'created_at'),
+    'order_adjustments': ('id', 'order_id', 'kind', 'user_id', 'removed', 'added', 'subtotal_cents',
+                          'tax_cents', 'total_cents', 'reason', 'created_at'),
+}
+
+
+def backup_directory(db_path):
+    """Folder the backups of a database live in"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'backups')
+
+
+def utc_timestamp(text=None):
+    """UTC 'YYYY-MM-DD HH:MM:SS' for a local time string, or for now"""
+    moment = datetime.datetime.fromisoformat(text) if text else datetime.datetime.now()
+    return moment.astimezone(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def init_journal_tables(cursor):
+    """Create the order journal and the triggers that append to it
+
+    Run after migrations, once the journaled columns exist. Tables
+    this database doesn't have are skipped.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            table_name TEXT NOT NULL,
+            payload TEXT NOT NULL
+        )
+    ''')
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    present = {name for (name,) in cursor.fetchall()}
+    for table, columns in JOURNALED_COLUMNS.items():
+        if table not in present:
+            continue
+        payload = 'json_object({})'.format(', '.join(f"'{column}', NEW.{column}" for column in columns))
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS journal_{table}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO order_journal (table_name, payload) VALUES ('{table}', {payload});
+            END
+        ''')
+
+
+def file_checksum(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _journal_position(conn):
+    try:
+        return conn.execute('SELECT COALESCE(MAX(id), 0) FROM order_journal').fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def list_backups(directory):
+    """Manifests of the backups in a folder, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as f:
+                manifest = json.load(f)
+            manifest['path'] = os.path.join(directory, manifest['file'])
+            manifests.append(manifest)
+    return sorted(manifests, key=lambda manifest: manifest['taken_at'])
+
+
+def verify_backup(manifest):
+    """Check a backup against its recorded checksum and SQLite's own consistency check"""
+    if not os.path.exists(manifest['path']) or file_checksum(manifest['path']) != manifest['sha256']:
+        return False
+    conn = sqlite3.connect(manifest['path'])
+    try:
+        return conn.execute('PRAGMA quick_check').fetchone()[0] == 'ok'
+    except sqlite3.DatabaseError:
+        return False
+    finally:
+        conn.close()
+
+
+def backup_database(source, directory, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP, keep=KEEP_BACKUPS):
+    """Copy a live database into `directory` with the SQLite backup API
+
+    Pages are copied `pages` at a time with a pause between steps, so
+    writers wait at most one step. Writes from other connections
+    restart the copy, so the result is always one consistent snapshot.
+    The copy is checked, checksummed and given a manifest before it
+    counts, then older backups beyond `keep` are removed. Returns the
+    manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    taken = datetime.datetime.now(datetime.timezone.utc)
+    name = f"pizza_pos-{taken:%Y%m%d-%H%M%S-%f}.db"
+    partial = os.path.join(directory, name + '.partial')
+    target = sqlite3.connect(partial)
+    try:
+        source.backup(target, pages=pages, sleep=sleep)
+        if target.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+            raise sqlite3.DatabaseError("Backup copy failed its consistency check")
+        journal_id = _journal_position(target)
+    finally:
+        target.close()
+
+    manifest = {
+        'file': name,
+        'taken_at': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'journal_id': journal_id,
+        'size': os.path.getsize(partial),
+        'sha256': file_checksum(partial),
+    }
+    os.replace(partial, os.path.join(directory, name))
+    with open(os.path.join(directory, name[:-3] + '.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    rotate_backups(directory, keep)
+    manifest['path'] = os.path.join(directory, name)
+    return manifest
+
+
+def rotate_backups(directory, keep=KEEP_BACKUPS):
+    """Remove all but the newest `keep` backups; returns the manifests removed"""
+    manifests = list_backups(directory)
+    removed = manifests[:-keep] if keep else manifests
+    for manifest in removed:
+        for path in (manifest['path'], manifest['path'][:-3] + '.json'):
+            if os.path.exists(path):
+                os.remove(path)
+    return removed
+
+
+def prune_journal(conn, directory):
+    """Drop journal entries every kept backup already contains; returns rows removed"""
+    manifests = list_backups(directory)
+    if not manifests:
+        return 0
+    through = manifests[0]['journal_id']
+    cursor = conn.execute('DELETE FROM order_journal WHERE id <= ?', (through,))
+    conn.commit()
+    return cursor.rowcount
+
+
+def replay_journal(target, source, after_id, until):
+    """Apply journal entries in (after_id, until] from `source` to `target`
+
+    Rows are inserted only if missing, so replaying over a newer copy is
+    harmless. Replayed orders and adjustments are added to the daily
+    totals, and orders to the search index, where those exist. Returns
+    the number of orders replayed.
+    """
+    rows = source.execute('''
+        SELECT table_name, payload FROM order_journal
+        WHERE id > ? AND at <= ?
+        ORDER BY id
+    ''', (after_id, until)).fetchall()
+    tables = {name for (name,) in target.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    replayed = {table: [] for table in JOURNALED_COLUMNS}
+    for table, payload in rows:
+        if table not in tables:
+            continue
+        values = json.loads(payload)
+        columns = ', '.join(values)
+        placeholders = ', '.join('?' * len(values))
+        cursor = target.execute(f'INSERT OR IGNORE INTO {table} ({columns}) VALUES ({placeholders})',
+                                list(values.values()))
+        if cursor.rowcount:
+            replayed[table].append(values['id'])
+
+    target.execute('CREATE TEMP TABLE IF NOT EXISTS replayed (id INTEGER PRIMARY KEY)')
+    if 'daily_totals' in tables:
+        # Each day gets what the till added at the time: orders, then adjustment deltas
+        rollups = (
+            ('orders', "COUNT(*), CAST(ROUND(SUM(subtotal) * 100) AS INTEGER), "
+                       "CAST(ROUND(SUM(tax) * 100) AS INTEGER), CAST(ROUND(SUM(total) * 100) AS INTEGER)"),
+            ('order_adjustments', "-SUM(kind = 'void'), SUM(subtotal_cents), SUM(tax_cents), SUM(total_cents)"),
+        )
+        for table, sums in rollups:
+            if not replayed[table]:
+                continue
+            target.execute('DELETE FROM temp.replayed')
+            target.executemany('INSERT INTO temp.replayed (id) VALUES (?)', [(row_id,) for row_id in replayed[table]])
+            target.execute(f'''
+                INSERT INTO daily_totals (day, order_count, subtotal_cents, tax_cents, total_cents)
+                SELECT date(created_at, 'localtime'), {sums}
+                FROM {table} WHERE id IN (SELECT id FROM temp.replayed)
+                GROUP BY 1
+                ON CONFLICT (day) DO UPDATE SET
+                    order_count = order_count + excluded.order_count,
+                    subtotal_cents = subtotal_cents + excluded.subtotal_cents,
+                    tax_cents = tax_cents + excluded.tax_cents,
+                    total_cents = total_cents + excluded.total_cents
+            ''')
+    if 'order_search' in tables and replayed['orders']:
+        target.execute('DELETE FROM temp.replayed')
+        target.executemany('INSERT INTO temp.replayed (id) VALUES (?)', [(row_id,) for row_id in replayed['orders']])
+        target.create_function('item_names', 1, item_names_from_text)
+        target.execute('''
+            INSERT INTO order_search (rowid, items, staff)
+            SELECT o.id, item_names(o.items), COALESCE(u.username, '')
+            FROM orders o
+            LEFT JOIN users u ON u.id = o.user_id
+            WHERE o.id IN (SELECT id FROM temp.replayed)
+        ''')
+    target.commit()
+    return len(replayed['orders'])
+
+
+def restore_database(db_path, directory, until=None, journal_path=None):
+    """Replace a database with its newest good backup, rolled forward to `until`
+
+    `until` is a UTC 'YYYY-MM-DD HH:MM:SS' (default: now). The newest
+    backup taken by then that passes verification is copied, then the
+    order journal from `journal_path` (default: the database being
+    replaced) replays orders placed after the backup up to `until`.
+    The replaced database is kept beside it. Returns (manifest, orders
+    replayed, path of the replaced database).
+    """
+    until = until or utc_timestamp()
+    candidates = [manifest for manifest in list_backups(directory) if manifest['taken_at'] <= until]
+    manifest = next((manifest for manifest in reversed(candidates) if verify_backup(manifest)), None)
+    if manifest is None:
+        raise FileNotFoundError(f"No good backup taken by {until} in {directory}")
+
+    restoring = db_path + '.restoring'
+    shutil.copyfile(manifest['path'], restoring)
+    journal_path = journal_path or db_path
+    replayed = 0
+    target = sqlite3.connect(restoring)
+    try:
+        if os.path.exists(journal_path):
+            source = sqlite3.connect(journal_path)
+            try:
+                replayed = replay_journal(target, source, manifest['journal_id'], until)
+            finally:
+                source.close()
+    finally:
+        target.close()
+
+    replaced = None
+    if os.path.exists(db_path):
+        replaced = f"{db_path}.before-restore-{datetime.datetime.now():%Y%m%d-%H%M%S}"
+        os.replace(db_path, replaced)
+    os.replace(restoring, db_path)
+    return manifest, replayed, replaced
+
+
+class BackupWorker:
+    """Takes one backup on a background thread with its own connection"""
+
+    def __init__(self, db_path, directory=None, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP, keep=KEEP_BACKUPS):
+        self.db_path = db_path
+        self.directory = directory or backup_directory(db_path)
+        self.pages = pages
+        self.sleep = sleep
+        self.keep = keep
+        self.manifest = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='backup', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def running(self):
+        return self.thread.is_alive()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            self.manifest = backup_database(conn, self.directory, self.pages, self.sleep, self.keep)
+            prune_journal(conn, self.directory)
+        except (sqlite3.Error, OSError) as e:
+            # The next scheduled backup tries again
+            self.error = e
+        finally:
+            conn.close()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Back up, verify or restore the point of sale database")
+    parser.add_argument('--source', default='pizza_pos.db', help="Path to the store's database")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument('--backup', action='store_true', help="Take a backup now")
+    action.add_argument('--list', action='store_true', help="List backups")
+    action.add_argument('--verify', action='store_true', help="Check every backup's checksum")
+    action.add_argument('--restore', action='store_true', help="Restore the database (close the till first)")
+    parser.add_argument('--to', help="Local time to restore to, 'YYYY-MM-DD HH:MM[:SS]' (default: now)")
+    parser.add_argument('--journal', help="Database to replay the order journal from (default: --source)")
+    args = parser.parse_args(argv)
+    directory = backup_directory(args.source)
+
+    if args.backup:
+        conn = sqlite3.connect(args.source)
+        try:
+            manifest = backup_database(conn, directory)
+            prune_journal(conn, directory)
+        finally:
+            conn.close()
+        print(f"Backed up to {manifest['path']} ({manifest['size']} bytes)")
+    elif args.list or args.verify:
+        failed = 0
+        for manifest in list_backups(directory):
+            status = ''
+            if args.verify:
+                good = verify_backup(manifest)
+                failed += not good
+                status = '  ok' if good else '  FAILED'
+            print(f"{manifest['taken_at']} UTC  {manifest['file']}  {manifest['size']} bytes{status}")
+        return 1 if failed else 0
+    else:
+        manifest, replayed, replaced = restore_database(args.source, directory,
+                                                        utc_timestamp(args.to) if args.to else None,
+                                                        args.journal)
+        print(f"Restored {manifest['file']} and replayed {replayed} order(s)")
+        if replaced:
+            print(f"Previous database kept as {replaced}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Customer Profiles for Bob's Pizza Emporium
+Customers keyed by a normalized phone number, with their recent orders for call-in reorders
+"""
+
+from decimal import Decimal
+
+from orders import parse_order_items, query_orders
+
+RECENT_ORDERS = 5
+
+
+def init_customer_tables(cursor):
+    """Create the customers table"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL DEFAULT '',
+            address TEXT NOT NULL DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def normalize_phone(text):
+    """Digits of a phone number without the North American country code
+
+    '(555) 123-4567', '555.123.4567' and '+1 555 123 4567' all become
+    '5551234567', so however the number is typed it hits the same
+    index entry. Raises ValueError if it is too short to be a number.
+    """
+    digits = ''.join(ch for ch in text if ch.isdigit())
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    if len(digits) < 7:
+        raise ValueError(f"Not a phone number: {text!r}")
+    return digits
+
+
+def format_phone(phone):
+    """Display form of a normalized phone number"""
+    if len(phone) == 10:
+        return f"({phone[:3]}) {phone[3:6]}-{phone[6:]}"
+    if len(phone) == 7:
+        return f"{phone[:3]}-{phone[3:]}"
+    return phone
+
+
+class CustomerDirectory:
+    """Phone lookups, profile upserts and recent orders for customers"""
+
+    def __init__(self, cursor, archive=None):
+        self.cursor = cursor
+        self.archive = archive
+
+    def find_by_phone(self, phone):
+        """Return the customer for a phone number as a dict, or None"""
+        self.cursor.execute('SELECT id, phone, name, address FROM customers WHERE phone = ?',
+                            (normalize_phone(phone),))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'phone': row[1], 'name': row[2], 'address': row[3]}
+
+    def save(self, phone, name, address):
+        """Create or update the profile for a phone number and return its id"""
+        phone = normalize_phone(phone)
+        self.cursor.execute('''
+            INSERT INTO customers (phone, name, address) VALUES (?, ?, ?)
+            ON CONFLICT (phone) DO UPDATE SET
+                name = excluded.name,
+                address = excluded.address,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (phone, name.strip(), address.strip()))
+        self.cursor.execute('SELECT id FROM customers WHERE phone = ?', (phone,))
+        return self.cursor.fetchone()[0]
+
+    def recent_orders(self, customer_id, limit=RECENT_ORDERS):
+        """Return the customer's latest orders, newest first
+
+        Each is (order id, local time, total, cart items). Walks the
+        (customer_id, id) index backwards, so it reads only `limit` rows
+        however long the customer's history is. Archived months are only
+        opened if the hot table has fewer than `limit` of them.
+        """
+        rows = query_orders(self.cursor, self.archive, '''
+            SELECT id, datetime(created_at, 'localtime'), total, items FROM {orders}
+            WHERE customer_id = ?
+            ORDER BY id DESC
+            LIMIT ?
+        ''', (customer_id,), limit)
+        return [(order_id, created_at, Decimal(str(total)), parse_order_items(items))
+                for order_id, created_at, total, items in rows]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Fast Entry for Bob's Pizza Emporium
+PLU codes, a prefix trie over the menu and barcode scanner input
+"""
+
+import re
+from collections import namedtuple
+
+SIZE_CODES = {'S': 'small', 'M': 'medium', 'L': 'large'}
+DRINK_PREFIX = 'D'
+
+# A scanner "types" a whole code faster than this between keys
+SCAN_MAX_KEY_GAP_MS = 50
+SCAN_MIN_LENGTH = 2
+
+MenuEntry = namedtuple('MenuEntry', 'code label kind name size price')
+
+# "3*M2", "3xM2" or just "M2"
+_ENTRY = re.compile(r'^(?:(\d+)\s*[*xX])?\s*(.+)$')
+
+
+def build_menu_entries(standard_pizzas, pizza_prices, drink_prices):
+    """Number the menu into PLU codes: M2 = medium pizza #2, D1 = drink #1"""
+    entries = []
+    for number, (pizza_name, _) in enumerate(standard_pizzas, 1):
+        for size_code, size in SIZE_CODES.items():
+            entries.append(MenuEntry(f"{size_code}{number}", f"{size.title()} {pizza_name}",
+                                     'pizza', pizza_name, size, pizza_prices[size]))
+    for number, (drink, price) in enumerate(drink_prices.items(), 1):
+        entries.append(MenuEntry(f"{DRINK_PREFIX}{number}", drink, 'drink', drink, None, price))
+    return entries
+
+
+class _TrieNode:
+    __slots__ = ('children', 'entries')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = []
+
+
+class MenuTrie:
+    """Prefix trie over PLU codes and item names
+
+    Every entry is reachable by its code ("m2"), its label ("medium
+    pepperoni") and its name then size ("pepperoni medium"), all
+    case-insensitive.
+    """
+
+    def __init__(self, entries=()):
+        self.root = _TrieNode()
+        self.codes = {}
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        self.codes[entry.code.lower()] = entry
+        keys = {entry.code, entry.label, f"{entry.name} {entry.size or ''}"}
+        for key in keys:
+            node = self.root
+            for char in key.lower().strip():
+                node = node.children.setdefault(char, _TrieNode())
+            node.entries.append(entry)
+
+    def exact(self, code):
+        """Entry for a PLU code, or None"""
+        return self.codes.get(code.strip().lower())
+
+    def complete(self, prefix, limit=8):
+        """Entries whose code or name starts with `prefix`, shortest keys first"""
+        node = self.root
+        for char in prefix.lower():
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        results = []
+        seen = set()
+        level = [node]
+        # Breadth-first so "m2" itself beats longer keys below it
+        while level and len(results) < limit:
+            next_level = []
+            for current in level:
+                for entry in current.entries:
+                    if entry.code not in seen:
+                        seen.add(entry.code)
+                        results.append(entry)
+                next_level.extend(current.children[char] for char in sorted(current.children))
+            level = next_level
+        return results[:limit]
+
+    def resolve(self, text):
+        """Resolve one typed token to an entry: exact code first, then a unique completion"""
+        entry = self.exact(text)
+        if entry:
+            return entry
+        matches = self.complete(text, limit=2)
+        return matches[0] if len(matches) == 1 else None
+
+
+def parse_entry(text, trie):
+    """Parse a fast-entry line such as "2*M2 L3 D1" into (quantity, entry) pairs
+
+    Raises ValueError naming the first token that doesn't resolve.
+    """
+    lines = []
+    for token in text.split():
+        match = _ENTRY.match(token)
+        quantity = int(match.group(1) or 1)
+        entry = trie.resolve(match.group(2))
+        if entry is None or quantity < 1:
+            raise ValueError(f"Unknown item code: {token}")
+        lines.append((quantity, entry))
+    return lines
+
+
+class ScanDetector:
+    """Recognises barcode scanner bursts among ordinary key presses
+
+    Keyboard-wedge scanners type the code and press Enter far faster
+    than a person can, so a fast burst ending in Return is a scan.
+    """
+
+    def __init__(self, max_gap_ms=SCAN_MAX_KEY_GAP_MS, min_length=SCAN_MIN_LENGTH):
+        self.max_gap_ms = max_gap_ms
+        self.min_length = min_length
+        self.buffer = []
+        self.last_time = None
+
+    def feed(self, char, time_ms):
+        """Feed one key press; returns the scanned code when a scan completes"""
+        if self.last_time is not None and time_ms - self.last_time > self.max_gap_ms:
+            self.buffer = []
+        self.last_time = time_ms
+
+        if char in ('\r', '\n'):
+            code = ''.join(self.buffer)
+            self.buffer = []
+            return code if len(code) >= self.min_length else None
+        if char and char.isprintable():
+            self.buffer.append(char)
+        return None
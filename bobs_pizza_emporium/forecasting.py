@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Demand Forecasting for Bob's Pizza Emporium
+Hourly item sales rollups and a seasonal forecast for prep planning
+"""
+
+import datetime
+import math
+from array import array
+from collections import Counter
+
+from order_search import item_names_from_text
+
+HOURS_PER_WEEK = 7 * 24
+
+# How many past weeks feed the forecast, and how fast older weeks fade
+HISTORY_WEEKS = 8
+WEEKLY_DECAY = 0.8
+
+
+def item_key(name):
+    """Menu item a cart line belongs to, e.g. 'Hawaiian (Large)' -> 'Hawaiian'"""
+    return name.split(' (')[0]
+
+
+def init_forecast_tables(cursor):
+    """Create the hourly sales rollup and backfill it from existing orders"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS item_sales_hourly (
+            hour TEXT NOT NULL,
+            item TEXT NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, item)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('SELECT COUNT(*) FROM item_sales_hourly')
+    if cursor.fetchone()[0]:
+        return
+
+    # One pass over order history; afterwards process_order keeps it current
+    totals = Counter()
+    cursor.execute('''
+        SELECT strftime('%Y-%m-%d %H:00', created_at, 'localtime'), items FROM orders
+    ''')
+    for hour, items in cursor.fetchall():
+        for name in item_names_from_text(items).split(' | '):
+            if name:
+                totals[(hour, item_key(name))] += 1
+    cursor.executemany('''
+        INSERT INTO item_sales_hourly (hour, item, quantity) VALUES (?, ?, ?)
+    ''', [(hour, item, quantity) for (hour, item), quantity in totals.items()])
+
+
+def record_sales(cursor, cart, sign=1, hour=None):
+    """Add a cart to an hour's rollup; the caller owns the transaction
+
+    Defaults to the current hour. Voids and refunds pass sign=-1 and the
+    order's own local hour ('YYYY-MM-DD HH:MM...') to take items back out.
+    """
+    # Rewards are discounts, not something the kitchen makes
+    quantities = Counter(item_key(item['name']) for item in cart if item['type'] != 'reward')
+    hour = hour[:13] + ':00' if hour else None
+    cursor.executemany('''
+        INSERT INTO item_sales_hourly (hour, item, quantity)
+        VALUES (COALESCE(?, strftime('%Y-%m-%d %H:00', 'now', 'localtime')), ?, ?)
+        ON CONFLICT (hour, item) DO UPDATE SET quantity = quantity + excluded.quantity
+    ''', [(hour, item, sign * quantity) for item, quantity in quantities.items()])
+
+
+class DemandForecaster:
+    """Seasonal (hour-of-week) demand forecast from the sales rollup
+
+    Each hour of the week is forecast as an exponentially weighted
+    average of the same hour in recent weeks, so last Friday's rush
+    counts more than one from two months ago.
+    """
+
+    def __init__(self, cursor, weeks=HISTORY_WEEKS, decay=WEEKLY_DECAY):
+        self.cursor = cursor
+        self.weeks = weeks
+        self.decay = decay
+
+    def weekly_profiles(self, as_of):
+        """Return {item: array of 168 expected quantities} using weeks before `as_of`"""
+        start = as_of - datetime.timedelta(weeks=self.weeks)
+        self.cursor.execute('''
+            SELECT hour, item, quantity FROM item_sales_hourly
+            WHERE hour >= ? AND hour < ?
+        ''', (start.strftime('%Y-%m-%d %H:00'), as_of.strftime('%Y-%m-%d %H:00')))
+
+        weights = [self.decay ** age for age in range(self.weeks)]
+        profiles = {}
+        slots = {}
+        ages = set()
+        for hour, item, quantity in self.cursor.fetchall():
+            # Cache slot/age per hour; every item sold in that hour shares them
+            if hour not in slots:
+                moment = datetime.datetime.strptime(hour, '%Y-%m-%d %H:%M')
+                age = min((as_of - moment).days // 7, self.weeks - 1)
+                ages.add(age)
+                slots[hour] = (moment.weekday() * 24 + moment.hour, weights[age])
+            slot, weight = slots[hour]
+            profile = profiles.get(item)
+            if profile is None:
+                profile = profiles[item] = array('d', bytes(8 * HOURS_PER_WEEK))
+            profile[slot] += quantity * weight
+
+        # Average over the weeks that have sales, so a new store isn't under-forecast
+        total_weight = sum(weights[age] for age in ages)
+        for profile in profiles.values():
+            for slot in range(HOURS_PER_WEEK):
+                profile[slot] /= total_weight
+        return profiles
+
+    def forecast_day(self, day):
+        """Return {item: [24 hourly quantities]} expected on `day`"""
+        midnight = datetime.datetime.combine(day, datetime.time())
+        # Only use complete history: never peek at the day being forecast
+        as_of = min(midnight, datetime.datetime.now().replace(minute=0, second=0, microsecond=0))
+        offset = day.weekday() * 24
+        return {item: list(profile[offset:offset + 24])
+                for item, profile in self.weekly_profiles(as_of).items()}
+
+    def prep_plan(self, day, recipes):
+        """Forecast a day and convert it to item and ingredient prep quantities
+
+        Returns (hourly forecast, item totals, ingredient totals) with
+        totals rounded up to whole portions.
+        """
+        hourly = self.forecast_day(day)
+        item_totals = {item: math.ceil(sum(hours)) for item, hours in hourly.items()}
+        ingredients = Counter()
+        for item, quantity in item_totals.items():
+            for ingredient, per_item in recipes.get(item, {}).items():
+                ingredients[ingredient] += per_item * quantity
+        return hourly, item_totals, dict(ingredients)
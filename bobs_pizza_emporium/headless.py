@@ -0,0 +1,630 @@
+#!/usr/bin/env python3
+"""
+Headless Tk for Bob's Pizza Emporium
+A widget backend that keeps everything in memory, so the till's screens can be driven in tests
+without a display, on a throwaway database
+"""
+
+import contextlib
+import os
+import tempfile
+import tkinter
+import types
+from unittest import mock
+
+import pizza_pos_app
+from payments import CARD_PROCESSOR_SETTING_ENV
+from receipts import PRINTER_SETTING_ENV
+
+END = 'end'
+TclError = tkinter.TclError
+
+
+class Widget:
+    """A widget that remembers its options, children and bindings instead of drawing
+
+    Using a widget after it has been destroyed raises TclError, as Tk does.
+    """
+
+    def __init__(self, master=None, **options):
+        self.master = master
+        self.root = master.root if master is not None else self
+        self.options = options
+        self.children = []
+        self.bindings = {}
+        self.destroyed = False
+        if master is not None:
+            master.children.append(self)
+
+    def _check(self):
+        if self.destroyed:
+            raise TclError(f'invalid command name "{self!r}"')
+
+    def config(self, **options):
+        self._check()
+        if not options:
+            return dict(self.options)
+        self.options.update(options)
+
+    configure = config
+
+    def cget(self, key):
+        self._check()
+        return self.options.get(key, '')
+
+    __getitem__ = cget
+
+    def __setitem__(self, key, value):
+        self.config(**{key: value})
+
+    def pack(self, **options):
+        self._check()
+
+    grid = place = pack
+
+    def pack_propagate(self, flag=None):
+        pass
+
+    grid_propagate = pack_propagate
+
+    def columnconfigure(self, index, **options):
+        pass
+
+    rowconfigure = columnconfigure
+
+    def bind(self, sequence, func=None, add=None):
+        self._check()
+        self.bindings[sequence] = func
+
+    def unbind(self, sequence, funcid=None):
+        self.bindings.pop(sequence, None)
+
+    def focus(self):
+        self._check()
+
+    focus_set = focus
+
+    def grab_set(self):
+        """Send all input to this widget's window until it's released or destroyed"""
+        self._check()
+        self.root.grab = self
+
+    def grab_release(self):
+        if self.root.grab is self:
+            self.root.grab = None
+
+    def grab_current(self):
+        return self.root.grab
+
+    def accepts_input(self):
+        """False while another window holds a grab, as Tk then drops clicks and keys here"""
+        grab = self.root.grab
+        widget = self
+        while widget is not None:
+            if widget is grab:
+                return True
+            widget = widget.master
+        return grab is None
+
+    def after(self, ms, func, *args):
+        return self.root.after(ms, func, *args)
+
+    def after_idle(self, func, *args):
+        return self.root.after_idle(func, *args)
+
+    def after_cancel(self, timer):
+        self.root.after_cancel(timer)
+
+    def winfo_children(self):
+        return [child for child in self.children if not child.destroyed]
+
+    def winfo_exists(self):
+        return not self.destroyed
+
+    def destroy(self):
+        for child in list(self.children):
+            child.destroy()
+        self.grab_release()
+        self.destroyed = True
+        if self.master is not None and self in self.master.children:
+            self.master.children.remove(self)
+
+    def fire(self, sequence, **event):
+        """Deliver an event to this widget's binding, as if the user had done it"""
+        self._check()
+        handler = self.bindings.get(sequence)
+        if handler is None:
+            raise LookupError(f"Nothing is bound to {sequence}")
+        if not self.accepts_input():
+            return None
+        event.setdefault('widget', self)
+        return handler(types.SimpleNamespace(**event))
+
+    def walk(self):
+        """This widget and everything inside it, depth first"""
+        yield self
+        for child in self.winfo_children():
+            yield from child.walk()
+
+    def find_all(self, kind=None, **options):
+        """Live widgets inside this one of a kind whose options include all of `options`"""
+        return [widget for widget in self.walk()
+                if (kind is None or isinstance(widget, kind))
+                and all(widget.options.get(key) == value for key, value in options.items())]
+
+    def find(self, kind=None, **options):
+        """The first matching widget inside this one; LookupError if there is none"""
+        found = self.find_all(kind, **options)
+        if not found:
+            raise LookupError(f"No {kind.__name__ if kind else 'widget'} with {options}")
+        return found[0]
+
+    def texts(self):
+        """The text of every live widget inside this one, in creation order"""
+        return [widget.options['text'] for widget in self.walk() if 'text' in widget.options]
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.options.get('text', '')!r}>".replace(" ''", '')
+
+
+class Window(Widget):
+
+    def title(self, text=None):
+        if text is None:
+            return self.options.get('title', '')
+        self.options['title'] = text
+
+    def geometry(self, spec=None):
+        self.options['geometry'] = spec
+
+    def protocol(self, name, func=None):
+        self.bindings[name] = func
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.title()!r}>"
+
+
+class Tk(Window):
+    """The root window, with after() timers run against a virtual clock
+
+    Nothing runs by itself: `pump()` runs idle callbacks and due timers,
+    and `advance(ms)` moves the clock on, running timers as they come due.
+    """
+
+    def __init__(self, **options):
+        super().__init__(None, **options)
+        self.now = 0
+        self.grab = None
+        self.idle = []
+        self.timers = {}  # id -> (due, func, args)
+        self.next_timer = 0
+
+    def mainloop(self):
+        pass
+
+    def after(self, ms, func, *args):
+        self.next_timer += 1
+        self.timers[self.next_timer] = (self.now + ms, func, args)
+        return self.next_timer
+
+    def after_idle(self, func, *args):
+        self.idle.append((func, args))
+
+    def after_cancel(self, timer):
+        self.timers.pop(timer, None)
+
+    def pump(self):
+        """Run idle callbacks and due timers until nothing more is ready"""
+        while True:
+            if self.idle:
+                func, args = self.idle.pop(0)
+                func(*args)
+                continue
+            due = [timer for timer, (at, _, _) in self.timers.items() if at <= self.now]
+            if not due:
+                return
+            timer = min(due, key=lambda timer: (self.timers[timer][0], timer))
+            _, func, args = self.timers.pop(timer)
+            func(*args)
+
+    def advance(self, ms):
+        """Move the clock on by `ms`, running everything that comes due on the way"""
+        end = self.now + ms
+        self.pump()
+        while True:
+            upcoming = [at for at, _, _ in self.timers.values() if at <= end]
+            if not upcoming:
+                break
+            self.now = max(self.now, min(upcoming))
+            self.pump()
+        self.now = end
+        self.pump()
+
+
+class Toplevel(Window):
+
+    def close(self):
+        """Close the window as its title bar close button would"""
+        handler = self.bindings.get('WM_DELETE_WINDOW')
+        return handler() if handler else self.destroy()
+
+
+class Frame(Widget):
+    pass
+
+
+class LabelFrame(Widget):
+    pass
+
+
+class Label(Widget):
+    pass
+
+
+class Scrollbar(Widget):
+
+    def set(self, first, last):
+        self.options['position'] = (first, last)
+
+
+class Button(Widget):
+
+    def invoke(self):
+        """Click the button; a disabled button, or one outside a grab, does nothing"""
+        self._check()
+        command = self.options.get('command')
+        if command is not None and self.options.get('state') != 'disabled' and self.accepts_input():
+            return command()
+
+
+class StringVar:
+
+    def __init__(self, master=None, value='', name=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class Radiobutton(Button):
+
+    def invoke(self):
+        self._check()
+        if self.options.get('state') != 'disabled' and self.accepts_input():
+            self.options['variable'].set(self.options['value'])
+        return super().invoke()
+
+
+class OptionMenu(Widget):
+
+    def __init__(self, master, variable, value, *values, **options):
+        super().__init__(master, variable=variable, values=(value,) + values, **options)
+
+    def choose(self, value):
+        """Pick one of the menu's values"""
+        self._check()
+        if value not in self.options['values']:
+            raise ValueError(f"{value!r} is not on this menu")
+        self.options['variable'].set(value)
+        if self.options.get('command'):
+            self.options['command'](value)
+
+
+def _index(index, length):
+    """A Listbox or Entry index as a list position"""
+    if index == END:
+        return length
+    return int(index)
+
+
+class Entry(Widget):
+
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.text = ''
+
+    def get(self):
+        self._check()
+        if self.options.get('textvariable') is not None:
+            return self.options['textvariable'].get()
+        return self.text
+
+    def _set(self, text):
+        if self.options.get('textvariable') is not None:
+            self.options['textvariable'].set(text)
+        else:
+            self.text = text
+
+    def insert(self, index, text):
+        self._check()
+        if self.options.get('state') == 'disabled':
+            return
+        current = self.get()
+        at = _index(index, len(current))
+        self._set(current[:at] + str(text) + current[at:])
+
+    def delete(self, first, last=None):
+        self._check()
+        if self.options.get('state') == 'disabled':
+            return
+        current = self.get()
+        start = _index(first, len(current))
+        stop = start + 1 if last is None else _index(last, len(current))
+        self._set(current[:start] + current[stop:])
+
+    def type(self, text):
+        """Replace the entry's contents, as if the user had typed `text`"""
+        self.delete(0, END)
+        self.insert(0, text)
+
+
+class Text(Widget):
+    """Holds one string; only the '1.0' and 'end' indexes are understood"""
+
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.text = ''
+
+    def get(self, first='1.0', last=END):
+        self._check()
+        return self.text + '\n'
+
+    def insert(self, index, text, *tags):
+        self._check()
+        if self.options.get('state') == 'disabled':
+            return
+        self.text = str(text) + self.text if index == '1.0' else self.text + str(text)
+
+    def delete(self, first, last=None):
+        self._check()
+        if self.options.get('state') != 'disabled':
+            self.text = ''
+
+    def see(self, index):
+        pass
+
+
+class Listbox(Widget):
+
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.items = []
+        self.selected = set()
+
+    def insert(self, index, *items):
+        self._check()
+        at = _index(index, len(self.items))
+        self.items[at:at] = [str(item) for item in items]
+        self.selected = {i + len(items) if i >= at else i for i in self.selected}
+
+    def delete(self, first, last=None):
+        self._check()
+        start = _index(first, len(self.items))
+        stop = start + 1 if last is None else _index(last, len(self.items) - 1) + 1
+        del self.items[start:stop]
+        self.selected = {i if i < start else i - (stop - start)
+                         for i in self.selected if not start <= i < stop}
+
+    def get(self, first, last=None):
+        self._check()
+        if last is None:
+            return self.items[_index(first, len(self.items))]
+        return tuple(self.items[_index(first, len(self.items)):_index(last, len(self.items) - 1) + 1])
+
+    def size(self):
+        return len(self.items)
+
+    def curselection(self):
+        self._check()
+        return tuple(sorted(self.selected))
+
+    def selection_set(self, first, last=None):
+        self._check()
+        start = _index(first, len(self.items))
+        stop = start if last is None else _index(last, len(self.items) - 1)
+        self.selected.update(range(start, stop + 1))
+
+    def selection_clear(self, first, last=None):
+        self.selected.clear()
+
+    def see(self, index):
+        pass
+
+    def yview(self, *args):
+        pass
+
+    def select(self, *indexes):
+        """Select exactly these rows, as clicks would, and fire <<ListboxSelect>>"""
+        self.selected = set(indexes)
+        if '<<ListboxSelect>>' in self.bindings:
+            self.fire('<<ListboxSelect>>')
+
+
+class Treeview(Widget):
+
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.rows = {}  # iid -> values, in display order
+        self.selected = ()
+        self.next_iid = 0
+
+    def heading(self, column, **options):
+        pass
+
+    column = heading
+
+    def insert(self, parent, index, iid=None, **options):
+        self._check()
+        if iid is None:
+            self.next_iid += 1
+            iid = f"I{self.next_iid:03}"
+        rows = list(self.rows.items())
+        at = _index(index, len(rows))
+        rows.insert(at, (iid, tuple(options.get('values', ()))))
+        self.rows = dict(rows)
+        return iid
+
+    def delete(self, *iids):
+        self._check()
+        for iid in iids:
+            del self.rows[iid]
+        self.selected = tuple(iid for iid in self.selected if iid in self.rows)
+
+    def get_children(self, item=''):
+        return tuple(self.rows)
+
+    def item(self, iid, option=None):
+        return self.rows[iid] if option == 'values' else {'values': self.rows[iid]}
+
+    def selection(self):
+        return self.selected
+
+    def selection_set(self, *iids):
+        self.selected = iids
+
+
+class Dialogs:
+    """Stands in for tkinter's messagebox and simpledialog
+
+    Every dialog is recorded in `shown` as (kind, title, message). Answers
+    are scripted per title with `answer(title, *values)` and used in
+    order; an unscripted question gets yes, or a cancel for an ask box.
+    """
+
+    def __init__(self):
+        self.shown = []
+        self.answers = {}
+
+    def answer(self, title, *values):
+        self.answers.setdefault(title, []).extend(values)
+
+    def _ask(self, kind, title, prompt, default):
+        self.shown.append((kind, title, prompt))
+        answers = self.answers.get(title)
+        return answers.pop(0) if answers else default
+
+    def shower(self, kind):
+        """A show* function that records its dialog as `kind`"""
+        def show(title, message, **options):
+            self.shown.append((kind, title, message))
+            return 'ok'
+        return show
+
+    def askyesno(self, title, message, **options):
+        return self._ask('askyesno', title, message, True)
+
+    def askstring(self, title, prompt, **options):
+        return self._ask('askstring', title, prompt, None)
+
+    def askinteger(self, title, prompt, **options):
+        return self._ask('askinteger', title, prompt, None)
+
+    def titles(self, kind=None):
+        return [title for shown_kind, title, _ in self.shown if kind in (None, shown_kind)]
+
+    def last(self, kind=None):
+        """(title, message) of the latest dialog of a kind"""
+        return next((title, message) for shown_kind, title, message in reversed(self.shown)
+                    if kind in (None, shown_kind))
+
+
+def button_label(text):
+    """A button's text without the icon some buttons start with"""
+    icon, _, label = text.partition(' ')
+    return label if label and not icon.isascii() else text
+
+
+def fake_tkinter(dialogs):
+    """(tk, ttk, messagebox, simpledialog) stand-ins, with dialogs going to `dialogs`"""
+    tk = types.SimpleNamespace(
+        END=END, TclError=TclError, Tk=Tk, Toplevel=Toplevel, Frame=Frame, LabelFrame=LabelFrame,
+        Label=Label, Button=Button, Entry=Entry, Text=Text, Listbox=Listbox, Scrollbar=Scrollbar,
+        Radiobutton=Radiobutton, OptionMenu=OptionMenu, StringVar=StringVar)
+    ttk = types.SimpleNamespace(Treeview=Treeview)
+    messagebox = types.SimpleNamespace(
+        askyesno=dialogs.askyesno, showinfo=dialogs.shower('showinfo'),
+        showwarning=dialogs.shower('showwarning'), showerror=dialogs.shower('showerror'))
+    simpledialog = types.SimpleNamespace(askstring=dialogs.askstring, askinteger=dialogs.askinteger)
+    return tk, ttk, messagebox, simpledialog
+
+
+class HeadlessApp:
+    """A PizzaPOSApp on headless Tk and its own database, for driving whole flows in tests
+
+    With no `db_path` the database, receipts, backups and archives all go
+    in a temporary directory removed on exit, so tests can run side by
+    side in separate processes.
+
+        with HeadlessApp() as till:
+            till.login('employee', '5678', opening_float='100')
+            till.app.add_drink('Pepsi', till.app.drink_prices['Pepsi'])
+            till.click('Process Order')
+            till.pay_cash('5')
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        self.dialogs = Dialogs()
+        self.app = None
+        self._stack = None
+
+    def __enter__(self):
+        with contextlib.ExitStack() as stack:
+            if self.db_path is None:
+                directory = stack.enter_context(tempfile.TemporaryDirectory())
+                self.db_path = os.path.join(directory, 'pizza_pos.db')
+            receipts = os.path.join(os.path.dirname(os.path.abspath(self.db_path)), 'receipts')
+            stack.enter_context(mock.patch.dict(os.environ, {PRINTER_SETTING_ENV: f"file:{receipts}",
+                                                             CARD_PROCESSOR_SETTING_ENV: 'simulated'}))
+            tk, ttk, messagebox, simpledialog = fake_tkinter(self.dialogs)
+            stack.enter_context(mock.patch.multiple(pizza_pos_app, tk=tk, ttk=ttk, messagebox=messagebox,
+                                                    simpledialog=simpledialog))
+            self.app = pizza_pos_app.PizzaPOSApp(self.db_path)
+            stack.callback(self.app.close)
+            self._stack = stack.pop_all()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def root(self):
+        return self.app.root
+
+    def windows(self, title=None):
+        """Open Toplevel windows, optionally only those with a title"""
+        return [window for window in self.root.winfo_children()
+                if isinstance(window, Toplevel) and title in (None, window.title())]
+
+    def window(self, title):
+        windows = self.windows(title)
+        if not windows:
+            raise LookupError(f"No {title!r} window is open")
+        return windows[-1]
+
+    def click(self, text, within=None):
+        """Press the button labelled `text` (ignoring any leading icon), then let Tk go idle"""
+        buttons = [button for button in (within or self.root).find_all(Button)
+                   if button_label(button.options.get('text', '')) == text]
+        if not buttons:
+            raise LookupError(f"No {text!r} button")
+        result = buttons[0].invoke()
+        self.root.pump()
+        return result
+
+    def login(self, username, pin, opening_float=None):
+        """Log in from the login screen, answering the opening float prompt if one comes"""
+        if opening_float is not None:
+            self.dialogs.answer("Opening Float", opening_float)
+        self.app.username_entry.type(username)
+        self.app.pin_entry.type(pin)
+        self.click("Login")
+
+    def pay_cash(self, tendered=''):
+        """Pay for the order on the Payment window in cash"""
+        window = self.window("Payment")
+        window.find(Entry).type(tendered)
+        self.click("Cash", within=window)
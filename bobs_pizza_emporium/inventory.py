@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Inventory Tracking for Bob's Pizza Emporium
+Ingredient stock, menu recipes and low-stock / sold-out ("86") flags
+"""
+
+from collections import Counter
+
+from pizza_model import PizzaBuild
+
+# Base every pizza is built on
+PIZZA_BASE = {'Dough': 1, 'Tomato Sauce': 1, 'Mozzarella': 1}
+
+# Starting stock (portions) and low-stock alert level for each ingredient
+DEFAULT_INGREDIENTS = {
+    'Dough': (200, 30),
+    'Tomato Sauce': (200, 30),
+    'Mozzarella': (200, 30),
+    'Pepperoni': (150, 20),
+    'Sausage': (150, 20),
+    'Bacon': (100, 15),
+    'Ham': (100, 15),
+    'Pineapple': (100, 15),
+    'Mushrooms': (100, 15),
+    'Onions': (100, 15),
+    'BBQ Sauce': (60, 10),
+    'Garlic Sauce': (60, 10),
+    'Coca-Cola': (120, 24),
+    'Pepsi': (120, 24),
+    'Sprite': (120, 24),
+    'Water': (120, 24),
+    'Orange Juice': (60, 12)
+}
+
+# Ingredients used by each menu item (custom toppings are added per pizza)
+DEFAULT_RECIPES = {
+    'Margherita': dict(PIZZA_BASE),
+    'Pepperoni': dict(PIZZA_BASE, Pepperoni=1),
+    'Supreme': dict(PIZZA_BASE, Pepperoni=1, Sausage=1, Mushrooms=1, Onions=1),
+    'Hawaiian': dict(PIZZA_BASE, Ham=1, Pineapple=1),
+    'Meat Lovers': dict(PIZZA_BASE, Pepperoni=1, Sausage=1, Bacon=1),
+    'Custom Pizza': dict(PIZZA_BASE),
+    'Coca-Cola': {'Coca-Cola': 1},
+    'Pepsi': {'Pepsi': 1},
+    'Sprite': {'Sprite': 1},
+    'Water': {'Water': 1},
+    'Orange Juice': {'Orange Juice': 1}
+}
+
+
+def init_inventory_tables(cursor):
+    """Create ingredient and recipe tables and seed the default menu"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingredients (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            stock INTEGER NOT NULL DEFAULT 0,
+            low_stock_level INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recipes (
+            menu_item TEXT NOT NULL,
+            ingredient_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (menu_item, ingredient_id),
+            FOREIGN KEY (ingredient_id) REFERENCES ingredients (id)
+        )
+    ''')
+
+    cursor.executemany('''
+        INSERT OR IGNORE INTO ingredients (name, stock, low_stock_level)
+        VALUES (?, ?, ?)
+    ''', [(name, stock, low) for name, (stock, low) in DEFAULT_INGREDIENTS.items()])
+
+    cursor.executemany('''
+        INSERT OR IGNORE INTO recipes (menu_item, ingredient_id, quantity)
+        SELECT ?, id, ? FROM ingredients WHERE name = ?
+    ''', [(item, quantity, ingredient)
+          for item, recipe in DEFAULT_RECIPES.items()
+          for ingredient, quantity in recipe.items()])
+
+
+def menu_item_key(item):
+    """Return the recipe name for a cart item"""
+    if item['type'] == 'custom_pizza':
+        return 'Custom Pizza'
+    if item['type'] == 'pizza':
+        return item.get('pizza', item['name'].split(' (')[0])
+    return item['name']
+
+
+def menu_status(cursor):
+    """Return (low_stock, sold_out) sets of menu item names"""
+    cursor.execute('''
+        SELECT r.menu_item,
+               MAX(i.stock < r.quantity),
+               MAX(i.stock <= i.low_stock_level)
+        FROM recipes r
+        JOIN ingredients i ON i.id = r.ingredient_id
+        GROUP BY r.menu_item
+    ''')
+    low_stock, sold_out = set(), set()
+    for menu_item, is_sold_out, is_low in cursor.fetchall():
+        if is_sold_out:
+            sold_out.add(menu_item)
+        elif is_low:
+            low_stock.add(menu_item)
+    return low_stock, sold_out
+
+
+class Inventory:
+    """Ingredient stock kept in the POS database"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.recipes = self.load_recipes()
+
+    def load_recipes(self):
+        """Load every recipe into memory as {menu_item: {ingredient: quantity}}"""
+        self.cursor.execute('''
+            SELECT r.menu_item, i.name, r.quantity
+            FROM recipes r
+            JOIN ingredients i ON i.id = r.ingredient_id
+        ''')
+        recipes = {}
+        for menu_item, ingredient, quantity in self.cursor.fetchall():
+            recipes.setdefault(menu_item, {})[ingredient] = quantity
+        return recipes
+
+    def usage_for_cart(self, cart):
+        """Total ingredient quantities needed for a cart"""
+        usage = Counter()
+        for item in cart:
+            if 'build' in item:
+                usage.update(PizzaBuild.from_code(item['build']).ingredient_usage())
+                continue
+            usage.update(self.recipes.get(menu_item_key(item), {}))
+            if item['type'] == 'custom_pizza':
+                counts = item.get('topping_counts') or dict.fromkeys(item.get('toppings', []), 1)
+                usage.update(counts)
+        return usage
+
+    def consume(self, cart):
+        """Decrement stock for a cart; the caller owns the transaction"""
+        usage = self.usage_for_cart(cart)
+        # One counter update per ingredient, no read-modify-write round trips
+        self.cursor.executemany('''
+            UPDATE ingredients SET stock = stock - ? WHERE name = ?
+        ''', [(quantity, name) for name, quantity in usage.items()])
+        return usage
+
+    def shortages(self, cart):
+        """Return {ingredient: (needed, in stock)} for everything a cart is short of"""
+        usage = self.usage_for_cart(cart)
+        if not usage:
+            return {}
+        placeholders = ', '.join('?' * len(usage))
+        self.cursor.execute(f'SELECT name, stock FROM ingredients WHERE name IN ({placeholders})',
+                            list(usage))
+        return {name: (usage[name], stock) for name, stock in self.cursor.fetchall()
+                if stock < usage[name]}
+
+    def restock(self, name, amount):
+        """Add stock for an ingredient"""
+        self.cursor.execute('''
+            UPDATE ingredients SET stock = stock + ? WHERE name = ?
+        ''', (amount, name))
+
+    def stock_levels(self):
+        """Return (name, stock, low_stock_level) for every ingredient"""
+        self.cursor.execute('SELECT name, stock, low_stock_level FROM ingredients ORDER BY name')
+        return self.cursor.fetchall()
+
+    def low_stock_ingredients(self):
+        """Ingredients at or below their alert level but not yet sold out"""
+        self.cursor.execute('''
+            SELECT name FROM ingredients
+            WHERE stock <= low_stock_level AND stock > 0
+        ''')
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def sold_out_ingredients(self):
+        """Ingredients with no stock left"""
+        self.cursor.execute('SELECT name FROM ingredients WHERE stock <= 0')
+        return {row[0] for row in self.cursor.fetchall()}
+
+    def menu_status(self):
+        """Return (low_stock, sold_out) sets of menu item names"""
+        return menu_status(self.cursor)
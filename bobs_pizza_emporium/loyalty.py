@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Loyalty Points for Bob's Pizza Emporium
+Append-only points ledger per customer with periodically materialized balances
+"""
+
+from decimal import Decimal
+
+POINTS_PER_DOLLAR = 1
+REWARD_POINTS = 100             # points per reward
+REWARD_VALUE = Decimal('5.00')  # discount per reward
+
+# How often the till rolls new ledger entries into the balances table
+MATERIALIZE_INTERVAL_MS = 5 * 60 * 1000
+
+
+def init_loyalty_tables(cursor):
+    """Create the points ledger and the materialized balances"""
+    # Entries are never changed; corrections are new entries
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS loyalty_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            customer_id INTEGER NOT NULL,
+            order_id INTEGER,
+            points INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (customer_id) REFERENCES customers (id),
+            FOREIGN KEY (order_id) REFERENCES orders (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_loyalty_ledger_customer
+        ON loyalty_ledger (customer_id, id)
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_loyalty_ledger_order
+        ON loyalty_ledger (order_id)
+    ''')
+
+    for action in ('UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS loyalty_ledger_no_{action.lower()}
+            BEFORE {action} ON loyalty_ledger
+            BEGIN
+                SELECT RAISE(ABORT, 'loyalty ledger is append-only');
+            END
+        ''')
+
+    # Sum of each customer's entries up to and including through_id
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS loyalty_balances (
+            customer_id INTEGER PRIMARY KEY,
+            points INTEGER NOT NULL,
+            through_id INTEGER NOT NULL,
+            FOREIGN KEY (customer_id) REFERENCES customers (id)
+        )
+    ''')
+
+
+def points_for(total):
+    """Points earned for an order total; whole dollars only"""
+    return int(Decimal(total)) * POINTS_PER_DOLLAR if total > 0 else 0
+
+
+def reward_item(rewards):
+    """Cart line that redeems `rewards` rewards as a discount"""
+    points = rewards * REWARD_POINTS
+    return {
+        'type': 'reward',
+        'name': f"Loyalty Reward ({points} pts)",
+        'price': -REWARD_VALUE * rewards,
+        'points': points
+    }
+
+
+class LoyaltyLedger:
+    """Earn and redeem points; balances read the snapshot plus its short tail"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def _append(self, customer_id, order_id, points, reason):
+        self.cursor.execute('''
+            INSERT INTO loyalty_ledger (customer_id, order_id, points, reason)
+            VALUES (?, ?, ?, ?)
+        ''', (customer_id, order_id, points, reason))
+
+    def balance(self, customer_id):
+        """Current points balance
+
+        One query: the customer's materialized row plus any entries
+        appended since it was taken, found by seeking the
+        (customer_id, id) index past through_id.
+        """
+        self.cursor.execute('''
+            SELECT COALESCE(b.points, 0) + COALESCE(SUM(l.points), 0)
+            FROM (SELECT ? AS customer_id) AS c
+            LEFT JOIN loyalty_balances AS b ON b.customer_id = c.customer_id
+            LEFT JOIN loyalty_ledger AS l
+                ON l.customer_id = c.customer_id AND l.id > COALESCE(b.through_id, 0)
+        ''', (customer_id,))
+        return self.cursor.fetchone()[0]
+
+    def earn(self, customer_id, order_id, total):
+        """Credit points for a paid order; the caller owns the transaction"""
+        points = points_for(total)
+        if points:
+            self._append(customer_id, order_id, points, 'earn')
+        return points
+
+    def redeem(self, customer_id, order_id, points):
+        """Debit points for a reward; raises ValueError if the balance is short
+
+        The caller owns the transaction, so the check and the debit
+        commit or roll back together with the order.
+        """
+        balance = self.balance(customer_id)
+        if points > balance:
+            raise ValueError(f"Not enough points: {balance} available, {points} needed")
+        self._append(customer_id, order_id, -points, 'redeem')
+
+    def adjust_order(self, customer_id, order_id, net_total, restored_points=0):
+        """Bring an adjusted order's points in line with its new total
+
+        Appends the difference between what the order has earned so far
+        and what its net total earns now, and gives back the points of
+        any rewards taken off it. The caller owns the transaction.
+        """
+        self.cursor.execute('''
+            SELECT COALESCE(SUM(points), 0) FROM loyalty_ledger
+            WHERE order_id = ? AND reason IN ('earn', 'adjust')
+        ''', (order_id,))
+        change = points_for(net_total) - self.cursor.fetchone()[0]
+        if change:
+            self._append(customer_id, order_id, change, 'adjust')
+        if restored_points:
+            self._append(customer_id, order_id, restored_points, 'restore')
+        return change
+
+    def materialize(self):
+        """Fold new ledger entries into loyalty_balances; returns customers updated"""
+        self.cursor.execute('''
+            INSERT INTO loyalty_balances (customer_id, points, through_id)
+            SELECT l.customer_id, SUM(l.points), MAX(l.id)
+            FROM loyalty_ledger AS l
+            LEFT JOIN loyalty_balances AS b ON b.customer_id = l.customer_id
+            WHERE l.id > COALESCE(b.through_id, 0)
+            GROUP BY l.customer_id
+            ON CONFLICT (customer_id) DO UPDATE SET
+                points = points + excluded.points,
+                through_id = excluded.through_id
+        ''')
+        return self.cursor.rowcount
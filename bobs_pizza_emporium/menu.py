@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Menu and Pricing for Bob's Pizza Emporium
+Menu prices, cart items and cart totals shared by the till and the online ordering API,
+with versioned menu snapshots cached in memory and on disk
+"""
+
+import hashlib
+import json
+import os
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+
+from pizza_model import CRUST_PRICES, CRUSTS, PLACEMENTS, SAUCES
+from shifts import from_cents, to_cents
+
+TAX_RATE = Decimal('0.08')  # 8% tax rate
+
+PIZZA_PRICES = {
+    'small': Decimal('12.99'),
+    'medium': Decimal('15.99'),
+    'large': Decimal('18.99')
+}
+
+TOPPING_PRICES = {
+    'Pepperoni': Decimal('1.50'),
+    'Sausage': Decimal('1.50'),
+    'Bacon': Decimal('2.00'),
+    'Pineapple': Decimal('1.00'),
+    'Mushrooms': Decimal('1.00'),
+    'Onions': Decimal('1.00'),
+    'Extra Cheese': Decimal('1.00')
+}
+
+DRINK_PRICES = {
+    'Coca-Cola': Decimal('2.50'),
+    'Pepsi': Decimal('2.50'),
+    'Sprite': Decimal('2.50'),
+    'Water': Decimal('1.50'),
+    'Orange Juice': Decimal('3.00')
+}
+
+# Standard pizzas, numbered in this order for fast-entry codes (M2 = medium Pepperoni)
+STANDARD_PIZZAS = [
+    ("Margherita", "Classic tomato and mozzarella"),
+    ("Pepperoni", "Pepperoni and mozzarella"),
+    ("Supreme", "Pepperoni, sausage, mushrooms, onions"),
+    ("Hawaiian", "Ham and pineapple"),
+    ("Meat Lovers", "Pepperoni, sausage, bacon")
+]
+
+
+# Priced sections of the menu; the defaults seed the menu_prices table
+PRICE_SECTIONS = ('size', 'topping', 'drink')
+DEFAULT_PRICES = {'size': PIZZA_PRICES, 'topping': TOPPING_PRICES, 'drink': DRINK_PRICES}
+
+
+def init_menu_tables(cursor):
+    """Create the price list, seeded with the default prices, and its version counter
+
+    Triggers bump the version on every price change or new item, so a
+    cached snapshot is known to be current from one small read.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS menu_prices (
+            section TEXT NOT NULL,
+            name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            price_cents INTEGER NOT NULL,
+            PRIMARY KEY (section, name)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS menu_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO menu_version (id, version) VALUES (1, 1)')
+
+    for event in ('INSERT', 'UPDATE OF price_cents'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS menu_prices_{event.split()[0].lower()}_version
+            AFTER {event} ON menu_prices
+            BEGIN
+                UPDATE menu_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+    cursor.executemany('''
+        INSERT OR IGNORE INTO menu_prices (section, name, position, price_cents) VALUES (?, ?, ?, ?)
+    ''', [(section, name, position, to_cents(price))
+          for section in PRICE_SECTIONS
+          for position, (name, price) in enumerate(DEFAULT_PRICES[section].items())])
+
+
+def set_price(cursor, section, name, price):
+    """Change one size, topping or drink price; the caller owns the transaction"""
+    cursor.execute('UPDATE menu_prices SET price_cents = ? WHERE section = ? AND name = ?',
+                   (to_cents(price), section, name))
+    if not cursor.rowcount:
+        raise ValueError(f"No {section} {name!r} on the menu")
+
+
+def menu_version(cursor):
+    cursor.execute('SELECT version FROM menu_version WHERE id = 1')
+    return cursor.fetchone()[0]
+
+
+def menu_document(version, prices, tax_rate=TAX_RATE):
+    """The menu as served to remote clients, with prices as strings
+
+    `prices` maps each of PRICE_SECTIONS to {name: Decimal price}.
+    """
+    sizes = {size: str(price) for size, price in prices['size'].items()}
+    return {
+        'version': version,
+        'pizzas': [{'name': name, 'description': description, 'prices': sizes}
+                   for name, description in STANDARD_PIZZAS],
+        'custom_pizza': {
+            'prices': sizes,
+            'crusts': {crust: str(CRUST_PRICES[crust]) for crust in CRUSTS},
+            'sauces': list(SAUCES),
+            'toppings': {name: str(price) for name, price in prices['topping'].items()},
+            'placements': list(PLACEMENTS)
+        },
+        'drinks': {name: str(price) for name, price in prices['drink'].items()},
+        'tax_rate': str(tax_rate)
+    }
+
+
+def menu_cache_path(db_path):
+    """File the serialized menu of a database is cached in"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), 'menu_cache.json')
+
+
+class MenuSnapshot:
+    """One version of the menu: Decimal prices for pricing carts and the serialized body for clients
+
+    The body is compact JSON in menu order, built the same way in every
+    process, so its hash (the ETag) only changes with the menu.
+    """
+
+    __slots__ = ('version', 'body', 'etag', 'pizza_prices', 'topping_prices', 'drink_prices')
+
+    def __init__(self, body):
+        document = json.loads(body)
+        self.version = document['version']
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        self.pizza_prices = {size: Decimal(price) for size, price in document['custom_pizza']['prices'].items()}
+        self.topping_prices = {name: Decimal(price)
+                               for name, price in document['custom_pizza']['toppings'].items()}
+        self.drink_prices = {name: Decimal(price) for name, price in document['drinks'].items()}
+
+    @property
+    def standard_pizzas(self):
+        return STANDARD_PIZZAS
+
+    def matches(self, if_none_match):
+        """Whether an If-None-Match header names this snapshot, so a 304 will do"""
+        tags = [tag.strip() for tag in (if_none_match or '').split(',')]
+        return '*' in tags or self.etag in tags or f"W/{self.etag}" in tags
+
+
+class MenuCache:
+    """The current menu snapshot, rebuilt only when a price change bumps the version
+
+    `current` costs one read of the version number. After a change the
+    snapshot comes from the disk cache if another process has already
+    built that version, else from the price list. Safe to share between
+    threads that each pass their own cursor.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.snapshot = None
+        self._lock = threading.Lock()
+
+    def current(self, cursor):
+        version = menu_version(cursor)
+        with self._lock:
+            if self.snapshot is None or self.snapshot.version != version:
+                self.snapshot = self._load(version) or self._build(cursor, version)
+            return self.snapshot
+
+    def _load(self, version):
+        if self.path is None:
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                snapshot = MenuSnapshot(f.read())
+        except (OSError, ValueError, KeyError, ArithmeticError):
+            return None
+        return snapshot if snapshot.version == version else None
+
+    def _build(self, cursor, version):
+        prices = {section: {} for section in PRICE_SECTIONS}
+        cursor.execute('SELECT section, name, price_cents FROM menu_prices ORDER BY section, position')
+        for section, name, price_cents in cursor.fetchall():
+            prices[section][name] = from_cents(price_cents)
+        body = json.dumps(menu_document(version, prices), separators=(',', ':')).encode()
+        snapshot = MenuSnapshot(body)
+        if self.path is not None:
+            # Write then rename, so other processes never read half a file
+            partial = f"{self.path}.{os.getpid()}.{threading.get_ident()}.partial"
+            try:
+                with open(partial, 'wb') as f:
+                    f.write(body)
+                os.replace(partial, self.path)
+            except OSError:
+                pass
+        return snapshot
+
+
+def pizza_item(pizza_name, size, pizza_prices=PIZZA_PRICES):
+    """Cart item for a standard pizza"""
+    return {
+        'type': 'pizza',
+        'name': f"{pizza_name} ({size.title()})",
+        'price': pizza_prices[size],
+        'size': size,
+        'pizza': pizza_name
+    }
+
+
+def custom_pizza_item(build, pizza_prices=PIZZA_PRICES, topping_prices=TOPPING_PRICES):
+    """Cart item for a custom pizza build"""
+    return {
+        'type': 'custom_pizza',
+        'name': build.describe(),
+        'price': build.price(pizza_prices, topping_prices),
+        'size': build.size,
+        'build': build.code  # compact modifier vector; PizzaBuild.from_code restores it
+    }
+
+
+def drink_item(drink_name, drink_prices=DRINK_PRICES):
+    """Cart item for a drink"""
+    return {
+        'type': 'drink',
+        'name': drink_name,
+        'price': drink_prices[drink_name]
+    }
+
+
+def cart_totals(cart, tax_rate=TAX_RATE):
+    """Return (subtotal, tax, total) for a cart, with tax rounded half up to the cent"""
+    subtotal = sum((item['price'] for item in cart), Decimal('0.00'))
+    tax = (subtotal * tax_rate).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return subtotal, tax, subtotal + tax
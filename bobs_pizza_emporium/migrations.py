@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Schema Migrations for Bob's Pizza Emporium
+Versioned schema changes with chunked background backfills
+"""
+
+import sqlite3
+import threading
+
+from adjustments import init_daily_totals_table
+
+BACKFILL_CHUNK_SIZE = 500
+BACKFILL_PAUSE = 0.05  # seconds between chunks so the till can get the write lock
+
+
+class Migration:
+    """A numbered schema change with an optional chunked data backfill
+
+    `schema` runs inside the upgrade transaction at startup and must be
+    quick (e.g. ALTER TABLE ... ADD COLUMN, which SQLite does without
+    rewriting the table). `backfill_sql` is a statement that fills in
+    data for the rows of `backfill_table` with ids in [?, ?) and runs
+    later in small transactions.
+    """
+
+    def __init__(self, version, name, schema=None, backfill_table=None, backfill_sql=None):
+        self.version = version
+        self.name = name
+        self.schema = schema
+        self.backfill_table = backfill_table
+        self.backfill_sql = backfill_sql
+
+
+def _add_column(cursor, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN, skipped when a fresh CREATE TABLE already has it"""
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _has_tables(cursor, *tables):
+    """Check the tables exist; partial databases built by tests may lack them"""
+    placeholders = ', '.join('?' * len(tables))
+    cursor.execute(f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ({placeholders})", tables)
+    return cursor.fetchone()[0] == len(tables)
+
+
+def _add_order_total_cents(cursor):
+    cursor.execute('ALTER TABLE orders ADD COLUMN total_cents INTEGER')
+
+
+def _add_shift_opening_float(cursor):
+    _add_column(cursor, 'shifts', 'opening_float_cents', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def _add_shift_cash_sales(cursor):
+    _add_column(cursor, 'shifts', 'cash_cents', 'INTEGER NOT NULL DEFAULT 0')
+    # Every order was taken as cash before payments were recorded
+    cursor.execute('UPDATE shifts SET cash_cents = total_cents')
+
+
+def _add_order_uuid(cursor):
+    # Existing orders keep a NULL key; UNIQUE allows any number of NULLs
+    cursor.execute('ALTER TABLE orders ADD COLUMN order_uuid TEXT')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_uuid ON orders (order_uuid)')
+
+
+def _add_order_customer(cursor):
+    cursor.execute('ALTER TABLE orders ADD COLUMN customer_id INTEGER REFERENCES customers (id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_customer ON orders (customer_id, id)')
+
+
+def _assign_user_roles(cursor):
+    # Accounts from before roles get the role their admin flag stood for
+    if _has_tables(cursor, 'users', 'roles'):
+        cursor.execute('''
+            INSERT OR IGNORE INTO user_roles (user_id, role_id)
+            SELECT users.id, roles.id FROM users
+            JOIN roles ON roles.name = CASE WHEN users.is_admin THEN 'Manager' ELSE 'Cashier' END
+        ''')
+
+
+def _add_user_soft_delete(cursor):
+    # Deleted accounts keep their row so orders and shifts still join to them
+    if _has_tables(cursor, 'users'):
+        _add_column(cursor, 'users', 'deleted_at', 'TIMESTAMP')
+
+
+# Ordered list of every migration; append new ones with the next version
+MIGRATIONS = [
+    Migration(1, 'baseline schema'),
+    Migration(2, 'exact integer order totals', schema=_add_order_total_cents,
+              backfill_table='orders',
+              backfill_sql='''
+                  UPDATE orders SET total_cents = CAST(ROUND(total * 100) AS INTEGER)
+                  WHERE id >= ? AND id < ? AND total_cents IS NULL
+              '''),
+    Migration(3, 'shift opening float', schema=_add_shift_opening_float),
+    Migration(4, 'order idempotency keys', schema=_add_order_uuid),
+    Migration(5, 'shift cash sales', schema=_add_shift_cash_sales),
+    Migration(6, 'order customers', schema=_add_order_customer),
+    Migration(7, 'user roles', schema=_assign_user_roles),
+    Migration(8, 'user soft delete', schema=_add_user_soft_delete),
+    # Orders from before the upgrade are added a chunk at a time; new ones add themselves
+    Migration(9, 'daily totals', schema=init_daily_totals_table,
+              backfill_table='orders',
+              backfill_sql='''
+                  INSERT INTO daily_totals (day, order_count, subtotal_cents, tax_cents, total_cents)
+                  SELECT date(created_at, 'localtime'), COUNT(*),
+                         SUM(CAST(ROUND(subtotal * 100) AS INTEGER)),
+                         SUM(CAST(ROUND(tax * 100) AS INTEGER)),
+                         SUM(CAST(ROUND(total * 100) AS INTEGER))
+                  FROM orders
+                  WHERE id >= ? AND id < ?
+                  GROUP BY 1
+                  ON CONFLICT (day) DO UPDATE SET
+                      order_count = order_count + excluded.order_count,
+                      subtotal_cents = subtotal_cents + excluded.subtotal_cents,
+                      tax_cents = tax_cents + excluded.tax_cents,
+                      total_cents = total_cents + excluded.total_cents
+              '''),
+]
+
+
+def init_migration_tables(cursor):
+    """Create the schema version and backfill progress tables"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_backfills (
+            version INTEGER PRIMARY KEY,
+            next_id INTEGER NOT NULL DEFAULT 0,
+            end_id INTEGER NOT NULL,
+            completed_at TIMESTAMP,
+            FOREIGN KEY (version) REFERENCES schema_version (version)
+        )
+    ''')
+
+
+def current_version(cursor):
+    """Highest applied migration version (0 for a database that predates migrations)"""
+    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    return cursor.fetchone()[0]
+
+
+def migrate(cursor, migrations=MIGRATIONS):
+    """Apply pending schema steps in order; the caller owns the transaction
+
+    Backfills are only queued here, covering the rows that existed at
+    upgrade time; new rows are written complete by the upgraded code.
+    Returns the versions applied.
+    """
+    init_migration_tables(cursor)
+    version = current_version(cursor)
+    applied = []
+    for migration in sorted(migrations, key=lambda m: m.version):
+        if migration.version <= version:
+            continue
+        if migration.schema:
+            migration.schema(cursor)
+        cursor.execute('INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                       (migration.version, migration.name))
+        if migration.backfill_sql:
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {migration.backfill_table}')
+            cursor.execute('INSERT INTO schema_backfills (version, end_id) VALUES (?, ?)',
+                           (migration.version, cursor.fetchone()[0]))
+        applied.append(migration.version)
+    return applied
+
+
+def run_backfill_chunk(conn, migrations=MIGRATIONS, chunk_size=BACKFILL_CHUNK_SIZE):
+    """Run one chunk of the oldest unfinished backfill in its own transaction
+
+    Progress is saved with the chunk, so an interrupted backfill resumes
+    where it stopped. Returns False when no backfill work remains.
+    """
+    by_version = {m.version: m for m in migrations}
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT version, next_id, end_id FROM schema_backfills
+        WHERE completed_at IS NULL ORDER BY version LIMIT 1
+    ''')
+    row = cursor.fetchone()
+    if row is None:
+        return False
+
+    version, next_id, end_id = row
+    chunk_end = min(next_id + chunk_size, end_id)
+    try:
+        cursor.execute(by_version[version].backfill_sql, (next_id, chunk_end))
+        if chunk_end >= end_id:
+            cursor.execute('''
+                UPDATE schema_backfills SET next_id = ?, completed_at = CURRENT_TIMESTAMP
+                WHERE version = ?
+            ''', (chunk_end, version))
+        else:
+            cursor.execute('UPDATE schema_backfills SET next_id = ? WHERE version = ?',
+                           (chunk_end, version))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return True
+
+
+def pending_backfills(cursor):
+    """Return (version, next_id, end_id) for unfinished backfills"""
+    cursor.execute('''
+        SELECT version, next_id, end_id FROM schema_backfills
+        WHERE completed_at IS NULL ORDER BY version
+    ''')
+    return cursor.fetchall()
+
+
+class BackfillWorker:
+    """Runs pending backfills on a background thread with its own connection"""
+
+    def __init__(self, db_path, migrations=MIGRATIONS, chunk_size=BACKFILL_CHUNK_SIZE,
+                 pause=BACKFILL_PAUSE):
+        self.db_path = db_path
+        self.migrations = migrations
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.error = None
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='schema-backfill', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop after the current chunk"""
+        self._stop.set()
+        self.thread.join()
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            while not self._stop.is_set():
+                if not run_backfill_chunk(conn, self.migrations, self.chunk_size):
+                    return
+                self._stop.wait(self.pause)
+        except sqlite3.Error as e:
+            # Left unfinished; the next start resumes from the saved position
+            self.error = e
+        finally:
+            conn.close()
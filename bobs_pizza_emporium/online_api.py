@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+Online Ordering API for Bob's Pizza Emporium
+A local JSON-over-HTTP API for web and delivery-partner orders, priced and saved like till orders
+
+Usage:
+    python online_api.py [--db pizza_pos.db] [--host 127.0.0.1] [--port 8080]
+    python online_api.py [--host 127.0.0.1] [--port 8080] --load-test 5000 [--concurrency 200]
+
+Endpoints:
+    GET  /menu                   menu and prices, with an ETag to revalidate against
+    POST /quote                  {"items": [...]} -> the cart priced from the menu
+    POST /orders                 {"items": [...], "fulfilment": "pickup", "order_uuid": "..."} -> saved order
+    GET  /orders/<order_uuid>    an order's totals and status
+
+Items are {"type": "pizza", "pizza": "Pepperoni", "size": "large"},
+{"type": "custom_pizza", "build": "L10:2201"} (or "size", "crust", "sauce"
+and "toppings": [{"name": "Bacon", "placement": "left"}]) or
+{"type": "drink", "name": "Pepsi"}, each with an optional "quantity".
+Prices always come from the menu, never from the client. Orders are
+charged by card; resubmitting an order_uuid returns the saved order
+without charging again.
+"""
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from adjustments import OrderAdjuster, record_daily
+from forecasting import record_sales
+from inventory import Inventory
+from menu import (STANDARD_PIZZAS, TAX_RATE, MenuCache, cart_totals, custom_pizza_item, drink_item,
+                  menu_cache_path, pizza_item)
+from order_search import OrderSearch, init_order_search_tables
+from order_status import LIFECYCLES, OrderStatusTracker
+from orders import find_order_by_uuid, insert_order, new_order_uuid
+from payments import CardAuthorizer, processor_from_setting, record_payment
+from pizza_model import CRUSTS, MAX_QUANTITY, MODIFIERS, PLACEMENTS, SAUCES, SIZES, PizzaBuild
+from shifts import from_cents, to_cents
+
+API_HOST = '127.0.0.1'
+API_PORT = 8080
+READ_WORKERS = 4
+MAX_BODY = 64 * 1024
+MAX_LINE_QUANTITY = 20
+KEEP_ALIVE_SECONDS = 15
+AUTH_POLL_SECONDS = 0.05
+MENU_CHECK_SECONDS = 1.0  # how stale a price change may be before the API serves it
+ONLINE_STAFF = 'online'  # orders are searchable under this staff name
+
+STATUS_TEXT = {
+    200: 'OK',
+    201: 'Created',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    402: 'Payment Required',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    409: 'Conflict',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error'
+}
+
+
+class ApiError(Exception):
+    """An error answered with an HTTP status and a message for the client"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def build_from_request(line):
+    """Custom pizza build from a build code or from size, crust, sauce and toppings"""
+    if 'build' in line:
+        try:
+            build = PizzaBuild.from_code(str(line['build']))
+        except (ValueError, IndexError, StopIteration):
+            raise ValueError(f"Invalid build code {line['build']!r}") from None
+        if len(build.vector) != len(MODIFIERS):
+            raise ValueError(f"Invalid build code {line['build']!r}")
+        return build
+
+    size, crust, sauce = line.get('size', 'medium'), line.get('crust', CRUSTS[0]), line.get('sauce', SAUCES[0])
+    if size not in SIZES or crust not in CRUSTS or sauce not in SAUCES:
+        raise ValueError("Unknown size, crust or sauce")
+    build = PizzaBuild(size, crust, sauce)
+    for topping in line.get('toppings', []):
+        if not isinstance(topping, dict):
+            raise ValueError("Each topping must be an object")
+        name, placement, amount = topping.get('name'), topping.get('placement', 'whole'), topping.get('amount', 1)
+        if name not in MODIFIERS or placement not in PLACEMENTS:
+            raise ValueError(f"Unknown topping or placement: {name}, {placement}")
+        if type(amount) is not int or not 1 <= amount <= MAX_QUANTITY:
+            raise ValueError(f"Topping amount must be 1 to {MAX_QUANTITY}")
+        build.add(name, placement, amount)
+    return build
+
+
+def cart_from_request(items, menu):
+    """Price a client's items from a MenuSnapshot; raises ValueError for anything not on it"""
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty list")
+    pizza_names = {name for name, _ in STANDARD_PIZZAS}
+    cart = []
+    for line in items:
+        if not isinstance(line, dict):
+            raise ValueError("Each item must be an object")
+        quantity = line.get('quantity', 1)
+        if type(quantity) is not int or not 1 <= quantity <= MAX_LINE_QUANTITY:
+            raise ValueError(f"quantity must be 1 to {MAX_LINE_QUANTITY}")
+        kind = line.get('type')
+        if kind == 'pizza':
+            if line.get('pizza') not in pizza_names or line.get('size') not in menu.pizza_prices:
+                raise ValueError(f"No {line.get('size')} {line.get('pizza')} pizza on the menu")
+            item = pizza_item(line['pizza'], line['size'], menu.pizza_prices)
+        elif kind == 'custom_pizza':
+            item = custom_pizza_item(build_from_request(line), menu.pizza_prices, menu.topping_prices)
+        elif kind == 'drink':
+            if line.get('name') not in menu.drink_prices:
+                raise ValueError(f"No drink {line.get('name')!r} on the menu")
+            item = drink_item(line['name'], menu.drink_prices)
+        else:
+            raise ValueError(f"Unknown item type {kind!r}")
+        cart.extend(dict(item) for _ in range(quantity))
+    return cart
+
+
+def quote_document(cart):
+    subtotal, tax, total = cart_totals(cart)
+    return {
+        'items': [{'name': item['name'], 'price': str(item['price'])} for item in cart],
+        'subtotal': str(subtotal),
+        'tax': str(tax),
+        'total': str(total)
+    }
+
+
+def record_online_order_effects(cursor, order_id, cart, fulfilment, auth_code, search_available=True):
+    """What a new online order updates besides its row, as the till does; the caller owns the transaction
+
+    Online orders have no shift, staff member or loyalty customer.
+    """
+    subtotal, tax, total = cart_totals(cart)
+    record_payment(cursor, order_id, 'card', total, auth_code=auth_code)
+    OrderSearch(cursor, search_available).index_order(order_id, cart, ONLINE_STAFF)
+    record_daily(cursor, to_cents(subtotal), to_cents(tax), to_cents(total))
+    record_sales(cursor, cart)
+    OrderStatusTracker(cursor).start_order(order_id, fulfilment, None)
+    Inventory(cursor).consume(cart)
+
+
+async def read_request(reader):
+    """Read one request; returns (method, path, version, headers, body), or None once the client is done"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise ApiError(400, "Incomplete request") from None
+        return None
+    except asyncio.LimitOverrunError:
+        raise ApiError(413, "Request headers too large") from None
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, path, version = lines[0].split(' ')
+    except ValueError:
+        raise ApiError(400, "Malformed request line") from None
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise ApiError(400, "Invalid Content-Length") from None
+    if not 0 <= length <= MAX_BODY:
+        raise ApiError(413, f"Request body over {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b''
+    return method, path, version, headers, body
+
+
+def response_bytes(status, body, keep_alive, headers=()):
+    head = [f"HTTP/1.1 {status} {STATUS_TEXT[status]}",
+            'Content-Type: application/json',
+            f"Content-Length: {len(body)}",
+            'Connection: keep-alive' if keep_alive else 'Connection: close']
+    head.extend(headers)
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+async def send_request(reader, writer, method, path, payload=None, headers=()):
+    """Client side: send one request on an open connection; returns (status, headers, JSON body)"""
+    body = b'' if payload is None else json.dumps(payload).encode()
+    head = [f"{method} {path} HTTP/1.1", 'Host: localhost', f"Content-Length: {len(body)}"]
+    head.extend(headers)
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+
+    lines = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    response_headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(response_headers.get('content-length', 0)))
+    return int(lines[0].split(' ')[1]), response_headers, json.loads(body) if body else None
+
+
+class OrderApi:
+    """The API server: asyncio for connections, worker threads for the database
+
+    Reads run on a small pool and writes on a single worker, each thread
+    keeping one connection for its lifetime, so no request pays to open
+    the database and writes queue up here rather than on sqlite's busy
+    timeout. The menu is served from memory as a versioned snapshot whose
+    ETag lets clients revalidate with a 304; whether it is still current
+    is checked at most once every MENU_CHECK_SECONDS.
+    """
+
+    def __init__(self, db_path, processor=None, read_workers=READ_WORKERS):
+        self.db_path = db_path
+        self.card_authorizer = CardAuthorizer(processor or processor_from_setting())
+        self.readers = ThreadPoolExecutor(read_workers, thread_name_prefix='api-read')
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix='api-write')
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.menu_cache = MenuCache(menu_cache_path(db_path))
+        self.menu_snapshot = None
+        self.menu_checked = 0
+        self.search_available = None
+        self.server = None
+
+    def _cursor(self):
+        """This worker thread's cursor, connecting on first use"""
+        cursor = getattr(self.local, 'cursor', None)
+        if cursor is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+            with self.connections_lock:
+                self.connections.append(conn)
+            cursor = self.local.cursor = conn.cursor()
+        return cursor
+
+    async def start(self, host=API_HOST, port=API_PORT):
+        """Start listening; returns the port (pass 0 for any free one)"""
+        self.server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.readers.shutdown()
+        self.writer.shutdown()
+        for conn in self.connections:
+            conn.close()
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until the client closes it or goes idle"""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), KEEP_ALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    break
+                except ApiError as e:
+                    writer.write(response_bytes(e.status, json.dumps({'error': str(e)}).encode(), False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, version, headers, body = request
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                status, body, extra = await self.respond(method, path.split('?', 1)[0], headers, body)
+                writer.write(response_bytes(status, body, keep_alive, extra))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, method, path, headers, body):
+        """Route one request; returns (status, JSON body bytes, extra response headers)"""
+        if path == '/menu' and method == 'GET':
+            try:
+                menu = await self.menu()
+            except sqlite3.Error as e:
+                return 500, json.dumps({'error': f"Database error: {e}"}).encode(), ()
+            cache_headers = (f"ETag: {menu.etag}", 'Cache-Control: no-cache')
+            if menu.matches(headers.get('if-none-match')):
+                return 304, b'', cache_headers
+            return 200, menu.body, cache_headers
+        try:
+            status, document = await self.route(method, path, body)
+        except ApiError as e:
+            status, document = e.status, {'error': str(e)}
+        except ValueError as e:
+            status, document = 400, {'error': str(e)}
+        except sqlite3.Error as e:
+            status, document = 500, {'error': f"Database error: {e}"}
+        return status, json.dumps(document).encode(), ()
+
+    async def menu(self):
+        """The current MenuSnapshot, rechecking the version at most every MENU_CHECK_SECONDS"""
+        now = time.monotonic()
+        if self.menu_snapshot is None or now - self.menu_checked >= MENU_CHECK_SECONDS:
+            self.menu_checked = now
+            self.menu_snapshot = await self._read(self._current_menu)
+        return self.menu_snapshot
+
+    async def route(self, method, path, body):
+        if path == '/menu':
+            self._allow(method, 'GET')
+        if path == '/quote':
+            self._allow(method, 'POST')
+            return 200, quote_document(cart_from_request(self._json(body).get('items'), await self.menu()))
+        if path == '/orders':
+            self._allow(method, 'POST')
+            return await self.submit_order(self._json(body))
+        if path.startswith('/orders/'):
+            self._allow(method, 'GET')
+            order = await self._read(self._order_document, path[len('/orders/'):])
+            if order is None:
+                raise ApiError(404, "No such order")
+            return 200, order
+        raise ApiError(404, f"No endpoint {path}")
+
+    @staticmethod
+    def _allow(method, allowed):
+        if method != allowed:
+            raise ApiError(405, f"Use {allowed}")
+
+    @staticmethod
+    def _json(body):
+        document = json.loads(body or b'{}')
+        if not isinstance(document, dict):
+            raise ValueError("Request body must be a JSON object")
+        return document
+
+    async def _read(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.readers, function, *args)
+
+    async def _write(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.writer, function, *args)
+
+    async def submit_order(self, request):
+        """Charge the card, then save the order; returns (status, order)"""
+        cart = cart_from_request(request.get('items'), await self.menu())
+        fulfilment = request.get('fulfilment', 'pickup')
+        if fulfilment not in LIFECYCLES:
+            raise ValueError(f"fulfilment must be one of {', '.join(LIFECYCLES)}")
+        order_uuid = request.get('order_uuid') or new_order_uuid()
+        if not isinstance(order_uuid, str) or len(order_uuid) > 64:
+            raise ValueError("order_uuid must be a string of up to 64 characters")
+
+        # A retry of an order that was saved gets the order back, not a second charge
+        order = await self._read(self._order_document, order_uuid)
+        if order is not None:
+            return 200, order
+        shortages = await self._read(self._shortages, cart)
+        if shortages:
+            raise ApiError(409, "Sold out: " + ', '.join(sorted(shortages)))
+
+        _, _, total = cart_totals(cart)
+        pending = self.card_authorizer.start(to_cents(total), order_uuid)
+        result = pending.poll()
+        while result is None:
+            await asyncio.sleep(AUTH_POLL_SECONDS)
+            result = pending.poll()
+        if not result.approved:
+            raise ApiError(402, result.message)
+
+        try:
+            created = await self._write(self._save_order, order_uuid, cart, fulfilment, result.auth_code)
+        except (sqlite3.Error, ValueError):
+            self.card_authorizer.void(result.auth_code, order_uuid)
+            raise
+        if not created:
+            # Another submission of the same cart won the race
+            self.card_authorizer.void(result.auth_code, order_uuid)
+        return (201 if created else 200), await self._read(self._order_document, order_uuid)
+
+    def _current_menu(self):
+        return self.menu_cache.current(self._cursor())
+
+    def _shortages(self, cart):
+        return Inventory(self._cursor()).shortages(cart)
+
+    def _save_order(self, order_uuid, cart, fulfilment, auth_code):
+        """Runs on the write worker; returns whether the order was new"""
+        cursor = self._cursor()
+        if self.search_available is None:
+            self.search_available = init_order_search_tables(cursor)
+        subtotal, tax, total = cart_totals(cart)
+        try:
+            order_id, created = insert_order(cursor, order_uuid, None, str(cart), float(subtotal),
+                                             float(tax), float(total), to_cents(total))
+            if created:
+                record_online_order_effects(cursor, order_id, cart, fulfilment, auth_code,
+                                            self.search_available)
+            cursor.connection.commit()
+        except (sqlite3.Error, ValueError):
+            cursor.connection.rollback()
+            raise
+        return created
+
+    def _order_document(self, order_uuid):
+        """An order's net totals and status, or None if there's no such order"""
+        cursor = self._cursor()
+        order_id = find_order_by_uuid(cursor, order_uuid)
+        if order_id is None:
+            return None
+        order = OrderAdjuster(cursor, TAX_RATE).net_order(order_id)
+        tracked = OrderStatusTracker(cursor).get(order_id) or {}
+        return {
+            'order_id': order_id,
+            'order_uuid': order_uuid,
+            'items': [{'name': item['name'], 'price': str(item['price'])} for item in order['items']],
+            'subtotal': str(from_cents(order['subtotal_cents'])),
+            'tax': str(from_cents(order['tax_cents'])),
+            'total': str(from_cents(order['total_cents'])),
+            'created_at': order['created_at'],
+            'fulfilment': tracked.get('fulfilment'),
+            'status': 'cancelled' if order['voided'] else tracked.get('status'),
+            'promised_time': tracked.get('promised_time')
+        }
+
+
+async def load_test(host, port, requests, concurrency):
+    """Menu and quote requests over `concurrency` kept-alive connections; returns (ok, failed, seconds)"""
+    quote = {'items': [{'type': 'pizza', 'pizza': 'Pepperoni', 'size': 'large', 'quantity': 2},
+                       {'type': 'custom_pizza', 'size': 'medium',
+                        'toppings': [{'name': 'Bacon', 'placement': 'left'}]},
+                       {'type': 'drink', 'name': 'Pepsi'}]}
+    counts = {'ok': 0, 'failed': 0}
+    remaining = iter(range(requests))
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for number in remaining:
+                if number % 2:
+                    status, _, _ = await send_request(reader, writer, 'POST', '/quote', quote)
+                else:
+                    status, _, _ = await send_request(reader, writer, 'GET', '/menu')
+                counts['ok' if status == 200 else 'failed'] += 1
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return counts['ok'], counts['failed'], time.perf_counter() - started
+
+
+async def serve(db_path, host, port):
+    api = OrderApi(db_path)
+    port = await api.start(host, port)
+    print(f"Online ordering API on http://{host}:{port}/ (Ctrl+C to stop)")
+    try:
+        await api.server.serve_forever()
+    finally:
+        await api.stop()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Serve the online ordering API, or load test one")
+    parser.add_argument('--db', default='pizza_pos.db', help="Path to the store's database")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--load-test', type=int, metavar='REQUESTS',
+                        help="Send this many menu and quote requests to a running API")
+    parser.add_argument('--concurrency', type=int, default=200, help="Connections for --load-test")
+    args = parser.parse_args(argv)
+
+    if args.load_test:
+        ok, failed, seconds = asyncio.run(load_test(args.host, args.port, args.load_test, args.concurrency))
+        print(f"{ok} ok, {failed} failed in {seconds:.2f}s ({(ok + failed) / seconds:.0f} requests/s)")
+        return 1 if failed else 0
+
+    conn = sqlite3.connect(args.db)
+    try:
+        ready = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'order_tracking'").fetchone()
+    finally:
+        conn.close()
+    if not ready:
+        print(f"{args.db} has not been set up; start the till once first", file=sys.stderr)
+        return 1
+    try:
+        asyncio.run(serve(args.db, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
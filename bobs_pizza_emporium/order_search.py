@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Order Search for Bob's Pizza Emporium
+Full-text index over order items and staff, kept current as orders are placed
+"""
+
+import re
+import sqlite3
+
+from orders import query_orders
+
+RESULT_LIMIT = 200
+BACKFILL_CHUNK_SIZE = 500
+
+# Item names inside the stored repr of a cart
+_ITEM_NAME = re.compile(r"""'name': (['"])(.*?)\1""")
+
+
+def item_names_from_text(items_text):
+    """Extract item names from the items column of an order"""
+    return ' | '.join(match.group(2) for match in _ITEM_NAME.finditer(items_text or ''))
+
+
+def build_match(text='', staff=''):
+    """Build an FTS5 MATCH expression from free text and a staff name
+
+    Every word must appear, so "hawaiian large" finds "Hawaiian (Large)".
+    Words are quoted so user input is never parsed as FTS syntax, and
+    matched whole because prefix queries have to merge every expansion
+    of the prefix on a large index.
+    """
+    terms = ['items : "{}"'.format(word.replace('"', '""')) for word in text.split()]
+    terms += ['staff : "{}"'.format(word.replace('"', '""')) for word in staff.split()]
+    return ' AND '.join(terms)
+
+
+def init_order_search_tables(cursor):
+    """Create the order search index and queue a backfill of existing orders
+
+    The backfill itself runs in chunks through `OrderSearch.backfill_chunk`
+    so a large order history doesn't stall startup. Returns False when
+    this SQLite build has no FTS5 support.
+    """
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'order_search'")
+    created = cursor.fetchone() is None
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS order_search
+            USING fts5(items, staff, tokenize = 'unicode61')
+        ''')
+    except sqlite3.OperationalError:
+        return False
+
+    # Orders in [next_id, end_id) still need indexing; newer ones are indexed as placed
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_search_backfill (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            next_id INTEGER NOT NULL,
+            end_id INTEGER NOT NULL
+        )
+    ''')
+    if created:
+        cursor.execute('''
+            INSERT INTO order_search_backfill (id, next_id, end_id)
+            SELECT 1, MIN(id), MAX(id) + 1 FROM orders HAVING COUNT(*) > 0
+        ''')
+    return True
+
+
+class OrderSearch:
+    """Order lookups by number, item contents, staff and date"""
+
+    def __init__(self, cursor, available=True, archive=None):
+        self.cursor = cursor
+        self.available = available
+        self.archive = archive
+
+    def index_order(self, order_id, cart, staff):
+        """Add a new order to the index; the caller owns the transaction"""
+        if not self.available:
+            return
+        self.cursor.execute('''
+            INSERT INTO order_search (rowid, items, staff) VALUES (?, ?, ?)
+        ''', (order_id, ' | '.join(item['name'] for item in cart), staff))
+
+    def backfill_chunk(self, chunk_size=BACKFILL_CHUNK_SIZE):
+        """Index the next chunk of orders placed before the index existed
+
+        The caller owns the transaction. Returns True while more chunks remain.
+        """
+        if not self.available:
+            return False
+        self.cursor.execute('SELECT next_id, end_id FROM order_search_backfill WHERE id = 1')
+        row = self.cursor.fetchone()
+        if row is None:
+            return False
+
+        next_id, end_id = row
+        chunk_end = min(next_id + chunk_size, end_id)
+        self.cursor.connection.create_function('item_names', 1, item_names_from_text)
+        self.cursor.execute('''
+            INSERT INTO order_search (rowid, items, staff)
+            SELECT o.id, item_names(o.items), COALESCE(u.username, '')
+            FROM orders o
+            LEFT JOIN users u ON u.id = o.user_id
+            WHERE o.id >= ? AND o.id < ?
+        ''', (next_id, chunk_end))
+        if chunk_end >= end_id:
+            self.cursor.execute('DELETE FROM order_search_backfill WHERE id = 1')
+            return False
+        self.cursor.execute('UPDATE order_search_backfill SET next_id = ? WHERE id = 1', (chunk_end,))
+        return True
+
+    def get_order(self, order_id):
+        """Return (id, username, total, created_at, item names) for one order"""
+        rows = query_orders(self.cursor, self.archive, '''
+            SELECT o.id, u.username, o.total, o.created_at, o.items
+            FROM {orders} o
+            LEFT JOIN users u ON u.id = o.user_id
+            WHERE o.id = ?
+        ''', (order_id,), low_id=order_id, high_id=order_id)
+        if rows:
+            return rows[0][:4] + (item_names_from_text(rows[0][4]),)
+        return None
+
+    def order_id_range(self, date_from=None, date_to=None):
+        """Map a created_at range to an order id range
+
+        Ids grow with time, so a date window becomes a rowid window the
+        full-text index can seek on directly. The bounds are local times
+        and created_at is UTC, so they are converted before comparing.
+        """
+        low, high = 0, None
+        if date_from:
+            # One row per partition; the oldest of them is the first in range
+            rows = query_orders(self.cursor, self.archive, '''
+                SELECT id FROM {orders} WHERE created_at >= datetime(?, 'utc')
+                ORDER BY created_at, id LIMIT 1
+            ''', (date_from,), since=date_from)
+            if not rows:
+                return None
+            low = rows[-1][0]
+        if date_to:
+            rows = query_orders(self.cursor, self.archive, '''
+                SELECT id FROM {orders} WHERE created_at < datetime(?, 'utc')
+                ORDER BY created_at DESC, id DESC LIMIT 1
+            ''', (date_to,), until=date_to)
+            if not rows:
+                return None
+            high = rows[0][0]
+        return low, high
+
+    def search(self, text='', staff='', date_from=None, date_to=None, limit=RESULT_LIMIT):
+        """Return the newest matching orders as (id, username, total, created_at, item names)
+
+        `date_from` is inclusive and `date_to` exclusive, both as local
+        'YYYY-MM-DD[ HH:MM:SS]' strings.
+        """
+        id_range = self.order_id_range(date_from, date_to)
+        if id_range is None:
+            return []
+        low, high = id_range
+        match = build_match(text, staff)
+
+        if match and self.available:
+            conditions = ['order_search MATCH ?', 's.rowid >= ?']
+            params = [match, low]
+            if high is not None:
+                conditions.append('s.rowid <= ?')
+                params.append(high)
+            return query_orders(self.cursor, self.archive, f'''
+                SELECT o.id, u.username, o.total, o.created_at, s.items
+                FROM order_search s
+                JOIN {{orders}} o ON o.id = s.rowid
+                LEFT JOIN users u ON u.id = o.user_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY s.rowid DESC
+                LIMIT ?
+            ''', params, limit, low_id=low, high_id=high)
+
+        # Without FTS5 fall back to scanning the requested id window
+        conditions = ['o.id >= ?']
+        params = [low]
+        if high is not None:
+            conditions.append('o.id <= ?')
+            params.append(high)
+        for word in text.split():
+            conditions.append('o.items LIKE ?')
+            params.append(f'%{word}%')
+        for word in staff.split():
+            conditions.append('u.username = ? COLLATE NOCASE')
+            params.append(word)
+        rows = query_orders(self.cursor, self.archive, f'''
+            SELECT o.id, u.username, o.total, o.created_at, o.items
+            FROM {{orders}} o
+            LEFT JOIN users u ON u.id = o.user_id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY o.id DESC
+            LIMIT ?
+        ''', params, limit, low_id=low, high_id=high)
+        return [row[:4] + (item_names_from_text(row[4]),) for row in rows]
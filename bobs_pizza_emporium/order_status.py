@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Order Status Tracking for Bob's Pizza Emporium
+Pickup and delivery lifecycles with a change feed for the live order board
+"""
+
+import heapq
+
+# Lifecycle for each fulfilment type, in order
+LIFECYCLES = {
+    'pickup': ['received', 'baking', 'ready', 'picked_up'],
+    'delivery': ['received', 'baking', 'ready', 'out_for_delivery', 'delivered']
+}
+
+OPEN_STATUSES = ('received', 'baking', 'ready', 'out_for_delivery')
+
+# Minutes from order to promised pickup/delivery time
+PROMISE_MINUTES = {'pickup': 20, 'delivery': 45}
+
+
+def status_label(status):
+    """Display text for a status"""
+    return status.replace('_', ' ').title()
+
+
+def next_status(fulfilment, status):
+    """Return the status after `status`, or None when the order is complete or cancelled"""
+    lifecycle = LIFECYCLES[fulfilment]
+    if status not in lifecycle:
+        return None
+    index = lifecycle.index(status)
+    return lifecycle[index + 1] if index + 1 < len(lifecycle) else None
+
+
+def init_order_status_tables(cursor):
+    """Create order tracking and status history tables"""
+    # Current state of every order, one row each
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_tracking (
+            order_id INTEGER PRIMARY KEY,
+            fulfilment TEXT NOT NULL DEFAULT 'pickup',
+            status TEXT NOT NULL,
+            promised_time TIMESTAMP NOT NULL,
+            FOREIGN KEY (order_id) REFERENCES orders (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_order_tracking_status
+        ON order_tracking (status, promised_time)
+    ''')
+
+    # Every transition, append-only; its id doubles as the change feed cursor
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS order_status_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            user_id INTEGER,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_order_status_history_order
+        ON order_status_history (order_id)
+    ''')
+
+
+class OrderStatusTracker:
+    """Order lifecycle transitions and the change feed behind the order board
+
+    Promised times are stored in UTC like every other timestamp and
+    returned in local time for display.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.listeners = []
+
+    def subscribe(self, callback):
+        """Call `callback(change)` for every transition made through this tracker"""
+        self.listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def notify(self, change):
+        for callback in list(self.listeners):
+            callback(change)
+
+    def _record(self, order_id, status, user_id):
+        self.cursor.execute('''
+            INSERT INTO order_status_history (order_id, status, user_id)
+            VALUES (?, ?, ?)
+        ''', (order_id, status, user_id))
+
+    def start_order(self, order_id, fulfilment, user_id):
+        """Track a new order as received; the caller owns the transaction
+
+        Listeners are not notified until `publish` is called after commit.
+        """
+        self.cursor.execute('''
+            INSERT INTO order_tracking (order_id, fulfilment, status, promised_time)
+            VALUES (?, ?, 'received', datetime('now', ?))
+        ''', (order_id, fulfilment, f"+{PROMISE_MINUTES[fulfilment]} minutes"))
+        self._record(order_id, 'received', user_id)
+
+    def advance(self, order_id, user_id):
+        """Move an order to its next status; the caller owns the transaction
+
+        Returns the new status, or None if the order is already complete.
+        """
+        order = self.get(order_id)
+        if order is None:
+            return None
+        status = next_status(order['fulfilment'], order['status'])
+        if status is None:
+            return None
+        self.cursor.execute('UPDATE order_tracking SET status = ? WHERE order_id = ?',
+                            (status, order_id))
+        self._record(order_id, status, user_id)
+        return status
+
+    def cancel(self, order_id, user_id):
+        """Take a voided order off the board; the caller owns the transaction"""
+        self.cursor.execute("UPDATE order_tracking SET status = 'cancelled' WHERE order_id = ?",
+                            (order_id,))
+        if self.cursor.rowcount:
+            self._record(order_id, 'cancelled', user_id)
+
+    def publish(self, order_id):
+        """Notify listeners of an order's current state after a commit"""
+        order = self.get(order_id)
+        if order is not None:
+            self.notify(order)
+
+    def get(self, order_id):
+        """Return the tracked state of one order"""
+        self.cursor.execute('''
+            SELECT order_id, fulfilment, status, datetime(promised_time, 'localtime')
+            FROM order_tracking WHERE order_id = ?
+        ''', (order_id,))
+        row = self.cursor.fetchone()
+        return self._as_dict(row) if row else None
+
+    def open_orders(self):
+        """Every open order, soonest promise first
+
+        Each status is read already in promise order from the status
+        index and the runs are merged, so no temporary sort is needed.
+        """
+        runs = []
+        for status in OPEN_STATUSES:
+            self.cursor.execute('''
+                SELECT order_id, fulfilment, status, datetime(promised_time, 'localtime'), promised_time
+                FROM order_tracking
+                WHERE status = ?
+                ORDER BY promised_time, order_id
+            ''', (status,))
+            runs.append(self.cursor.fetchall())
+        return [self._as_dict(row) for row in heapq.merge(*runs, key=lambda row: (row[4], row[0]))]
+
+    def last_change_id(self):
+        """Id of the newest status change"""
+        self.cursor.execute('SELECT COALESCE(MAX(id), 0) FROM order_status_history')
+        return self.cursor.fetchone()[0]
+
+    def changes_since(self, change_id):
+        """Return (newest change id, changed orders) for transitions after `change_id`
+
+        Lets another till's board catch up by reading only the new history
+        rows instead of re-querying every open order.
+        """
+        self.cursor.execute('''
+            SELECT h.id, t.order_id, t.fulfilment, t.status, datetime(t.promised_time, 'localtime')
+            FROM order_status_history h
+            JOIN order_tracking t ON t.order_id = h.order_id
+            WHERE h.id > ?
+            ORDER BY h.id
+        ''', (change_id,))
+        changed = {}
+        for row in self.cursor.fetchall():
+            change_id = row[0]
+            changed[row[1]] = self._as_dict(row[1:])
+        return change_id, list(changed.values())
+
+    def data_version(self):
+        """Counter that changes whenever another connection commits to the database"""
+        self.cursor.execute('PRAGMA data_version')
+        return self.cursor.fetchone()[0]
+
+    @staticmethod
+    def _as_dict(row):
+        return {'order_id': row[0], 'fulfilment': row[1], 'status': row[2], 'promised_time': row[3]}
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Order Storage for Bob's Pizza Emporium
+Idempotent order inserts keyed by a client-generated order UUID
+"""
+
+import ast
+import uuid
+from decimal import Decimal
+
+
+def new_order_uuid():
+    """Key for a cart, generated once so every retry of its submission matches"""
+    return uuid.uuid4().hex
+
+
+def insert_order(cursor, order_uuid, user_id, items, subtotal, tax, total, total_cents, customer_id=None):
+    """Insert an order once per UUID; the caller owns the transaction
+
+    Returns (order id, created). A retry with a UUID that is already
+    stored inserts nothing and returns the existing order's id with
+    created=False, so the caller can skip its side effects.
+    """
+    cursor.execute('''
+        INSERT INTO orders (order_uuid, user_id, customer_id, items, subtotal, tax, total, total_cents)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (order_uuid) DO NOTHING
+    ''', (order_uuid, user_id, customer_id, items, subtotal, tax, total, total_cents))
+    if cursor.rowcount:
+        return cursor.lastrowid, True
+    return find_order_by_uuid(cursor, order_uuid), False
+
+
+def find_order_by_uuid(cursor, order_uuid):
+    """Return the id of the order with this UUID, or None"""
+    cursor.execute('SELECT id FROM orders WHERE order_uuid = ?', (order_uuid,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _literal(node):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.List):
+        return [_literal(element) for element in node.elts]
+    if isinstance(node, ast.Dict):
+        return {_literal(key): _literal(value) for key, value in zip(node.keys, node.values)}
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'Decimal'
+            and len(node.args) == 1 and not node.keywords):
+        return Decimal(_literal(node.args[0]))
+    raise ValueError(f"Unexpected {type(node).__name__} in stored order items")
+
+
+def parse_order_items(text):
+    """Read back the cart stored in orders.items without eval()"""
+    return _literal(ast.parse(text, mode='eval').body)
+
+
+def query_orders(cursor, archive, sql, params=(), limit=None, **bounds):
+    """Run a query naming the orders table as `{orders}`
+
+    On the hot table alone, or through an OrderArchive over every month
+    that could match when one is given (see OrderArchive.scan).
+    """
+    if archive is None:
+        cursor.execute(sql.format(orders='orders'), list(params) + ([limit] if limit is not None else []))
+        return cursor.fetchall()
+    return archive.scan(sql, params, limit, **bounds)
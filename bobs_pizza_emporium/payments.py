@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Payments for Bob's Pizza Emporium
+Cash and card tenders, card authorization off the UI thread and a local card simulator
+"""
+
+import os
+import random
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from shifts import to_cents
+
+TENDERS = ('cash', 'card')
+
+# Seconds the till waits for a card authorization before giving up
+AUTH_TIMEOUT = 15
+
+CARD_PROCESSOR_SETTING_ENV = 'PIZZA_POS_CARD_PROCESSOR'
+DEFAULT_CARD_PROCESSOR_SETTING = 'simulated'
+
+# Failure rates for 'simulated:faults', for rehearsing declines and hung authorizations
+SIMULATED_DECLINE_RATE = 0.1
+SIMULATED_HANG_RATE = 0.05
+
+AuthResult = namedtuple('AuthResult', 'approved auth_code message')
+
+
+def init_payment_tables(cursor):
+    """Create the payments table"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            tender TEXT NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            tendered_cents INTEGER,
+            change_cents INTEGER NOT NULL DEFAULT 0,
+            auth_code TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (order_id) REFERENCES orders (id)
+        )
+    ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_order ON payments (order_id)')
+
+
+def cash_change(total, tendered):
+    """Change due for a cash tender; raises ValueError if it doesn't cover the total"""
+    tendered = Decimal(tendered)
+    if tendered < total:
+        raise ValueError(f"${tendered} does not cover ${total}")
+    return (tendered - total).quantize(Decimal('0.01'))
+
+
+def record_payment(cursor, order_id, tender, amount, tendered=None, auth_code=None):
+    """Record a payment against an order; the caller owns the transaction"""
+    change = cash_change(amount, tendered) if tender == 'cash' and tendered is not None else Decimal('0')
+    cursor.execute('''
+        INSERT INTO payments (order_id, tender, amount_cents, tendered_cents, change_cents, auth_code)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (order_id, tender, to_cents(amount), None if tendered is None else to_cents(tendered),
+          to_cents(change), auth_code))
+    return cursor.lastrowid
+
+
+def payments_for_order(cursor, order_id):
+    """Return (tender, amount_cents, change_cents, auth_code) rows for an order
+
+    Refunds from adjustments are rows with negative amounts.
+    """
+    cursor.execute('''
+        SELECT tender, amount_cents, change_cents, auth_code FROM payments
+        WHERE order_id = ? ORDER BY id
+    ''', (order_id,))
+    return cursor.fetchall()
+
+
+class CardProcessor:
+    """Card processor interface
+
+    `authorize` may block for as long as the network does, so the till
+    only ever calls it through a CardAuthorizer.
+    """
+
+    def authorize(self, amount_cents, reference):
+        """Return an AuthResult for charging `amount_cents`; `reference` is the order UUID"""
+        raise NotImplementedError
+
+    def void(self, auth_code, reference):
+        """Release an authorization the till gave up waiting for, or a voided order's"""
+        raise NotImplementedError
+
+    def refund(self, auth_code, amount_cents, reference):
+        """Return part of an approved charge to the card"""
+        raise NotImplementedError
+
+
+class SimulatedCardProcessor(CardProcessor):
+    """Local stand-in for a card processor with latency, and declines and hangs if asked for"""
+
+    def __init__(self, latency=(0.3, 1.5), decline_rate=0, hang_rate=0, hang_seconds=60, seed=None):
+        self.latency = latency
+        self.decline_rate = decline_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.random = random.Random(seed)
+        self.voided = []
+        self.refunded = []
+
+    def authorize(self, amount_cents, reference):
+        roll = self.random.random()
+        time.sleep(self.random.uniform(*self.latency))
+        if roll < self.hang_rate:
+            time.sleep(self.hang_seconds)
+        if roll < self.hang_rate + self.decline_rate:
+            return AuthResult(False, None, "Card declined")
+        return AuthResult(True, f"SIM{self.random.randrange(10 ** 6):06d}", "Approved")
+
+    def void(self, auth_code, reference):
+        self.voided.append((auth_code, reference))
+
+    def refund(self, auth_code, amount_cents, reference):
+        self.refunded.append((auth_code, amount_cents, reference))
+
+
+def processor_from_setting(setting=None):
+    """Build the card processor from a setting, defaulting to $PIZZA_POS_CARD_PROCESSOR
+
+    'simulated' approves every card after a short delay; 'simulated:faults'
+    also declines some cards and hangs on a few.
+    """
+    setting = setting or os.environ.get(CARD_PROCESSOR_SETTING_ENV) or DEFAULT_CARD_PROCESSOR_SETTING
+    kind, _, option = setting.partition(':')
+    if kind == 'simulated' and not option:
+        return SimulatedCardProcessor()
+    if kind == 'simulated' and option == 'faults':
+        return SimulatedCardProcessor(decline_rate=SIMULATED_DECLINE_RATE, hang_rate=SIMULATED_HANG_RATE)
+    raise ValueError(f"Unknown card processor setting: {setting}")
+
+
+def void_in_background(processor, auth_code, reference):
+    """Void an authorization without holding up the till"""
+    threading.Thread(target=processor.void, args=(auth_code, reference),
+                     name='card-void', daemon=True).start()
+
+
+class PendingAuthorization:
+    """A card authorization running on a background thread"""
+
+    def __init__(self, processor, amount_cents, reference, timeout):
+        self.processor = processor
+        self.amount_cents = amount_cents
+        self.reference = reference
+        self.deadline = time.monotonic() + timeout
+        self.result = None
+        self.abandoned = False
+        self._lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='card-authorization', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            result = self.processor.authorize(self.amount_cents, self.reference)
+        except Exception as e:
+            result = AuthResult(False, None, f"Processor error: {e}")
+        with self._lock:
+            if not self.abandoned:
+                self.result = result
+                return
+        # The till has moved on; don't leave the customer's card on hold
+        if result.approved:
+            try:
+                self.processor.void(result.auth_code, self.reference)
+            except Exception:
+                pass
+
+    def cancel(self):
+        """Stop waiting; an approval that still arrives is voided"""
+        with self._lock:
+            self.abandoned = True
+            result = self.result
+        if result is not None and result.approved:
+            void_in_background(self.processor, result.auth_code, self.reference)
+
+    def poll(self):
+        """Return the AuthResult once known (or timed out), else None; never blocks"""
+        with self._lock:
+            if self.result is None and time.monotonic() >= self.deadline:
+                self.abandoned = True
+                self.result = AuthResult(False, None, "Authorization timed out")
+            return self.result
+
+
+class CardAuthorizer:
+    """Starts card authorizations that the UI polls instead of waiting on"""
+
+    def __init__(self, processor, timeout=AUTH_TIMEOUT):
+        self.processor = processor
+        self.timeout = timeout
+
+    def start(self, amount_cents, reference):
+        return PendingAuthorization(self.processor, amount_cents, reference, self.timeout)
+
+    def void(self, auth_code, reference):
+        void_in_background(self.processor, auth_code, reference)
+
+    def refund(self, auth_code, amount_cents, reference):
+        """Refund part of a charge without holding up the till"""
+        threading.Thread(target=self.processor.refund, args=(auth_code, amount_cents, reference),
+                         name='card-refund', daemon=True).start()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Permissions for Bob's Pizza Emporium
+Roles granting permissions, resolved once at login into a bitmask
+"""
+
+import enum
+
+
+class Permission(enum.IntFlag):
+    """One bit per gated action; bit values are stored, so only ever append"""
+    TAKE_ORDERS = 1
+    VIEW_OWN_SALES = 2
+    VOID_ORDERS = 4
+    EDIT_PRICES = 8
+    VIEW_REPORTS = 16
+    MANAGE_USERS = 32
+    MANAGE_INVENTORY = 64
+
+
+NO_PERMISSIONS = Permission(0)
+ALL_PERMISSIONS = Permission(sum(Permission))
+
+# Roles created with a new database
+DEFAULT_ROLES = {
+    'Manager': ALL_PERMISSIONS,
+    'Cashier': Permission.TAKE_ORDERS | Permission.VIEW_OWN_SALES,
+}
+
+
+def permission_label(permission):
+    """Display name, e.g. 'View reports'"""
+    return permission.name.replace('_', ' ').capitalize()
+
+
+def init_permission_tables(cursor):
+    """Create the roles, permissions and user-role tables and seed the defaults"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS permissions (
+            bit INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS roles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS role_permissions (
+            role_id INTEGER NOT NULL,
+            bit INTEGER NOT NULL,
+            PRIMARY KEY (role_id, bit),
+            FOREIGN KEY (role_id) REFERENCES roles (id),
+            FOREIGN KEY (bit) REFERENCES permissions (bit)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_roles (
+            user_id INTEGER NOT NULL,
+            role_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, role_id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (role_id) REFERENCES roles (id)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.executemany('INSERT OR IGNORE INTO permissions (bit, name) VALUES (?, ?)',
+                       [(int(permission), permission.name) for permission in Permission])
+
+    cursor.execute('SELECT COUNT(*) FROM roles')
+    if cursor.fetchone()[0] == 0:
+        for name, granted in DEFAULT_ROLES.items():
+            cursor.execute('INSERT INTO roles (name) VALUES (?)', (name,))
+            set_role_permissions(cursor, cursor.lastrowid, granted)
+
+
+def set_role_permissions(cursor, role_id, granted):
+    """Replace a role's permissions with the bits set in `granted`"""
+    cursor.execute('DELETE FROM role_permissions WHERE role_id = ?', (role_id,))
+    cursor.executemany('INSERT INTO role_permissions (role_id, bit) VALUES (?, ?)',
+                       [(role_id, int(permission)) for permission in Permission if permission & granted])
+
+
+def list_roles(cursor):
+    """Return (id, name) for every role"""
+    cursor.execute('SELECT id, name FROM roles ORDER BY name')
+    return cursor.fetchall()
+
+
+def find_role(cursor, name):
+    """Return the id of the role with this name, or None"""
+    cursor.execute('SELECT id FROM roles WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def user_role(cursor, user_id):
+    """Return the id of a user's role, or None"""
+    cursor.execute('SELECT role_id FROM user_roles WHERE user_id = ? ORDER BY role_id LIMIT 1', (user_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def assign_role(cursor, user_id, role_id):
+    """Give a user exactly one role; the caller owns the transaction"""
+    cursor.execute('DELETE FROM user_roles WHERE user_id = ?', (user_id,))
+    cursor.execute('INSERT INTO user_roles (user_id, role_id) VALUES (?, ?)', (user_id, role_id))
+
+
+def role_permissions(cursor, role_id):
+    """Permission bitmask a role grants"""
+    cursor.execute('SELECT COALESCE(SUM(bit), 0) FROM role_permissions WHERE role_id = ?', (role_id,))
+    return Permission(cursor.fetchone()[0])
+
+
+def load_permissions(cursor, user_id):
+    """Resolve every role a user holds into one bitmask
+
+    Run once at login; after that each check is a bitwise AND with no query.
+    """
+    cursor.execute('''
+        SELECT DISTINCT rp.bit FROM user_roles AS ur
+        JOIN role_permissions AS rp ON rp.role_id = ur.role_id
+        WHERE ur.user_id = ?
+    ''', (user_id,))
+    mask = NO_PERMISSIONS
+    for (bit,) in cursor.fetchall():
+        mask |= Permission(bit)
+    return mask
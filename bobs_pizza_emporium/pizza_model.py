@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Pizza Model for Bob's Pizza Emporium
+Custom pizza builds with crusts, sauces and half/whole toppings in a compact modifier vector
+"""
+
+from collections import Counter
+from decimal import Decimal, ROUND_HALF_UP
+
+SIZES = ('small', 'medium', 'large')
+
+# Choice lists are append-only: a build's code stores positions in them
+CRUSTS = ('Classic', 'Thin', 'Stuffed')
+SAUCES = ('Tomato', 'BBQ', 'Garlic')
+MODIFIERS = ('Pepperoni', 'Sausage', 'Bacon', 'Pineapple', 'Mushrooms', 'Onions', 'Extra Cheese')
+
+CRUST_PRICES = {'Classic': Decimal('0.00'), 'Thin': Decimal('0.00'), 'Stuffed': Decimal('2.00')}
+
+PLACEMENTS = ('whole', 'left', 'right')
+MAX_QUANTITY = 15  # per half; each half is a 4-bit field
+
+# Ingredients a build uses beyond its toppings
+SAUCE_INGREDIENTS = {'Tomato': 'Tomato Sauce', 'BBQ': 'BBQ Sauce', 'Garlic': 'Garlic Sauce'}
+MODIFIER_INGREDIENTS = {'Extra Cheese': 'Mozzarella'}
+
+
+class PizzaBuild:
+    """One custom pizza: size, crust, sauce and a modifier vector
+
+    The vector holds one byte per entry in MODIFIERS, with the left
+    half's quantity in the low nibble and the right half's in the high
+    nibble, so a whole topping sets both. Builds round-trip through a
+    short text code stored with the order.
+    """
+
+    __slots__ = ('size', 'crust', 'sauce', 'vector')
+
+    def __init__(self, size='medium', crust='Classic', sauce='Tomato', vector=None):
+        self.size = size
+        self.crust = crust
+        self.sauce = sauce
+        self.vector = bytearray(vector or bytes(len(MODIFIERS)))
+
+    def halves(self, modifier):
+        """Return (left, right) quantities of a modifier"""
+        value = self.vector[MODIFIERS.index(modifier)]
+        return value & 0x0F, value >> 4
+
+    def set_halves(self, modifier, left, right):
+        if not (0 <= left <= MAX_QUANTITY and 0 <= right <= MAX_QUANTITY):
+            raise ValueError(f"Quantity out of range for {modifier}")
+        self.vector[MODIFIERS.index(modifier)] = left | (right << 4)
+
+    def add(self, modifier, placement='whole', amount=1):
+        """Add (or with a negative amount, remove) a modifier on one half or the whole pizza"""
+        left, right = self.halves(modifier)
+        if placement in ('whole', 'left'):
+            left = max(left + amount, 0)
+        if placement in ('whole', 'right'):
+            right = max(right + amount, 0)
+        self.set_halves(modifier, min(left, MAX_QUANTITY), min(right, MAX_QUANTITY))
+
+    def modifiers(self):
+        """Yield (modifier, left, right) for every modifier on the pizza"""
+        for modifier, value in zip(MODIFIERS, self.vector):
+            if value:
+                yield modifier, value & 0x0F, value >> 4
+
+    def is_plain(self):
+        return not any(self.vector)
+
+    def price(self, size_prices, modifier_prices):
+        """Base price plus crust, with each half topping at half the topping price"""
+        total = size_prices[self.size] + CRUST_PRICES[self.crust]
+        for modifier, left, right in self.modifiers():
+            total += modifier_prices[modifier] * (left + right) / 2
+        return total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    def placement_lines(self):
+        """Topping lines for tickets, e.g. 'Pepperoni x2', 'Left: Ham'"""
+        lines = []
+        for modifier, left, right in self.modifiers():
+            if left == right:
+                lines.append(f"{modifier} x{left}" if left > 1 else modifier)
+                continue
+            for side, quantity in (('Left', left), ('Right', right)):
+                if quantity:
+                    lines.append(f"{side}: {modifier} x{quantity}" if quantity > 1 else f"{side}: {modifier}")
+        return lines
+
+    def describe(self):
+        """Cart and receipt name for the build"""
+        options = [self.size.title()]
+        if self.crust != CRUSTS[0]:
+            options.append(f"{self.crust} Crust")
+        if self.sauce != SAUCES[0]:
+            options.append(f"{self.sauce} Sauce")
+        toppings = ', '.join(self.placement_lines()) or 'Plain'
+        return f"Custom Pizza ({', '.join(options)}) - {toppings}"
+
+    def ingredient_usage(self):
+        """Ingredient portions the build uses; a half topping still takes a portion"""
+        usage = Counter({'Dough': 1, 'Mozzarella': 1, SAUCE_INGREDIENTS[self.sauce]: 1})
+        if self.crust == 'Stuffed':
+            usage['Mozzarella'] += 1
+        for modifier, left, right in self.modifiers():
+            usage[MODIFIER_INGREDIENTS.get(modifier, modifier)] += (left + right + 1) // 2
+        return usage
+
+    @property
+    def code(self):
+        """Compact text form, e.g. 'L10:2201' = large, thin, tomato, 2x pepperoni, left sausage"""
+        vector = bytes(self.vector).rstrip(b'\x00')
+        return (f"{self.size[0].upper()}{CRUSTS.index(self.crust)}{SAUCES.index(self.sauce)}:"
+                f"{vector.hex()}")
+
+    @classmethod
+    def from_code(cls, code):
+        header, _, vector = code.partition(':')
+        size = next(size for size in SIZES if size[0].upper() == header[0])
+        padded = bytes.fromhex(vector).ljust(len(MODIFIERS), b'\x00')
+        return cls(size, CRUSTS[int(header[1])], SAUCES[int(header[2])], padded)
+
+    def __eq__(self, other):
+        return isinstance(other, PizzaBuild) and self.code == other.code
+
+    def __repr__(self):
+        return f"PizzaBuild.from_code({self.code!r})"
@@ -8,12 +8,42 @@ import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog
 import sqlite3
 import datetime
+import bisect
 import os
 import sys
-from decimal import Decimal, ROUND_HALF_UP
+from decimal import Decimal
+
+from adjustments import AUDIT_ACTIONS, OrderAdjuster, init_adjustment_tables, record_daily
+from archive import ArchiveWorker, OrderArchive, archive_directory, init_archive_tables
+from audit import AuditLog, init_audit_tables, record as audit
+from backup import BACKUP_INTERVAL_MS, BackupWorker, init_journal_tables
+from customers import CustomerDirectory, format_phone, init_customer_tables
+from fast_entry import MenuTrie, ScanDetector, build_menu_entries, parse_entry
+from forecasting import DemandForecaster, init_forecast_tables, record_sales
+from inventory import Inventory, init_inventory_tables, menu_status
+from menu import (TAX_RATE, MenuCache, cart_totals, custom_pizza_item, drink_item, init_menu_tables,
+                  menu_cache_path, pizza_item, set_price)
+from loyalty import (MATERIALIZE_INTERVAL_MS, REWARD_POINTS, REWARD_VALUE, LoyaltyLedger,
+                     init_loyalty_tables, reward_item)
+from migrations import BackfillWorker, migrate, pending_backfills
+from online_api import ONLINE_STAFF
+from order_search import OrderSearch, init_order_search_tables
+from order_status import OPEN_STATUSES, OrderStatusTracker, init_order_status_tables, status_label
+from orders import find_order_by_uuid, insert_order, new_order_uuid
+from payments import (CardAuthorizer, cash_change, init_payment_tables, payments_for_order,
+                      processor_from_setting, record_payment)
+from permissions import (Permission, assign_role, find_role, init_permission_tables, list_roles,
+                         load_permissions, role_permissions, user_role)
+from pizza_model import CRUSTS, MODIFIER_INGREDIENTS, PLACEMENTS, SAUCES, PizzaBuild
+from receipts import ReceiptSpooler, build_receipt, printer_from_setting, receipt_job
+from shifts import ShiftTracker, from_cents, init_shift_tables, render_z_report, to_cents
+from store_sync import init_sync_tables
+from ui_scheduler import UIScheduler
+from user_directory import UserDirectory, init_user_directory_tables, matches_prefix, sort_key
 
 class PizzaPOSApp:
-    def __init__(self):
+    def __init__(self, db_path='pizza_pos.db'):
+        self.db_path = db_path
         self.root = tk.Tk()
         self.root.title("Bob's Pizza Emporium - Point of Sales System")
         self.root.geometry("1200x800")
@@ -44,44 +74,40 @@ class PizzaPOSApp:
         # Initialize database
         self.init_database()
         
-        # Current user and cart
+        # Redraws wait until Tk is idle so bursts of taps draw once; screen-only reads run off the Tk thread
+        self.ui = UIScheduler(self.root, self.db_path)
+        
+        # Current user, shift and cart
         self.current_user = None
+        self.current_shift = None
+        self.current_customer = None
         self.cart = []
+        self.cart_order_uuid = None  # idempotency key, kept across retries of one cart
+        self.processing_order = False
         self.total = Decimal('0.00')
-        self.tax_rate = Decimal('0.08')  # 8% tax rate
+        self.tax_rate = TAX_RATE
+        self.adjuster = OrderAdjuster(self.cursor, self.tax_rate)
         
-        # Pizza prices
-        self.pizza_prices = {
-            'small': Decimal('12.99'),
-            'medium': Decimal('15.99'),
-            'large': Decimal('18.99')
-        }
+        # Menu and prices, from the current menu version
+        self.menu_version = None
+        self.refresh_menu()
         
-        # Topping prices
-        self.topping_prices = {
-            'Pepperoni': Decimal('1.50'),
-            'Sausage': Decimal('1.50'),
-            'Bacon': Decimal('2.00'),
-            'Pineapple': Decimal('1.00'),
-            'Mushrooms': Decimal('1.00'),
-            'Onions': Decimal('1.00')
-        }
+        # Tells barcode scanner bursts apart from typing
+        self.scan_detector = ScanDetector()
         
-        # Drink prices
-        self.drink_prices = {
-            'Coca-Cola': Decimal('2.50'),
-            'Pepsi': Decimal('2.50'),
-            'Sprite': Decimal('2.50'),
-            'Water': Decimal('1.50'),
-            'Orange Juice': Decimal('3.00')
-        }
+        # Receipts print on a background thread to the printer set by $PIZZA_POS_PRINTER
+        printer, self.receipt_format = printer_from_setting()
+        self.receipt_spooler = ReceiptSpooler(printer)
+        
+        # Card payments authorize on a background thread with the processor set by $PIZZA_POS_CARD_PROCESSOR
+        self.card_authorizer = CardAuthorizer(processor_from_setting())
         
         # Show login screen
         self.show_login()
     
     def init_database(self):
         """Initialize SQLite database with required tables"""
-        self.conn = sqlite3.connect('pizza_pos.db')
+        self.conn = sqlite3.connect(self.db_path)
         self.cursor = self.conn.cursor()
         
         # Create users table
@@ -91,7 +117,8 @@ class PizzaPOSApp:
                 username TEXT UNIQUE NOT NULL,
                 pin TEXT NOT NULL,
                 is_admin BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                deleted_at TIMESTAMP
             )
         ''')
         
@@ -109,6 +136,9 @@ class PizzaPOSApp:
             )
         ''')
         
+        # Create roles and permissions
+        init_permission_tables(self.cursor)
+        
         # Create default admin user if not exists
         self.cursor.execute('SELECT COUNT(*) FROM users WHERE is_admin = 1')
         if self.cursor.fetchone()[0] == 0:
@@ -116,6 +146,7 @@ class PizzaPOSApp:
                 INSERT INTO users (username, pin, is_admin) 
                 VALUES ('admin', '1234', 1)
             ''')
+            assign_role(self.cursor, self.cursor.lastrowid, find_role(self.cursor, 'Manager'))
         
         # Create default regular user if not exists
         self.cursor.execute('SELECT COUNT(*) FROM users WHERE is_admin = 0')
@@ -124,8 +155,122 @@ class PizzaPOSApp:
                 INSERT INTO users (username, pin, is_admin) 
                 VALUES ('employee', '5678', 0)
             ''')
+            assign_role(self.cursor, self.cursor.lastrowid, find_role(self.cursor, 'Cashier'))
+        
+        # Create inventory tables and seed recipes
+        init_inventory_tables(self.cursor)
+        
+        # Create username search index
+        init_user_directory_tables(self.cursor)
+        
+        # Create order search index
+        search_available = init_order_search_tables(self.cursor)
+        
+        # Create shifts table
+        init_shift_tables(self.cursor)
+        
+        # Create payments table
+        init_payment_tables(self.cursor)
+        
+        # Create customers table
+        init_customer_tables(self.cursor)
+        
+        # Create the price list and its version counter
+        init_menu_tables(self.cursor)
+        
+        # Create loyalty points ledger
+        init_loyalty_tables(self.cursor)
+        
+        # Create audit log
+        init_audit_tables(self.cursor)
+        
+        # Create order adjustments and the daily totals rollup
+        init_adjustment_tables(self.cursor)
+        
+        # Catalog of monthly order archives
+        init_archive_tables(self.cursor)
         
+        # Create order status tables
+        init_order_status_tables(self.cursor)
+        
+        # Create hourly sales rollup for forecasting
+        init_forecast_tables(self.cursor)
+        
+        # Capture order and user changes for central sync
+        init_sync_tables(self.cursor)
+        
+        # Apply versioned schema migrations
+        migrate(self.cursor)
+        
+        # Journal order writes so a restore can roll a backup forward
+        init_journal_tables(self.cursor)
+        
+        self.conn.commit()
+        
+        # Long data backfills run in small chunks off the UI thread
+        self.backfill_worker = None
+        if pending_backfills(self.cursor):
+            self.backfill_worker = BackfillWorker(self.db_path).start()
+        
+        # Orders older than the last few months move to monthly archive databases
+        self.archive_worker = None
+        self.archive = OrderArchive(self.conn, archive_directory(self.db_path))
+        
+        self.menu_cache = MenuCache(menu_cache_path(self.db_path))
+        self.inventory = Inventory(self.cursor)
+        self.user_directory = UserDirectory(self.cursor)
+        self.order_search = OrderSearch(self.cursor, search_available, self.archive)
+        self.shifts = ShiftTracker(self.cursor)
+        self.customers = CustomerDirectory(self.cursor, self.archive)
+        self.loyalty = LoyaltyLedger(self.cursor)
+        self.audit_log = AuditLog(self.cursor)
+        self.order_tracker = OrderStatusTracker(self.cursor)
+        self.forecaster = DemandForecaster(self.cursor)
+        
+        # Index older orders a chunk at a time between UI events
+        self.root.after_idle(self.backfill_order_search)
+        
+        # Keep loyalty balance lookups short by rolling up the ledger now and then
+        self.root.after(MATERIALIZE_INTERVAL_MS, self.materialize_loyalty)
+        
+        # Online backups on a background thread
+        self.backup_worker = None
+        self.root.after(BACKUP_INTERVAL_MS, self.run_backup)
+    
+    def refresh_menu(self):
+        """Pick up a new menu version; prices and fast-entry codes are only rebuilt when it changed"""
+        snapshot = self.menu_cache.current(self.cursor)
+        if snapshot.version == self.menu_version:
+            return
+        self.menu_version = snapshot.version
+        self.pizza_prices = snapshot.pizza_prices
+        self.topping_prices = snapshot.topping_prices
+        self.drink_prices = snapshot.drink_prices
+        self.standard_pizzas = snapshot.standard_pizzas
+        self.menu_trie = MenuTrie(build_menu_entries(self.standard_pizzas, self.pizza_prices,
+                                                     self.drink_prices))
+    
+    def backfill_order_search(self):
+        """Index one chunk of pre-existing orders, rescheduling until done"""
+        more = self.order_search.backfill_chunk()
         self.conn.commit()
+        if more:
+            self.root.after(50, self.backfill_order_search)
+        elif not pending_backfills(self.cursor):
+            # Only archive orders once every backfill has seen them
+            self.archive_worker = ArchiveWorker(self.db_path).start()
+    
+    def materialize_loyalty(self):
+        """Roll new ledger entries into the loyalty balances, then reschedule"""
+        self.loyalty.materialize()
+        self.conn.commit()
+        self.root.after(MATERIALIZE_INTERVAL_MS, self.materialize_loyalty)
+    
+    def run_backup(self):
+        """Start a backup unless one is still running, then reschedule"""
+        if self.backup_worker is None or not self.backup_worker.running():
+            self.backup_worker = BackupWorker(self.db_path).start()
+        self.root.after(BACKUP_INTERVAL_MS, self.run_backup)
     
     def show_login(self):
         """Display login screen"""
@@ -191,6 +336,7 @@ class PizzaPOSApp:
         forgot_btn.pack(pady=5)
         
         # Bind Enter key to login
+        self.root.unbind('<Key>')
         self.root.bind('<Return>', lambda e: self.login())
         self.username_entry.focus()
     
@@ -210,22 +356,59 @@ class PizzaPOSApp:
         # Check credentials
         self.cursor.execute('''
             SELECT id, username, is_admin FROM users 
-            WHERE username = ? AND pin = ?
+            WHERE username = ? AND pin = ? AND deleted_at IS NULL
         ''', (username, pin))
         
         user = self.cursor.fetchone()
         
         if user:
+            # Resolved once here; every later check is a bitwise AND
+            permissions = load_permissions(self.cursor, user[0])
+            if not permissions:
+                messagebox.showerror("Error", "This account has no role. Ask a manager to assign one.")
+                self.pin_entry.delete(0, tk.END)
+                return
             self.current_user = {
                 'id': user[0],
                 'username': user[1],
-                'is_admin': bool(user[2])
+                'is_admin': bool(user[2]),
+                'permissions': permissions
             }
+            # Order-taking staff work in shifts
+            if self.can(Permission.TAKE_ORDERS):
+                self.current_shift = self.shifts.find_open_shift(self.current_user['id'])
+                if self.current_shift is None:
+                    self.current_shift = self.shifts.open_shift(self.current_user['id'],
+                                                                self.ask_opening_float())
+                self.conn.commit()
             self.show_main_screen()
         else:
             messagebox.showerror("Error", "Invalid username or PIN")
             self.pin_entry.delete(0, tk.END)
     
+    def can(self, permission):
+        """Check the logged-in user's permissions without a query"""
+        return bool(self.current_user and self.current_user['permissions'] & permission)
+    
+    def require(self, permission):
+        """Check a permission for a gated action, telling the user if it's missing"""
+        if self.can(permission):
+            return True
+        messagebox.showerror("Not Permitted", "Your role doesn't allow this.")
+        return False
+    
+    def ask_opening_float(self):
+        """Ask for the cash in the drawer at the start of a shift"""
+        while True:
+            amount = simpledialog.askstring("Opening Float",
+                                            "Enter cash in the drawer at the start of the shift:")
+            if not amount or not amount.strip():
+                return Decimal('0.00')
+            try:
+                return Decimal(amount.strip().lstrip('$'))
+            except ArithmeticError:
+                messagebox.showerror("Error", "Please enter a valid amount")
+    
     def forgot_password(self):
         """Handle forgot password functionality"""
         messagebox.showinfo("Password Reset", 
@@ -238,6 +421,10 @@ class PizzaPOSApp:
         for widget in self.root.winfo_children():
             widget.destroy()
         
+        # Enter belongs to the login screen only
+        self.root.unbind('<Return>')
+        self.root.unbind('<Key>')
+        
         # Main frame
         main_frame = tk.Frame(self.root, bg=self.colors['bg_primary'])
         main_frame.pack(fill='both', expand=True)
@@ -265,13 +452,33 @@ class PizzaPOSApp:
         content_frame = tk.Frame(main_frame, bg=self.colors['bg_primary'])
         content_frame.pack(fill='both', expand=True, padx=20, pady=20)
         
-        if self.current_user['is_admin']:
-            self.show_admin_view(content_frame)
-        else:
+        # Compose the screen from the panels the user's role permits
+        manages = self.can(Permission.MANAGE_USERS | Permission.EDIT_PRICES |
+                           Permission.VIEW_REPORTS | Permission.MANAGE_INVENTORY)
+        if self.can(Permission.TAKE_ORDERS):
             self.show_user_view(content_frame)
+            if manages:
+                tk.Button(header_frame, text="Manager Tools", font=('Arial', 10),
+                         bg=self.colors['bg_button'], fg=self.colors['text_button'],
+                         relief='raised', bd=2, command=self.show_manager_tools,
+                         activebackground=self.colors['bg_button_hover'],
+                         activeforeground=self.colors['text_button']).pack(side='right', padx=10, pady=15)
+        elif manages:
+            self.show_admin_view(content_frame)
+    
+    def show_manager_tools(self):
+        """Open the admin panels in their own window for staff who also take orders"""
+        window = tk.Toplevel(self.root)
+        window.title("Manager Tools")
+        window.geometry("900x600")
+        window.configure(bg=self.colors['bg_primary'])
+        self.show_admin_view(window)
     
     def show_user_view(self, parent):
         """Display user interface"""
+        # Another till may have changed prices since this screen was last shown
+        self.refresh_menu()
+        
         # Left frame - Menu
         menu_frame = tk.LabelFrame(parent, text="Menu", font=('Arial', 12, 'bold'),
                                   bg=self.colors['bg_primary'], fg=self.colors['text_primary'],
@@ -284,16 +491,10 @@ class PizzaPOSApp:
                                    relief='solid', bd=1)
         pizza_frame.pack(fill='x', padx=10, pady=10)
         
-        # Standard pizzas
-        standard_pizzas = [
-            ("Margherita", "Classic tomato and mozzarella"),
-            ("Pepperoni", "Pepperoni and mozzarella"),
-            ("Supreme", "Pepperoni, sausage, mushrooms, onions"),
-            ("Hawaiian", "Ham and pineapple"),
-            ("Meat Lovers", "Pepperoni, sausage, bacon")
-        ]
+        # Menu buttons keyed by menu item so stock flags can update them live
+        self.menu_buttons = {}
         
-        for pizza_name, description in standard_pizzas:
+        for pizza_name, description in self.standard_pizzas:
             pizza_btn = tk.Button(pizza_frame, text=f"{pizza_name}\n{description}",
                                 font=('Arial', 9), bg=self.colors['bg_secondary'], 
                                 fg=self.colors['text_button'], relief='raised', bd=2,
@@ -301,6 +502,8 @@ class PizzaPOSApp:
                                 activeforeground=self.colors['text_button'],
                                 command=lambda p=pizza_name: self.add_standard_pizza(p))
             pizza_btn.pack(fill='x', padx=5, pady=2)
+            self.menu_buttons[pizza_name] = (pizza_btn, f"{pizza_name}\n{description}",
+                                             self.colors['bg_secondary'])
         
         # Custom pizza button with enhanced styling
         custom_btn = tk.Button(pizza_frame, text="🍕 Custom Pizza", font=('Arial', 12, 'bold'),
@@ -310,6 +513,7 @@ class PizzaPOSApp:
                               activeforeground=self.colors['text_button'],
                               padx=10, pady=8)
         custom_btn.pack(fill='x', padx=5, pady=8)
+        self.menu_buttons['Custom Pizza'] = (custom_btn, "🍕 Custom Pizza", self.colors['bg_button'])
         
         # Drinks section
         drinks_frame = tk.LabelFrame(menu_frame, text="Drinks", font=('Arial', 10, 'bold'),
@@ -325,6 +529,7 @@ class PizzaPOSApp:
                                 activeforeground=self.colors['text_button'],
                                 command=lambda d=drink, p=price: self.add_drink(d, p))
             drink_btn.pack(fill='x', padx=5, pady=2)
+            self.menu_buttons[drink] = (drink_btn, f"{drink} - ${price}", self.colors['bg_secondary'])
         
         # Right frame - Cart and Order
         cart_frame = tk.LabelFrame(parent, text="Order Cart", font=('Arial', 12, 'bold'),
@@ -332,6 +537,27 @@ class PizzaPOSApp:
                                   relief='solid', bd=1)
         cart_frame.pack(side='right', fill='both', expand=True, padx=(10, 0))
         
+        # Fast entry: PLU codes such as "M2" or "2*L3 D1", typed or scanned, no dialogs
+        quick_frame = tk.Frame(cart_frame, bg=self.colors['bg_primary'])
+        quick_frame.pack(fill='x', padx=10, pady=(10, 0))
+        
+        tk.Label(quick_frame, text="Quick Entry:", font=('Arial', 10, 'bold'),
+                bg=self.colors['bg_primary'], fg=self.colors['text_primary']).pack(side='left')
+        
+        self.quick_entry = tk.Entry(quick_frame, font=('Arial', 12), relief='solid', bd=1)
+        self.quick_entry.pack(side='left', fill='x', expand=True, padx=5)
+        self.quick_entry.bind('<Return>', lambda e: self.quick_add())
+        self.quick_entry.bind('<Control-Return>', lambda e: self.process_order())
+        self.quick_entry.bind('<KeyRelease>', self.show_completions)
+        
+        self.quick_entry_hint = tk.Label(cart_frame, text="Codes: S/M/L + pizza #, D + drink #, 2*M2 for two",
+                                        font=('Arial', 9), anchor='w', bg=self.colors['bg_primary'],
+                                        fg=self.colors['text_secondary'])
+        self.quick_entry_hint.pack(fill='x', padx=10)
+        
+        # Scans made while another widget has focus
+        self.root.bind('<Key>', self.on_scanner_key)
+        
         # Cart list
         self.cart_listbox = tk.Listbox(cart_frame, font=('Arial', 10), height=15,
                                       bg=self.colors['bg_primary'], fg=self.colors['text_primary'],
@@ -356,6 +582,65 @@ class PizzaPOSApp:
                              activeforeground=self.colors['text_button'])
         clear_btn.pack(side='left', padx=5)
         
+        find_btn = tk.Button(cart_controls, text="Find Order", font=('Arial', 10),
+                            bg=self.colors['bg_button'], fg=self.colors['text_button'], 
+                            relief='raised', bd=2, command=self.search_orders,
+                            activebackground=self.colors['bg_button_hover'],
+                            activeforeground=self.colors['text_button'])
+        find_btn.pack(side='right', padx=5)
+        
+        board_btn = tk.Button(cart_controls, text="Order Board", font=('Arial', 10),
+                             bg=self.colors['bg_button'], fg=self.colors['text_button'], 
+                             relief='raised', bd=2, command=self.show_order_board,
+                             activebackground=self.colors['bg_button_hover'],
+                             activeforeground=self.colors['text_button'])
+        board_btn.pack(side='right', padx=5)
+        
+        if self.can(Permission.VIEW_OWN_SALES):
+            tk.Button(cart_controls, text="My Sales", font=('Arial', 10),
+                     bg=self.colors['bg_button'], fg=self.colors['text_button'],
+                     relief='raised', bd=2, command=self.show_my_sales,
+                     activebackground=self.colors['bg_button_hover'],
+                     activeforeground=self.colors['text_button']).pack(side='right', padx=5)
+        
+        # Pickup or delivery
+        fulfilment_frame = tk.Frame(cart_frame, bg=self.colors['bg_primary'])
+        fulfilment_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.fulfilment_var = tk.StringVar(value='pickup')
+        for value, label in (('pickup', "Pickup"), ('delivery', "Delivery")):
+            tk.Radiobutton(fulfilment_frame, text=label, value=value, variable=self.fulfilment_var,
+                          font=('Arial', 10), bg=self.colors['bg_primary'],
+                          fg=self.colors['text_primary']).pack(side='left', padx=5)
+        
+        # Caller lookup by phone number
+        customer_frame = tk.Frame(cart_frame, bg=self.colors['bg_primary'])
+        customer_frame.pack(fill='x', padx=10, pady=5)
+        
+        tk.Label(customer_frame, text="Customer Phone:", font=('Arial', 10, 'bold'),
+                bg=self.colors['bg_primary'], fg=self.colors['text_primary']).pack(side='left')
+        
+        self.phone_entry = tk.Entry(customer_frame, font=('Arial', 11), width=16, relief='solid', bd=1)
+        self.phone_entry.pack(side='left', padx=5)
+        self.phone_entry.bind('<Return>', lambda e: self.lookup_customer())
+        
+        tk.Button(customer_frame, text="Look Up", font=('Arial', 10),
+                 bg=self.colors['bg_button'], fg=self.colors['text_button'],
+                 relief='raised', bd=2, command=self.lookup_customer,
+                 activebackground=self.colors['bg_button_hover'],
+                 activeforeground=self.colors['text_button']).pack(side='left', padx=5)
+        
+        tk.Button(customer_frame, text="Redeem Points", font=('Arial', 10),
+                 bg=self.colors['bg_warning'], fg=self.colors['text_button'],
+                 relief='raised', bd=2, command=self.redeem_points,
+                 activebackground=self.colors['bg_warning'],
+                 activeforeground=self.colors['text_button']).pack(side='left', padx=5)
+        
+        self.customer_label = tk.Label(cart_frame, text="No customer", font=('Arial', 10),
+                                      anchor='w', bg=self.colors['bg_primary'],
+                                      fg=self.colors['text_secondary'])
+        self.customer_label.pack(fill='x', padx=10)
+        
         # Order summary
         summary_frame = tk.Frame(cart_frame, bg=self.colors['bg_primary'])
         summary_frame.pack(fill='x', padx=10, pady=10)
@@ -383,6 +668,227 @@ class PizzaPOSApp:
                                activeforeground=self.colors['text_button'],
                                padx=15, pady=12)
         process_btn.pack(fill='x', padx=10, pady=15)
+        
+        self.refresh_menu_availability()
+        self.quick_entry.focus()
+    
+    def quick_add(self):
+        """Add every item typed in the quick entry box"""
+        text = self.quick_entry.get()
+        if not text.strip():
+            return
+        try:
+            lines = parse_entry(text, self.menu_trie)
+        except ValueError as e:
+            self.quick_entry_hint.config(text=str(e), fg=self.colors['text_accent'])
+            return
+        if self.add_menu_entries(lines):
+            self.quick_entry.delete(0, tk.END)
+    
+    def show_completions(self, event):
+        """Show menu items matching the code or name being typed"""
+        if event.keysym in ('Return', 'KP_Enter'):
+            return
+        words = self.quick_entry.get().split()
+        prefix = words[-1].rsplit('*', 1)[-1] if words else ''
+        if not prefix:
+            self.quick_entry_hint.config(text="", fg=self.colors['text_secondary'])
+            return
+        matches = self.menu_trie.complete(prefix, limit=5)
+        self.quick_entry_hint.config(text="   ".join(f"{entry.code} {entry.label} ${entry.price}"
+                                                     for entry in matches) or "No match",
+                                     fg=self.colors['text_secondary'])
+    
+    def on_scanner_key(self, event):
+        """Ring up a barcode scanned while the quick entry box doesn't have focus"""
+        if event.widget in (self.quick_entry, self.phone_entry):
+            return
+        code = self.scan_detector.feed(event.char, event.time)
+        if code is None:
+            return
+        entry = self.menu_trie.exact(code)
+        if entry is None:
+            self.quick_entry_hint.config(text=f"Unknown item code: {code}", fg=self.colors['text_accent'])
+        else:
+            self.add_menu_entries([(1, entry)])
+    
+    def add_menu_entries(self, lines):
+        """Add (quantity, menu entry) pairs to the cart; returns False if any is sold out"""
+        sold_out = self.inventory.menu_status()[1]
+        unavailable = sorted({entry.label for _, entry in lines if entry.name in sold_out})
+        if unavailable:
+            self.quick_entry_hint.config(text="Sold out (86): " + ", ".join(unavailable),
+                                         fg=self.colors['text_accent'])
+            return False
+        
+        for quantity, entry in lines:
+            if entry.kind == 'pizza':
+                item = self.make_pizza_item(entry.name, entry.size)
+            else:
+                item = drink_item(entry.name, self.drink_prices)
+            self.cart.extend(dict(item) for _ in range(quantity))
+        self.update_cart_display()
+        self.quick_entry_hint.config(text="Added " + ", ".join(f"{quantity} x {entry.label}"
+                                                               for quantity, entry in lines),
+                                     fg=self.colors['text_secondary'])
+        return True
+    
+    def lookup_customer(self):
+        """Find the caller by phone number, offering to add them if they're new"""
+        phone = self.phone_entry.get().strip()
+        if not phone:
+            self.set_customer(None)
+            return
+        try:
+            customer = self.customers.find_by_phone(phone)
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid phone number.")
+            return
+        
+        if customer is None:
+            if not messagebox.askyesno("New Customer", f"No customer with phone {phone}.\n\nAdd them?"):
+                return
+            name = simpledialog.askstring("New Customer", "Customer name:")
+            if name is None:
+                return
+            address = simpledialog.askstring("New Customer", "Delivery address (blank for pickup):") or ''
+            self.customers.save(phone, name, address)
+            self.conn.commit()
+            customer = self.customers.find_by_phone(phone)
+        
+        self.set_customer(customer)
+        self.show_customer_orders(customer)
+    
+    def set_customer(self, customer):
+        """Attach a customer to the order being taken (None to clear)"""
+        # Points redeemed in the cart belong to the previous customer
+        if (customer or {}).get('id') != (self.current_customer or {}).get('id'):
+            rewards = [item for item in self.cart if item['type'] == 'reward']
+            if rewards:
+                self.cart = [item for item in self.cart if item['type'] != 'reward']
+                self.update_cart_display()
+        self.current_customer = customer
+        if customer is None:
+            self.phone_entry.delete(0, tk.END)
+            self.customer_label.config(text="No customer", fg=self.colors['text_secondary'])
+            return
+        details = [customer['name'] or "(no name)", format_phone(customer['phone'])]
+        if customer['address']:
+            details.append(customer['address'])
+        details.append(f"{self.loyalty.balance(customer['id'])} pts")
+        self.customer_label.config(text=" - ".join(details), fg=self.colors['text_primary'])
+    
+    def redeem_points(self):
+        """Add a loyalty reward discount to the cart"""
+        if self.current_customer is None:
+            messagebox.showwarning("No Customer", "Look up the customer by phone number first.")
+            return
+        if any(item['type'] == 'reward' for item in self.cart):
+            messagebox.showinfo("Redeem Points", "A reward is already applied to this order.")
+            return
+        balance = self.loyalty.balance(self.current_customer['id'])
+        available = balance // REWARD_POINTS
+        if not available:
+            messagebox.showinfo("Redeem Points",
+                                f"{balance} points. A ${REWARD_VALUE} reward needs {REWARD_POINTS} points.")
+            return
+        
+        # A reward can't take the order below zero
+        available = min(available, int(self.total // REWARD_VALUE))
+        if not available:
+            messagebox.showinfo("Redeem Points", f"Rewards apply to orders of ${REWARD_VALUE} or more.")
+            return
+        
+        rewards = simpledialog.askstring("Redeem Points",
+                                         f"{balance} points available.\n"
+                                         f"Each ${REWARD_VALUE} reward uses {REWARD_POINTS} points.\n\n"
+                                         f"Rewards to redeem (1-{available}):", initialvalue="1")
+        if not rewards:
+            return
+        if not rewards.strip().isdigit() or not 1 <= int(rewards) <= available:
+            messagebox.showerror("Error", f"Please enter a number from 1 to {available}.")
+            return
+        self.cart.append(reward_item(int(rewards)))
+        self.update_cart_display()
+    
+    def show_customer_orders(self, customer):
+        """List the customer's last orders with one-tap order again"""
+        orders = self.customers.recent_orders(customer['id'])
+        if not orders:
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"Recent Orders - {customer['name'] or format_phone(customer['phone'])}")
+        window.geometry("700x300")
+        window.configure(bg=self.colors['bg_primary'])
+        
+        orders_listbox = tk.Listbox(window, font=('Courier', 10),
+                                    bg=self.colors['bg_primary'], fg=self.colors['text_primary'],
+                                    relief='solid', bd=1)
+        orders_listbox.pack(fill='both', expand=True, padx=10, pady=10)
+        for order_id, created_at, total, items in orders:
+            names = ", ".join(item['name'] for item in items)
+            orders_listbox.insert(tk.END, f"#{order_id:<7} {created_at}  ${total:>8.2f}  {names}")
+        orders_listbox.selection_set(0)
+        
+        def order_again():
+            selection = orders_listbox.curselection()
+            if selection:
+                window.destroy()
+                self.order_again(orders[selection[0]][3])
+        
+        orders_listbox.bind('<Double-Button-1>', lambda e: order_again())
+        tk.Button(window, text="Order Again", font=('Arial', 12, 'bold'),
+                 bg=self.colors['bg_success'], fg=self.colors['text_button'],
+                 relief='raised', bd=2, command=order_again,
+                 activebackground=self.colors['bg_success'],
+                 activeforeground=self.colors['text_button']).pack(pady=10)
+    
+    def order_again(self, items):
+        """Rebuild a past order's items in the cart at today's prices"""
+        pizza_names = {name for name, _ in self.standard_pizzas}
+        sold_out = self.inventory.menu_status()[1]
+        skipped = []
+        for item in items:
+            if item['type'] == 'reward':
+                continue
+            if item.get('pizza', item['name']) in sold_out:
+                skipped.append(f"{item['name']} (sold out)")
+            elif item['type'] == 'pizza' and item.get('pizza') in pizza_names:
+                self.cart.append(self.make_pizza_item(item['pizza'], item['size']))
+            elif item['type'] == 'custom_pizza' and 'build' in item:
+                self.cart.append(self.make_custom_pizza_item(PizzaBuild.from_code(item['build'])))
+            elif item['type'] == 'drink' and item['name'] in self.drink_prices:
+                self.cart.append(drink_item(item['name'], self.drink_prices))
+            else:
+                # No longer on the menu, or a custom pizza from before builds were stored
+                skipped.append(item['name'])
+        self.update_cart_display()
+        if skipped:
+            self.quick_entry_hint.config(text="Not re-added: " + ", ".join(skipped),
+                                         fg=self.colors['text_accent'])
+    
+    def refresh_menu_availability(self):
+        """Flag low-stock menu items and disable sold-out (86'd) ones, reading stock off the Tk thread"""
+        buttons = self.menu_buttons
+        
+        def show(status):
+            # Skip it if the menu has been rebuilt since
+            if self.menu_buttons is buttons:
+                self.show_menu_availability(*status)
+        
+        self.ui.run_in_background(menu_status, show)
+    
+    def show_menu_availability(self, low_stock, sold_out):
+        for menu_item, (button, text, bg) in self.menu_buttons.items():
+            if menu_item in sold_out:
+                button.config(text=f"{text}\n(86 - SOLD OUT)", state='disabled',
+                              bg=self.colors['bg_danger'])
+            elif menu_item in low_stock:
+                button.config(text=f"{text}\n(Low stock)", state='normal',
+                              bg=self.colors['bg_warning'])
+            else:
+                button.config(text=text, state='normal', bg=bg)
     
     def show_admin_view(self, parent):
         """Display admin interface"""
@@ -392,17 +898,64 @@ class PizzaPOSApp:
                                    fg=self.colors['text_primary'], relief='solid', bd=1)
         admin_frame.pack(fill='both', expand=True)
         
-        # User management
+        if self.can(Permission.MANAGE_USERS):
+            self.show_user_management(admin_frame)
+        
+        # System settings
+        settings_frame = tk.LabelFrame(admin_frame, text="System Settings", 
+                                      font=('Arial', 10, 'bold'), bg=self.colors['bg_primary'],
+                                      fg=self.colors['text_primary'], relief='solid', bd=1)
+        settings_frame.pack(fill='x', padx=10, pady=10)
+        
+        panels = [
+            (Permission.EDIT_PRICES, "Configure Prices", self.configure_prices),
+            (Permission.VIEW_REPORTS, "View Orders", self.view_orders),
+            (Permission.VIEW_REPORTS, "Search Orders", self.search_orders),
+            (Permission.VIEW_REPORTS, "Order Board", self.show_order_board),
+            (Permission.VIEW_REPORTS, "Prep Plan", self.show_prep_plan),
+            (Permission.MANAGE_INVENTORY, "Inventory", self.view_inventory),
+            (Permission.MANAGE_USERS, "Audit Log", self.view_audit_log),
+        ]
+        for permission, text, command in panels:
+            if self.can(permission):
+                tk.Button(settings_frame, text=text, font=('Arial', 10),
+                         bg=self.colors['bg_button'], fg=self.colors['text_button'], 
+                         relief='raised', bd=2, command=command,
+                         activebackground=self.colors['bg_button_hover'],
+                         activeforeground=self.colors['text_button']).pack(side='left', padx=10, pady=10)
+    
+    def show_user_management(self, admin_frame):
+        """User list and account controls"""
         user_mgmt_frame = tk.LabelFrame(admin_frame, text="User Management", 
                                         font=('Arial', 10, 'bold'), bg=self.colors['bg_primary'],
                                         fg=self.colors['text_primary'], relief='solid', bd=1)
         user_mgmt_frame.pack(fill='x', padx=10, pady=10)
         
-        # User list
-        self.user_listbox = tk.Listbox(user_mgmt_frame, font=('Arial', 10), height=8,
+        # User search (incremental prefix match)
+        search_frame = tk.Frame(user_mgmt_frame, bg=self.colors['bg_primary'])
+        search_frame.pack(fill='x', padx=10, pady=(5, 0))
+        
+        tk.Label(search_frame, text="Search:", font=('Arial', 10), 
+                bg=self.colors['bg_primary'], fg=self.colors['text_primary']).pack(side='left')
+        self.user_search_var = tk.StringVar()
+        user_search_entry = tk.Entry(search_frame, font=('Arial', 10), width=25,
+                                     textvariable=self.user_search_var,
+                                     relief='solid', bd=1, bg=self.colors['bg_primary'],
+                                     fg=self.colors['text_primary'])
+        user_search_entry.pack(side='left', padx=5)
+        user_search_entry.bind('<KeyRelease>', lambda e: self.load_users())
+        
+        # User list (rows are fetched a page at a time as the list scrolls)
+        list_frame = tk.Frame(user_mgmt_frame, bg=self.colors['bg_primary'])
+        list_frame.pack(fill='x', padx=10, pady=5)
+        
+        self.user_scrollbar = tk.Scrollbar(list_frame, command=self.user_listbox_yview)
+        self.user_scrollbar.pack(side='right', fill='y')
+        
+        self.user_listbox = tk.Listbox(list_frame, font=('Arial', 10), height=8,
                                       bg=self.colors['bg_primary'], fg=self.colors['text_primary'],
-                                      relief='solid', bd=1)
-        self.user_listbox.pack(fill='x', padx=10, pady=5)
+                                      relief='solid', bd=1, yscrollcommand=self.on_user_list_scroll)
+        self.user_listbox.pack(side='left', fill='x', expand=True)
         
         # User controls
         user_controls = tk.Frame(user_mgmt_frame, bg=self.colors['bg_primary'])
@@ -432,24 +985,6 @@ class PizzaPOSApp:
                  activebackground=self.colors['bg_warning'],
                  activeforeground=self.colors['text_button']).pack(side='left', padx=5)
         
-        # System settings
-        settings_frame = tk.LabelFrame(admin_frame, text="System Settings", 
-                                      font=('Arial', 10, 'bold'), bg=self.colors['bg_primary'],
-                                      fg=self.colors['text_primary'], relief='solid', bd=1)
-        settings_frame.pack(fill='x', padx=10, pady=10)
-        
-        tk.Button(settings_frame, text="Configure Prices", font=('Arial', 10),
-                 bg=self.colors['bg_button'], fg=self.colors['text_button'], 
-                 relief='raised', bd=2, command=self.configure_prices,
-                 activebackground=self.colors['bg_button_hover'],
-                 activeforeground=self.colors['text_button']).pack(side='left', padx=10, pady=10)
-        
-        tk.Button(settings_frame, text="View Orders", font=('Arial', 10),
-                 bg=self.colors['bg_button'], fg=self.colors['text_button'], 
-                 relief='raised', bd=2, command=self.view_orders,
-                 activebackground=self.colors['bg_button_hover'],
-                 activeforeground=self.colors['text_button']).pack(side='left', padx=10, pady=10)
-        
         # Load users
         self.load_users()
     
@@ -458,19 +993,15 @@ class PizzaPOSApp:
         size = simpledialog.askstring("Pizza Size", "Enter size (small/medium/large):", 
                                      initialvalue="medium")
         if size and size.lower() in self.pizza_prices:
-            size = size.lower()
-            price = self.pizza_prices[size]
-            item = {
-                'type': 'pizza',
-                'name': f"{pizza_name} ({size.title()})",
-                'price': price,
-                'size': size
-            }
-            self.cart.append(item)
+            self.cart.append(self.make_pizza_item(pizza_name, size.lower()))
             self.update_cart_display()
         elif size:
             messagebox.showerror("Error", "Invalid size. Please enter small, medium, or large.")
     
+    def make_pizza_item(self, pizza_name, size):
+        """Cart item for a standard pizza"""
+        return pizza_item(pizza_name, size, self.pizza_prices)
+    
     def create_custom_pizza(self):
         """Create custom pizza dialog inspired by the image design"""
         dialog = tk.Toplevel(self.root)
@@ -554,6 +1085,20 @@ class PizzaPOSApp:
         # Highlight medium by default
         self.size_buttons['medium'].config(bg=self.colors['bg_button'])
         
+        # Crust and sauce
+        self.selected_crust = tk.StringVar(value=CRUSTS[0])
+        self.selected_sauce = tk.StringVar(value=SAUCES[0])
+        for label, variable, choices in (("Crust", self.selected_crust, CRUSTS),
+                                         ("Sauce", self.selected_sauce, SAUCES)):
+            option_frame = tk.Frame(sidebar_frame, bg=self.colors['bg_sidebar'])
+            option_frame.pack(fill='x', padx=20, pady=2)
+            tk.Label(option_frame, text=label, font=('Arial', 11, 'bold'), width=6, anchor='w',
+                    bg=self.colors['bg_sidebar'], fg=self.colors['text_light']).pack(side='left')
+            tk.OptionMenu(option_frame, variable, *choices,
+                          command=lambda _: self.ui.invalidate('current_pizza',
+                                                               self.update_current_pizza_display)
+                          ).pack(side='left', fill='x', expand=True)
+        
         # Add to Order button
         add_to_order_btn = tk.Button(sidebar_frame, text="Add to Order", font=('Arial', 14, 'bold'),
                                    bg=self.colors['bg_success'], fg=self.colors['text_button'], 
@@ -571,18 +1116,28 @@ class PizzaPOSApp:
         toppings_title = tk.Label(toppings_frame, text="Select Toppings", 
                                  font=('Arial', 18, 'bold'), bg=self.colors['bg_secondary'], 
                                  fg=self.colors['text_primary'])
-        toppings_title.pack(pady=20)
+        toppings_title.pack(pady=(20, 5))
+        
+        # Where the next +/- applies: the whole pizza or one half
+        placement_frame = tk.Frame(toppings_frame, bg=self.colors['bg_secondary'])
+        placement_frame.pack()
+        self.topping_placement = tk.StringVar(value='whole')
+        for placement in PLACEMENTS:
+            tk.Radiobutton(placement_frame, text=f"{placement.title()}", value=placement,
+                          variable=self.topping_placement, font=('Arial', 11, 'bold'),
+                          bg=self.colors['bg_secondary'],
+                          fg=self.colors['text_primary']).pack(side='left', padx=10)
         
         # Toppings grid (2 columns, 3 rows like in the image)
         toppings_grid = tk.Frame(toppings_frame, bg=self.colors['bg_secondary'])
         toppings_grid.pack(expand=True, padx=20, pady=20)
         
-        self.selected_toppings = {}
+        self.current_build = PizzaBuild()
         self.topping_counts = {}
+        sold_out_toppings = self.inventory.sold_out_ingredients()
         
         # Create topping buttons with +/- controls and icons (like in the image)
         toppings = list(self.topping_prices.keys())
-        print(f"DEBUG: Toppings list: {toppings}")  # Debug line
         
         # Topping icons based on the image descriptions
         topping_icons = {
@@ -591,13 +1146,13 @@ class PizzaPOSApp:
             'Mushrooms': '🍄',       # Mushroom cap
             'Onions': '🧅',          # Purple onion
             'Sausage': '🌭',         # Sausage link
-            'Pineapple': '🍍'        # Pineapple chunk
+            'Pineapple': '🍍',       # Pineapple chunk
+            'Extra Cheese': '🧀'     # Cheese wedge
         }
         
         for i, topping in enumerate(toppings):
             row = i // 2
             col = i % 2
-            print(f"DEBUG: Creating buttons for topping: {topping} at row {row}, col {col}")  # Debug line
             
             # Topping button frame
             topping_frame = tk.Frame(toppings_grid, bg=self.colors['topping_bg'], 
@@ -649,10 +1204,12 @@ class PizzaPOSApp:
                                 activebackground=self.colors['bg_button_hover'],
                                 activeforeground=self.colors['text_button'])
             plus_btn.pack(side='left', padx=5)
+            if MODIFIER_INGREDIENTS.get(topping, topping) in sold_out_toppings:
+                plus_btn.config(state='disabled')
+                topping_label.config(text=f"{topping} (86)", fg=self.colors['text_accent'])
             
             # Store references
             self.topping_counts[topping] = count_label
-            print(f"DEBUG: Stored count label for {topping}")  # Debug line
         
         # Configure grid weights
         toppings_grid.columnconfigure(0, weight=1)
@@ -671,57 +1228,53 @@ class PizzaPOSApp:
     def select_size(self, size):
         """Select pizza size and update visual feedback"""
         self.selected_size.set(size)
-        # Reset all buttons to default color
+        self.ui.invalidate('size_buttons', self.update_size_buttons)
+        self.ui.invalidate('current_pizza', self.update_current_pizza_display)
+    
+    def update_size_buttons(self):
+        """Highlight the selected size"""
+        size = self.selected_size.get()
         for s, btn in self.size_buttons.items():
-            btn.config(bg=self.colors['bg_secondary'])
-        # Highlight selected size
-        self.size_buttons[size].config(bg=self.colors['bg_button'])
-        self.update_current_pizza_display()
+            btn.config(bg=self.colors['bg_button'] if s == size else self.colors['bg_secondary'])
     
     def increase_topping(self, topping):
-        """Increase topping count"""
-        print(f"DEBUG: increase_topping called with: {topping}")  # Debug line
-        print(f"DEBUG: topping_counts keys: {list(self.topping_counts.keys())}")  # Debug line
-        if topping not in self.selected_toppings:
-            self.selected_toppings[topping] = 0
-        self.selected_toppings[topping] += 1
-        if topping in self.topping_counts:
-            self.topping_counts[topping].config(text=str(self.selected_toppings[topping]))
-            print(f"DEBUG: Updated count for {topping} to {self.selected_toppings[topping]}")  # Debug line
-        else:
-            print(f"DEBUG: ERROR - {topping} not found in topping_counts!")  # Debug line
-        self.update_current_pizza_display()
+        """Add a topping to the selected half, or the whole pizza"""
+        self.change_topping(topping, 1)
     
     def decrease_topping(self, topping):
-        """Decrease topping count"""
-        if topping not in self.selected_toppings:
-            self.selected_toppings[topping] = 0
-        if self.selected_toppings[topping] > 0:
-            self.selected_toppings[topping] -= 1
-            self.topping_counts[topping].config(text=str(self.selected_toppings[topping]))
-            self.update_current_pizza_display()
+        """Take a topping off the selected half, or the whole pizza"""
+        self.change_topping(topping, -1)
+    
+    def change_topping(self, topping, amount):
+        """Adjust a topping's quantity where the placement selector points"""
+        self.current_build.add(topping, self.topping_placement.get(), amount)
+        self.ui.invalidate(('topping_count', topping), lambda: self.update_topping_count(topping))
+        self.ui.invalidate('current_pizza', self.update_current_pizza_display)
+    
+    def update_topping_count(self, topping):
+        left, right = self.current_build.halves(topping)
+        self.topping_counts[topping].config(text=str(left) if left == right else f"{left}|{right}")
+    
+    def selected_build(self):
+        """The pizza being built, with the dialog's size, crust and sauce applied"""
+        build = self.current_build
+        build.size = self.selected_size.get()
+        build.crust = self.selected_crust.get()
+        build.sauce = self.selected_sauce.get()
+        return build
     
     def update_current_pizza_display(self):
         """Update the current pizza display in the sidebar"""
+        build = self.selected_build()
         self.current_toppings_text.config(state='normal')
         self.current_toppings_text.delete('1.0', tk.END)
         
-        # Show selected size
-        size_text = f"Size: {self.selected_size.get().title()}\n\n"
-        self.current_toppings_text.insert('1.0', size_text)
-        
-        # Show selected toppings
-        toppings_text = "Toppings:\n"
-        has_toppings = False
-        for topping, count in self.selected_toppings.items():
-            if count > 0:
-                has_toppings = True
-                toppings_text += f"• {topping} x{count}\n"
-        
-        if not has_toppings:
-            toppings_text += ""
+        lines = [f"Size: {build.size.title()}", f"Crust: {build.crust}", f"Sauce: {build.sauce}",
+                 "", "Toppings:"]
+        lines += [f"• {line}" for line in build.placement_lines()]
+        lines += ["", f"Price: ${build.price(self.pizza_prices, self.topping_prices)}"]
         
-        self.current_toppings_text.insert(tk.END, toppings_text)
+        self.current_toppings_text.insert('1.0', "\n".join(lines))
         self.current_toppings_text.config(state='disabled')
     
     def add_pizza_to_order(self, dialog):
@@ -733,13 +1286,7 @@ class PizzaPOSApp:
             return
         
         # Check if at least one topping is selected
-        has_toppings = False
-        for topping, count in self.selected_toppings.items():
-            if count > 0:
-                has_toppings = True
-                break
-        
-        if not has_toppings:
+        if self.current_build.is_plain():
             messagebox.showwarning("Toppings Required", "Please select at least one topping before adding to order.")
             return
         
@@ -748,42 +1295,14 @@ class PizzaPOSApp:
     
     def add_custom_pizza(self, dialog):
         """Add custom pizza to cart"""
-        size = self.selected_size.get()
-        base_price = self.pizza_prices[size]
-        
-        toppings = []
-        topping_price = Decimal('0.00')
-        
-        # Group toppings by name and calculate total price
-        topping_groups = {}
-        for topping, count in self.selected_toppings.items():
-            if count > 0:
-                topping_groups[topping] = count
-                # Add topping price for each quantity
-                for _ in range(count):
-                    topping_price += self.topping_prices[topping]
-        
-        total_price = base_price + topping_price
-        
-        # Create descriptive name with grouped toppings
-        if topping_groups:
-            topping_names = [f"{topping} x{count}" for topping, count in topping_groups.items()]
-            pizza_name = f"Custom Pizza ({size.title()}) - {', '.join(topping_names)}"
-        else:
-            pizza_name = f"Custom Pizza ({size.title()}) - Plain"
-        
-        item = {
-            'type': 'custom_pizza',
-            'name': pizza_name,
-            'price': total_price,
-            'size': size,
-            'toppings': list(topping_groups.keys())  # Store unique topping names
-        }
-        
-        self.cart.append(item)
+        self.cart.append(self.make_custom_pizza_item(self.selected_build()))
         self.update_cart_display()
         dialog.destroy()
     
+    def make_custom_pizza_item(self, build):
+        """Cart item for a custom pizza build"""
+        return custom_pizza_item(build, self.pizza_prices, self.topping_prices)
+    
     def add_drink(self, drink_name, price):
         """Add drink to cart"""
         item = {
@@ -795,19 +1314,22 @@ class PizzaPOSApp:
         self.update_cart_display()
     
     def update_cart_display(self):
-        """Update cart display and totals"""
+        """Update the cart's totals now and its display once Tk is idle"""
+        # A changed cart is a different order, so it gets a fresh idempotency key
+        self.cart_order_uuid = None
+        self.total = cart_totals(self.cart, self.tax_rate)[0]
+        self.ui.invalidate('cart', self.draw_cart)
+    
+    def draw_cart(self):
+        """Redraw the cart list and totals"""
         self.cart_listbox.delete(0, tk.END)
-        self.total = Decimal('0.00')
         
         for item in self.cart:
             display_text = f"{item['name']} - ${item['price']}"
             self.cart_listbox.insert(tk.END, display_text)
-            self.total += item['price']
         
         # Calculate tax and total
-        tax = self.total * self.tax_rate
-        tax = tax.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        final_total = self.total + tax
+        _, tax, final_total = cart_totals(self.cart, self.tax_rate)
         
         # Update labels
         self.subtotal_label.config(text=f"Subtotal: ${self.total}")
@@ -829,48 +1351,393 @@ class PizzaPOSApp:
             self.update_cart_display()
     
     def process_order(self):
-        """Process the order"""
+        """Confirm the cart, then take payment for it"""
+        # A second press while this order is still being paid for does nothing
+        if self.processing_order:
+            return
         if not self.cart:
             messagebox.showwarning("Empty Cart", "Your cart is empty. Please add items before processing.")
             return
+        if self.total < 0:
+            messagebox.showwarning("Reward Too Large", "The loyalty reward is more than the order. Remove it first.")
+            return
         
         # Calculate final total
-        tax = self.total * self.tax_rate
-        tax = tax.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-        final_total = self.total + tax
+        _, tax, final_total = cart_totals(self.cart, self.tax_rate)
         
         # Confirm order
-        order_summary = f"Order Total: ${final_total}\n\nItems:\n"
-        for item in self.cart:
-            order_summary += f"• {item['name']} - ${item['price']}\n"
+        order_summary = "\n".join([f"Order Total: ${final_total}", "", "Items:"] +
+                                  [f"• {item['name']} - ${item['price']}" for item in self.cart])
+        
+        # Warn before committing an order the kitchen can't make from stock
+        shortages = self.inventory.shortages(self.cart)
+        if shortages:
+            lines = [f"• {name}: need {needed}, have {max(stock, 0)}"
+                     for name, (needed, stock) in sorted(shortages.items())]
+            if not messagebox.askyesno("Not Enough Stock",
+                                       "Not enough stock for this order:\n" + "\n".join(lines) +
+                                       "\n\nProcess it anyway?"):
+                return
         
         if messagebox.askyesno("Confirm Order", f"{order_summary}\n\nProcess this order?"):
+            # The cart keeps its key across retries, so a resubmission can't insert it twice
+            if self.cart_order_uuid is None:
+                self.cart_order_uuid = new_order_uuid()
+            order_id = find_order_by_uuid(self.cursor, self.cart_order_uuid)
+            if order_id is not None:
+                messagebox.showinfo("Already Processed", f"This cart was already saved as order #{order_id}.")
+                self.cart = []
+                self.update_cart_display()
+                return
+            # What is charged is what gets saved, whatever happens to the cart meanwhile
+            self.show_payment({'uuid': self.cart_order_uuid, 'items': list(self.cart),
+                               'subtotal': self.total, 'tax': tax, 'total': final_total,
+                               'customer': self.current_customer})
+    
+    def show_payment(self, order):
+        """Take cash or card for an order snapshot; the cart is locked until it's paid or cancelled"""
+        self.processing_order = True
+        final_total = order['total']
+        window = tk.Toplevel(self.root)
+        window.title("Payment")
+        window.geometry("360x260")
+        window.configure(bg=self.colors['bg_primary'])
+        # Modal, so the cart can't be edited while a card authorizes
+        window.grab_set()
+        state = {'pending': None}
+        
+        tk.Label(window, text=f"Amount due: ${final_total}", font=('Arial', 16, 'bold'),
+                bg=self.colors['bg_primary'], fg=self.colors['text_primary']).pack(pady=10)
+        
+        cash_frame = tk.Frame(window, bg=self.colors['bg_primary'])
+        cash_frame.pack(pady=5)
+        tk.Label(cash_frame, text="Cash tendered:", font=('Arial', 11),
+                bg=self.colors['bg_primary'], fg=self.colors['text_primary']).pack(side='left')
+        tendered_entry = tk.Entry(cash_frame, font=('Arial', 12), width=10)
+        tendered_entry.pack(side='left', padx=5)
+        tendered_entry.focus()
+        
+        status_label = tk.Label(window, text="Leave blank for exact cash", font=('Arial', 10),
+                               bg=self.colors['bg_primary'], fg=self.colors['text_secondary'])
+        status_label.pack(pady=5)
+        
+        button_frame = tk.Frame(window, bg=self.colors['bg_primary'])
+        button_frame.pack(pady=10)
+        
+        def finish(payment):
+            state['pending'] = None
+            window.destroy()
+            self.processing_order = False
+            self.complete_order(order, payment)
+        
+        def pay_cash():
+            text = tendered_entry.get().strip().lstrip('$')
+            try:
+                tendered = Decimal(text) if text else final_total
+            except ArithmeticError:
+                status_label.config(text="Please enter a valid amount", fg=self.colors['text_accent'])
+                return
+            try:
+                change = cash_change(final_total, tendered)
+            except ValueError as e:
+                status_label.config(text=str(e), fg=self.colors['text_accent'])
+                return
+            finish({'tender': 'cash', 'tendered': tendered, 'change': change, 'auth_code': None})
+        
+        def pay_card():
+            for button in (cash_btn, card_btn):
+                button.config(state='disabled')
+            status_label.config(text="Authorizing card...", fg=self.colors['text_secondary'])
+            state['pending'] = self.card_authorizer.start(to_cents(final_total), order['uuid'])
+            window.after(100, poll_card)
+        
+        def poll_card():
+            pending = state['pending']
+            if pending is None:
+                return
+            result = pending.poll()
+            if result is None:
+                window.after(100, poll_card)
+            elif result.approved:
+                finish({'tender': 'card', 'tendered': None, 'change': Decimal('0.00'),
+                        'auth_code': result.auth_code})
+            else:
+                state['pending'] = None
+                status_label.config(text=result.message, fg=self.colors['text_accent'])
+                for button in (cash_btn, card_btn):
+                    button.config(state='normal')
+        
+        def cancel():
+            if state['pending'] is not None:
+                state['pending'].cancel()
+                state['pending'] = None
+            window.destroy()
+            self.processing_order = False
+        
+        cash_btn = tk.Button(button_frame, text="Cash", font=('Arial', 12, 'bold'), width=8,
+                            bg=self.colors['bg_success'], fg=self.colors['text_button'],
+                            relief='raised', bd=2, command=pay_cash,
+                            activebackground=self.colors['bg_success'],
+                            activeforeground=self.colors['text_button'])
+        cash_btn.pack(side='left', padx=5)
+        
+        card_btn = tk.Button(button_frame, text="Card", font=('Arial', 12, 'bold'), width=8,
+                            bg=self.colors['bg_button'], fg=self.colors['text_button'],
+                            relief='raised', bd=2, command=pay_card,
+                            activebackground=self.colors['bg_button_hover'],
+                            activeforeground=self.colors['text_button'])
+        card_btn.pack(side='left', padx=5)
+        
+        tk.Button(button_frame, text="Cancel", font=('Arial', 12), width=8,
+                 bg=self.colors['bg_danger'], fg=self.colors['text_button'],
+                 relief='raised', bd=2, command=cancel,
+                 activebackground=self.colors['bg_danger'],
+                 activeforeground=self.colors['text_button']).pack(side='left', padx=5)
+        
+        tendered_entry.bind('<Return>', lambda e: pay_cash())
+        window.protocol("WM_DELETE_WINDOW", cancel)
+    
+    def complete_order(self, order, payment):
+        """Save, print and announce a paid order snapshot"""
+        tax, final_total = order['tax'], order['total']
+        low_before = self.inventory.low_stock_ingredients()
+        sold_out_before = self.inventory.sold_out_ingredients()
+        try:
             # Save order to database
-            items_json = str(self.cart)
-            self.cursor.execute('''
-                INSERT INTO orders (user_id, items, subtotal, tax, total)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (self.current_user['id'], items_json, float(self.total), float(tax), float(final_total)))
+            customer_id = order['customer']['id'] if order['customer'] else None
+            order_id, created = insert_order(self.cursor, order['uuid'], self.current_user['id'],
+                                             str(order['items']), float(order['subtotal']), float(tax),
+                                             float(final_total), to_cents(final_total), customer_id)
+            if created:
+                points_earned = self.record_order_effects(order_id, order, payment)
             self.conn.commit()
-            
-            messagebox.showinfo("Order Processed", f"Order processed successfully!\nTotal: ${final_total}")
-            
-            # Clear cart
+        except (sqlite3.Error, ValueError) as e:
+            self.conn.rollback()
+            # Don't leave a card charge behind for an order that wasn't saved
+            if payment['auth_code']:
+                self.card_authorizer.void(payment['auth_code'], order['uuid'])
+            messagebox.showerror("Order Not Saved",
+                                 f"The order could not be saved ({e}).\n"
+                                 "Press Process Order again to retry; it will not be charged twice.")
+            return
+        
+        if not created:
+            messagebox.showinfo("Already Processed", f"This cart was already saved as order #{order_id}.")
             self.cart = []
             self.update_cart_display()
+            return
+        self.order_tracker.publish(order_id)
+        
+        # Print the receipt without blocking the till, stamped with the stored order time
+        self.cursor.execute("SELECT datetime(created_at, 'localtime') FROM orders WHERE id = ?",
+                            (order_id,))
+        receipt = build_receipt(order_id, self.current_user['username'], order['items'],
+                                order['subtotal'], tax, final_total, self.cursor.fetchone()[0])
+        self.receipt_spooler.submit(*receipt_job(receipt, self.receipt_format))
+        
+        if payment['tender'] == 'cash':
+            paid = f"Cash: ${payment['tendered']}\nChange due: ${payment['change']}"
+        else:
+            paid = f"Card approved ({payment['auth_code']})"
+        if order['customer'] is not None:
+            paid += (f"\nPoints earned: {points_earned}"
+                     f" (balance {self.loyalty.balance(order['customer']['id'])})")
+        messagebox.showinfo("Order Processed",
+                            f"Order #{order_id} processed successfully!\nTotal: ${final_total}\n{paid}")
+        
+        # Clear cart and customer for the next order
+        self.cart = []
+        self.update_cart_display()
+        self.set_customer(None)
+        
+        # Update menu flags and alert on newly low or sold-out ingredients
+        self.refresh_menu_availability()
+        newly_sold_out = self.inventory.sold_out_ingredients() - sold_out_before
+        newly_low = self.inventory.low_stock_ingredients() - low_before - sold_out_before
+        alerts = []
+        if newly_sold_out:
+            alerts.append("Sold out (86):\n" + "\n".join(sorted(newly_sold_out)))
+        if newly_low:
+            alerts.append("Running low on:\n" + "\n".join(sorted(newly_low)))
+        if alerts:
+            messagebox.showwarning("Low Stock", "\n\n".join(alerts))
+    
+    def record_order_effects(self, order_id, order, payment):
+        """Everything a new order updates besides its row; runs in the order's transaction"""
+        items, tax, final_total = order['items'], order['tax'], order['total']
+        # Link the payment to the order
+        record_payment(self.cursor, order_id, payment['tender'], final_total,
+                       payment['tendered'], payment['auth_code'])
+        
+        # Index the order for search
+        self.order_search.index_order(order_id, items, self.current_user['username'])
+        
+        # Add to the running shift totals; only cash goes in the drawer
+        if self.current_shift is not None:
+            self.shifts.record_order(self.current_shift, order['subtotal'], tax, final_total,
+                                     cash=final_total if payment['tender'] == 'cash' else 0)
+        
+        # Add to today's net sales
+        record_daily(self.cursor, to_cents(order['subtotal']), to_cents(tax), to_cents(final_total))
+        
+        # Add to the hourly sales rollup
+        record_sales(self.cursor, items)
+        
+        # Start the order lifecycle
+        self.order_tracker.start_order(order_id, self.fulfilment_var.get(), self.current_user['id'])
+        
+        # Decrement ingredient stock
+        self.inventory.consume(items)
+        
+        # Redeem and earn loyalty points; returns the points earned
+        if order['customer'] is None:
+            return 0
+        customer_id = order['customer']['id']
+        for item in items:
+            if item['type'] == 'reward':
+                self.loyalty.redeem(customer_id, order_id, item['points'])
+        return self.loyalty.earn(customer_id, order_id, final_total)
+    
+    def apply_adjustment(self, order_id, kind, removed=(), added=(), reason='', parent=None):
+        """Void, refund or amend a saved order with compensating entries
+
+        Returns True once committed. The order row is never changed.
+        """
+        if not self.require(Permission.VOID_ORDERS):
+            return False
+        try:
+            order, deltas = self.adjuster.adjust(order_id, kind, self.current_user['id'],
+                                                 removed, added, reason)
+            if kind == 'void':
+                removed = order['items']
+            tender, auth_code = self.record_adjustment_effects(order, kind, removed, added, *deltas, reason)
+            self.conn.commit()
+        except (sqlite3.Error, ValueError) as e:
+            self.conn.rollback()
+            messagebox.showerror("Adjustment Not Saved", str(e), parent=parent)
+            return False
+        
+        # Only tell the card processor once the books are committed
+        total = deltas[2]
+        if auth_code and tender == 'card':
+            if kind == 'void':
+                self.card_authorizer.void(auth_code, order['order_uuid'])
+            elif total < 0:
+                self.card_authorizer.refund(auth_code, -to_cents(total), order['order_uuid'])
+        if kind == 'void':
+            self.order_tracker.publish(order_id)
+        
+        if total < 0:
+            settled = f"Refund ${-total} ({tender})"
+        elif total > 0:
+            settled = f"Collect ${total} (cash)"
+        else:
+            settled = "Nothing to settle"
+        messagebox.showinfo("Order Adjusted", f"Order #{order_id} {kind} saved.\n{settled}", parent=parent)
+        return True
+    
+    def record_adjustment_effects(self, order, kind, removed, added, subtotal, tax, total, reason):
+        """Everything an adjustment updates besides its own row; runs in its transaction
+
+        Each rollup gets the deltas, booked on the day of the adjustment.
+        Returns the tender and card auth code the difference was settled with.
+        """
+        order_id = order['order_id']
+        payments = payments_for_order(self.cursor, order_id)
+        tender, auth_code = (payments[0][0], payments[0][3]) if payments else ('cash', None)
+        
+        # Refunds go back the way the order was paid; anything owed is taken in cash
+        if total > 0:
+            tender, auth_code = 'cash', None
+        if total:
+            record_payment(self.cursor, order_id, tender, total, auth_code=auth_code)
+        
+        if self.current_shift is not None:
+            self.shifts.record_order(self.current_shift, subtotal, tax, total,
+                                     cash=total if tender == 'cash' else 0,
+                                     orders=-1 if kind == 'void' else 0)
+        
+        # Take removed items out of the hour they were sold in
+        record_sales(self.cursor, removed, sign=-1, hour=order['created_at'])
+        record_sales(self.cursor, added)
+        
+        if order['customer_id'] is not None:
+            restored = sum(item['points'] for item in removed if item['type'] == 'reward')
+            net_total = from_cents(order['total_cents']) + total
+            self.loyalty.adjust_order(order['customer_id'], order_id, net_total, restored)
+        
+        if kind == 'void':
+            self.order_tracker.cancel(order_id, self.current_user['id'])
+        audit(self.cursor, self.current_user['id'], AUDIT_ACTIONS[kind], order_id, total=total, reason=reason)
+        return tender, auth_code
     
     def load_users(self):
-        """Load users for admin view"""
+        """Load the first page of users matching the search box"""
         self.user_listbox.delete(0, tk.END)
-        self.cursor.execute('SELECT username, is_admin FROM users ORDER BY username')
-        users = self.cursor.fetchall()
-        
-        for username, is_admin in users:
-            admin_text = " (Admin)" if is_admin else ""
-            self.user_listbox.insert(tk.END, f"{username}{admin_text}")
+        self.user_rows = []
+        self.user_keys = []
+        self.users_exhausted = False
+        self.load_more_users()
+    
+    def load_more_users(self):
+        """Append the next page of users to the list"""
+        after = self.user_rows[-1] if self.user_rows else None
+        rows = self.user_directory.page(self.user_search_var.get().strip(), after)
+        for row in rows:
+            self.user_rows.append(row)
+            self.user_keys.append(sort_key(row))
+            self.user_listbox.insert(tk.END, self.format_user_row(row))
+        self.users_exhausted = len(rows) < self.user_directory.page_size
+    
+    def format_user_row(self, row):
+        """Display text for a (id, username, is_admin) row"""
+        admin_text = " (Admin)" if row[2] else ""
+        return f"{row[1]}{admin_text}"
+    
+    def user_listbox_yview(self, *args):
+        """Scrollbar callback for the user list"""
+        self.user_listbox.yview(*args)
+    
+    def on_user_list_scroll(self, first, last):
+        """Fetch the next page when the list is scrolled near its end"""
+        self.user_scrollbar.set(first, last)
+        if not self.users_exhausted and float(last) >= 0.9:
+            self.load_more_users()
+    
+    def insert_user_row(self, row):
+        """Insert a user into the loaded list at its sorted position"""
+        if not matches_prefix(row[1], self.user_search_var.get().strip()):
+            return
+        key = sort_key(row)
+        index = bisect.bisect_left(self.user_keys, key)
+        if index == len(self.user_rows) and not self.users_exhausted:
+            # Beyond the loaded window; it will arrive with a later page
+            return
+        self.user_rows.insert(index, row)
+        self.user_keys.insert(index, key)
+        self.user_listbox.insert(index, self.format_user_row(row))
+    
+    def remove_user_row(self, user_id):
+        """Remove a user from the loaded list"""
+        for index, row in enumerate(self.user_rows):
+            if row[0] == user_id:
+                del self.user_rows[index]
+                del self.user_keys[index]
+                self.user_listbox.delete(index)
+                return
+    
+    def selected_user(self, action):
+        """Return the (id, username, is_admin) row selected in the user list"""
+        selection = self.user_listbox.curselection()
+        if not selection:
+            messagebox.showwarning("No Selection", f"Please select a user to {action}")
+            return None
+        return self.user_rows[selection[0]]
     
     def add_user(self):
         """Add new user"""
+        if not self.require(Permission.MANAGE_USERS):
+            return
         dialog = tk.Toplevel(self.root)
         dialog.title("Add User")
         dialog.geometry("300x200")
@@ -892,11 +1759,14 @@ class PizzaPOSApp:
                             fg=self.colors['text_primary'])
         pin_entry.pack(padx=10, pady=5)
         
-        # Admin checkbox
-        is_admin_var = tk.BooleanVar()
-        admin_check = tk.Checkbutton(dialog, text="Administrator", variable=is_admin_var, 
-                                    bg=self.colors['bg_primary'], fg=self.colors['text_primary'])
-        admin_check.pack(anchor='w', padx=10, pady=5)
+        # Role
+        roles = dict((name, role_id) for role_id, name in list_roles(self.cursor))
+        role_var = tk.StringVar(value='Cashier' if 'Cashier' in roles else next(iter(roles)))
+        role_frame = tk.Frame(dialog, bg=self.colors['bg_primary'])
+        role_frame.pack(anchor='w', padx=10, pady=5)
+        tk.Label(role_frame, text="Role:", font=('Arial', 10, 'bold'),
+                bg=self.colors['bg_primary'], fg=self.colors['text_primary']).pack(side='left')
+        tk.OptionMenu(role_frame, role_var, *roles).pack(side='left', padx=5)
         
         # Buttons
         button_frame = tk.Frame(dialog, bg=self.colors['bg_primary'])
@@ -914,16 +1784,24 @@ class PizzaPOSApp:
                 messagebox.showerror("Error", "PIN must be exactly 4 digits")
                 return
             
+            role_id = roles[role_var.get()]
+            # is_admin marks accounts that manage users in the user list
+            is_admin = int(bool(role_permissions(self.cursor, role_id) & Permission.MANAGE_USERS))
             try:
                 self.cursor.execute('''
                     INSERT INTO users (username, pin, is_admin)
                     VALUES (?, ?, ?)
-                ''', (username, pin, int(is_admin_var.get())))
+                ''', (username, pin, is_admin))
+                user_id = self.cursor.lastrowid
+                assign_role(self.cursor, user_id, role_id)
+                audit(self.cursor, self.current_user['id'], 'user added', user_id,
+                      username=username, role=role_var.get())
                 self.conn.commit()
                 messagebox.showinfo("Success", "User added successfully!")
                 dialog.destroy()
-                self.load_users()
+                self.insert_user_row((user_id, username, is_admin))
             except sqlite3.IntegrityError:
+                self.conn.rollback()
                 messagebox.showerror("Error", "Username already exists")
         
         tk.Button(button_frame, text="Save", font=('Arial', 10, 'bold'),
@@ -940,21 +1818,21 @@ class PizzaPOSApp:
     
     def edit_user(self):
         """Edit selected user"""
-        selection = self.user_listbox.curselection()
-        if not selection:
-            messagebox.showwarning("No Selection", "Please select a user to edit")
+        if not self.require(Permission.MANAGE_USERS):
+            return
+        selected = self.selected_user("edit")
+        if not selected:
             return
-        
-        username = self.user_listbox.get(selection[0]).split(' (Admin)')[0]
         
         # Get user data
-        self.cursor.execute('SELECT username, pin, is_admin FROM users WHERE username = ?', (username,))
-        user_data = self.cursor.fetchone()
+        user = self.user_directory.get(selected[0])
         
-        if not user_data:
+        if not user:
             messagebox.showerror("Error", "User not found")
             return
         
+        user_id, user_data = user[0], user[1:]
+        
         dialog = tk.Toplevel(self.root)
         dialog.title("Edit User")
         dialog.geometry("300x200")
@@ -972,10 +1850,15 @@ class PizzaPOSApp:
         pin_entry.insert(0, user_data[1])
         pin_entry.pack(padx=10, pady=5)
         
-        # Admin checkbox
-        is_admin_var = tk.BooleanVar(value=bool(user_data[2]))
-        admin_check = tk.Checkbutton(dialog, text="Administrator", variable=is_admin_var, bg='#f0f0f0')
-        admin_check.pack(anchor='w', padx=10, pady=5)
+        # Role
+        roles = dict((name, role_id) for role_id, name in list_roles(self.cursor))
+        current_role = user_role(self.cursor, user_id)
+        role_var = tk.StringVar(value=next((name for name, role_id in roles.items() if role_id == current_role),
+                                           next(iter(roles))))
+        role_frame = tk.Frame(dialog, bg='#f0f0f0')
+        role_frame.pack(anchor='w', padx=10, pady=5)
+        tk.Label(role_frame, text="Role:", font=('Arial', 10), bg='#f0f0f0').pack(side='left')
+        tk.OptionMenu(role_frame, role_var, *roles).pack(side='left', padx=5)
         
         # Buttons
         button_frame = tk.Frame(dialog, bg='#f0f0f0')
@@ -993,16 +1876,29 @@ class PizzaPOSApp:
                 messagebox.showerror("Error", "PIN must be exactly 4 digits")
                 return
             
+            role_id = roles[role_var.get()]
+            is_admin = int(bool(role_permissions(self.cursor, role_id) & Permission.MANAGE_USERS))
             try:
                 self.cursor.execute('''
                     UPDATE users SET username = ?, pin = ?, is_admin = ?
-                    WHERE username = ?
-                ''', (new_username, new_pin, int(is_admin_var.get()), username))
+                    WHERE id = ?
+                ''', (new_username, new_pin, is_admin, user_id))
+                assign_role(self.cursor, user_id, role_id)
+                changes = {}
+                if new_username != user_data[0]:
+                    changes['username'] = new_username
+                if new_pin != user_data[1]:
+                    changes['pin'] = 'changed'
+                if role_id != current_role:
+                    changes['role'] = role_var.get()
+                audit(self.cursor, self.current_user['id'], 'user edited', user_id, **changes)
                 self.conn.commit()
                 messagebox.showinfo("Success", "User updated successfully!")
                 dialog.destroy()
-                self.load_users()
+                self.remove_user_row(user_id)
+                self.insert_user_row((user_id, new_username, is_admin))
             except sqlite3.IntegrityError:
+                self.conn.rollback()
                 messagebox.showerror("Error", "Username already exists")
         
         tk.Button(button_frame, text="Save", font=('Arial', 10, 'bold'),
@@ -1019,35 +1915,40 @@ class PizzaPOSApp:
     
     def delete_user(self):
         """Delete selected user"""
-        selection = self.user_listbox.curselection()
-        if not selection:
-            messagebox.showwarning("No Selection", "Please select a user to delete")
+        if not self.require(Permission.MANAGE_USERS):
+            return
+        selected = self.selected_user("delete")
+        if not selected:
             return
         
-        username = self.user_listbox.get(selection[0]).split(' (Admin)')[0]
+        user_id, username = selected[0], selected[1]
         
-        if username == self.current_user['username']:
+        if user_id == self.current_user['id']:
             messagebox.showerror("Error", "You cannot delete your own account")
             return
         
         if messagebox.askyesno("Delete User", f"Are you sure you want to delete user '{username}'?"):
-            self.cursor.execute('DELETE FROM users WHERE username = ?', (username,))
+            # Soft delete: the account can't log in, but its orders and shifts keep their staff name
+            self.cursor.execute('UPDATE users SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?', (user_id,))
+            audit(self.cursor, self.current_user['id'], 'user deleted', user_id, username=username)
             self.conn.commit()
             messagebox.showinfo("Success", "User deleted successfully!")
-            self.load_users()
+            self.remove_user_row(user_id)
     
     def reset_password(self):
         """Reset user password"""
-        selection = self.user_listbox.curselection()
-        if not selection:
-            messagebox.showwarning("No Selection", "Please select a user to reset password")
+        if not self.require(Permission.MANAGE_USERS):
+            return
+        selected = self.selected_user("reset password")
+        if not selected:
             return
         
-        username = self.user_listbox.get(selection[0]).split(' (Admin)')[0]
+        user_id, username = selected[0], selected[1]
         
         new_pin = simpledialog.askstring("Reset Password", f"Enter new 4-digit PIN for {username}:")
         if new_pin and len(new_pin) == 4 and new_pin.isdigit():
-            self.cursor.execute('UPDATE users SET pin = ? WHERE username = ?', (new_pin, username))
+            self.cursor.execute('UPDATE users SET pin = ? WHERE id = ?', (new_pin, user_id))
+            audit(self.cursor, self.current_user['id'], 'PIN reset', user_id)
             self.conn.commit()
             messagebox.showinfo("Success", f"Password reset for {username}")
         elif new_pin:
@@ -1055,20 +1956,138 @@ class PizzaPOSApp:
     
     def configure_prices(self):
         """Configure system prices"""
-        messagebox.showinfo("Price Configuration", 
-                           "Price configuration feature would be implemented here.\n"
-                           "This would allow admins to modify pizza, topping, and drink prices.")
+        if not self.require(Permission.EDIT_PRICES):
+            return
+        name = simpledialog.askstring("Price Configuration",
+                                      "Item to reprice (a pizza size, topping or drink):")
+        if not name:
+            return
+        self.refresh_menu()
+        sections = {'size': self.pizza_prices, 'topping': self.topping_prices, 'drink': self.drink_prices}
+        found = [(section, item) for section, prices in sections.items()
+                 for item in prices if item.lower() == name.strip().lower()]
+        if not found:
+            messagebox.showerror("Error", f"'{name}' is not a pizza size, topping or drink.")
+            return
+        section, item = found[0]
+        old_price = sections[section][item]
+        text = simpledialog.askstring("Price Configuration", f"New price for {item} (now ${old_price}):")
+        if not text:
+            return
+        try:
+            price = Decimal(text.strip().lstrip('$')).quantize(Decimal('0.01'))
+        except ArithmeticError:
+            messagebox.showerror("Error", "Please enter a valid price.")
+            return
+        if price < 0:
+            messagebox.showerror("Error", "Prices can't be negative.")
+            return
+        
+        # Every till and online client picks up the new menu version on its next check
+        set_price(self.cursor, section, item, price)
+        audit(self.cursor, self.current_user['id'], 'price changed', None,
+              item=item, old=old_price, new=price)
+        self.conn.commit()
+        self.refresh_menu()
+        messagebox.showinfo("Success", f"{item} now costs ${price}.")
+    
+    def view_audit_log(self):
+        """Browse the audit log newest first, filtered by staff member and dates"""
+        if not self.require(Permission.MANAGE_USERS):
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Audit Log")
+        window.geometry("900x500")
+        window.configure(bg=self.colors['bg_primary'])
+        
+        form_frame = tk.Frame(window, bg=self.colors['bg_primary'])
+        form_frame.pack(fill='x', padx=10, pady=10)
+        
+        fields = [("Staff", 14), ("From (YYYY-MM-DD)", 12), ("To (YYYY-MM-DD)", 12)]
+        entries = {}
+        for column, (label, width) in enumerate(fields):
+            tk.Label(form_frame, text=label, font=('Arial', 9, 'bold'),
+                    bg=self.colors['bg_primary'], fg=self.colors['text_primary']).grid(row=0, column=column, sticky='w', padx=3)
+            entry = tk.Entry(form_frame, font=('Arial', 10), width=width,
+                             relief='solid', bd=1, bg=self.colors['bg_primary'],
+                             fg=self.colors['text_primary'])
+            entry.grid(row=1, column=column, padx=3)
+            entries[label] = entry
+        
+        log_listbox = tk.Listbox(window, font=('Courier', 10),
+                                 bg=self.colors['bg_primary'], fg=self.colors['text_primary'],
+                                 relief='solid', bd=1)
+        log_listbox.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        # Filters of the current listing and the last row shown, for the next page
+        state = {'filters': None, 'last': None}
+        
+        def load_page():
+            rows = self.audit_log.page(*state['filters'], after=state['last'])
+            for entry_id, at, actor, action, target_id, detail, _ in rows:
+                target = f"#{target_id}" if target_id is not None else ''
+                log_listbox.insert(tk.END, f"{at}  {actor or '-':<12} {action:<14} {target:<7} {detail}")
+            if rows:
+                state['last'] = rows[-1]
+            more_btn.config(state='normal' if len(rows) == self.audit_log.page_size else 'disabled')
+        
+        def run_search():
+            staff = entries["Staff"].get().strip()
+            actor_id = None
+            if staff:
+                # Deleted accounts are included; their actions stay on record
+                self.cursor.execute('SELECT id FROM users WHERE username = ? COLLATE NOCASE', (staff,))
+                row = self.cursor.fetchone()
+                if row is None:
+                    messagebox.showerror("Error", f"No staff member named '{staff}'", parent=window)
+                    return
+                actor_id = row[0]
+            
+            date_from = entries["From (YYYY-MM-DD)"].get().strip()
+            date_to = entries["To (YYYY-MM-DD)"].get().strip()
+            try:
+                if date_from:
+                    datetime.date.fromisoformat(date_from)
+                if date_to:
+                    # Make the end date inclusive
+                    date_to = (datetime.date.fromisoformat(date_to) + datetime.timedelta(days=1)).isoformat()
+            except ValueError:
+                messagebox.showerror("Error", "Dates must be in YYYY-MM-DD format", parent=window)
+                return
+            
+            state['filters'] = (actor_id, date_from or None, date_to or None)
+            state['last'] = None
+            log_listbox.delete(0, tk.END)
+            load_page()
+        
+        tk.Button(form_frame, text="Search", font=('Arial', 10, 'bold'),
+                 bg=self.colors['bg_success'], fg=self.colors['text_button'],
+                 relief='raised', bd=2, command=run_search,
+                 activebackground=self.colors['bg_success'],
+                 activeforeground=self.colors['text_button']).grid(row=1, column=len(fields), padx=10)
+        
+        more_btn = tk.Button(window, text="Load More", font=('Arial', 10),
+                            bg=self.colors['bg_button'], fg=self.colors['text_button'],
+                            relief='raised', bd=2, command=load_page,
+                            activebackground=self.colors['bg_button_hover'],
+                            activeforeground=self.colors['text_button'])
+        more_btn.pack(pady=(0, 10))
+        
+        run_search()
     
     def view_orders(self):
         """View order history"""
-        self.cursor.execute('''
-            SELECT o.id, u.username, o.total, o.created_at
-            FROM orders o
-            JOIN users u ON o.user_id = u.id
-            ORDER BY o.created_at DESC
-            LIMIT 50
-        ''')
-        orders = self.cursor.fetchall()
+        if not self.require(Permission.VIEW_REPORTS):
+            return
+        # Newest first across the hot table and, if needed, the archives;
+        # online and delivery-partner orders have no staff user
+        orders = self.archive.scan('''
+            SELECT o.id, COALESCE(u.username, ?), o.total, o.created_at
+            FROM {orders} o
+            LEFT JOIN users u ON o.user_id = u.id
+            ORDER BY o.id DESC
+            LIMIT ?
+        ''', (ONLINE_STAFF,), limit=50)
         
         if not orders:
             messagebox.showinfo("No Orders", "No orders found in the system.")
@@ -1095,15 +2114,410 @@ class PizzaPOSApp:
             tk.Label(orders_frame, text=f"${total:.2f}").grid(row=row, column=2, padx=5, pady=2)
             tk.Label(orders_frame, text=created_at).grid(row=row, column=3, padx=5, pady=2)
     
+    def search_orders(self):
+        """Look up orders by number, item contents, staff and date"""
+        search_window = tk.Toplevel(self.root)
+        search_window.title("Find Orders")
+        search_window.geometry("800x500")
+        search_window.configure(bg=self.colors['bg_primary'])
+        
+        form_frame = tk.Frame(search_window, bg=self.colors['bg_primary'])
+        form_frame.pack(fill='x', padx=10, pady=10)
+        
+        fields = [("Order #", 8), ("Items", 20), ("Staff", 12),
+                  ("From (YYYY-MM-DD)", 12), ("To (YYYY-MM-DD)", 12)]
+        entries = {}
+        for column, (label, width) in enumerate(fields):
+            tk.Label(form_frame, text=label, font=('Arial', 9, 'bold'), 
+                    bg=self.colors['bg_primary'], fg=self.colors['text_primary']).grid(row=0, column=column, sticky='w', padx=3)
+            entry = tk.Entry(form_frame, font=('Arial', 10), width=width,
+                             relief='solid', bd=1, bg=self.colors['bg_primary'],
+                             fg=self.colors['text_primary'])
+            entry.grid(row=1, column=column, padx=3)
+            entries[label] = entry
+        
+        results_listbox = tk.Listbox(search_window, font=('Courier', 10),
+                                     bg=self.colors['bg_primary'], fg=self.colors['text_primary'],
+                                     relief='solid', bd=1)
+        results_listbox.pack(fill='both', expand=True, padx=10, pady=10)
+        result_ids = []
+        
+        def show_results(orders):
+            results_listbox.delete(0, tk.END)
+            result_ids.clear()
+            if not orders:
+                results_listbox.insert(tk.END, "No matching orders")
+            for order_id, username, total, created_at, items in orders:
+                result_ids.append(order_id)
+                results_listbox.insert(tk.END, f"#{order_id:<7} {created_at}  {username or '-':<12} ${total:>8.2f}  {items}")
+        
+        def run_search():
+            order_number = entries["Order #"].get().strip()
+            if order_number:
+                if not order_number.lstrip('#').isdigit():
+                    messagebox.showerror("Error", "Order number must be numeric", parent=search_window)
+                    return
+                order = self.order_search.get_order(int(order_number.lstrip('#')))
+                show_results([order] if order else [])
+                return
+            
+            date_from = entries["From (YYYY-MM-DD)"].get().strip()
+            date_to = entries["To (YYYY-MM-DD)"].get().strip()
+            try:
+                if date_from:
+                    datetime.date.fromisoformat(date_from)
+                if date_to:
+                    # Make the end date inclusive
+                    date_to = (datetime.date.fromisoformat(date_to) + datetime.timedelta(days=1)).isoformat()
+            except ValueError:
+                messagebox.showerror("Error", "Dates must be in YYYY-MM-DD format", parent=search_window)
+                return
+            
+            show_results(self.order_search.search(entries["Items"].get(), entries["Staff"].get(),
+                                                  date_from or None, date_to or None))
+        
+        tk.Button(form_frame, text="Search", font=('Arial', 10, 'bold'),
+                 bg=self.colors['bg_success'], fg=self.colors['text_button'], 
+                 relief='raised', bd=2, command=run_search,
+                 activebackground=self.colors['bg_success'],
+                 activeforeground=self.colors['text_button']).grid(row=1, column=len(fields), padx=10)
+        
+        def adjust_selected():
+            selection = results_listbox.curselection()
+            if not selection or selection[0] >= len(result_ids):
+                messagebox.showwarning("No Selection", "Please select an order to adjust", parent=search_window)
+                return
+            self.show_order_adjustment(result_ids[selection[0]])
+        
+        if self.can(Permission.VOID_ORDERS):
+            tk.Button(form_frame, text="Adjust Order", font=('Arial', 10, 'bold'),
+                     bg=self.colors['bg_warning'], fg=self.colors['text_button'],
+                     relief='raised', bd=2, command=adjust_selected,
+                     activebackground=self.colors['bg_warning'],
+                     activeforeground=self.colors['text_button']).grid(row=1, column=len(fields) + 1, padx=5)
+            results_listbox.bind('<Double-Button-1>', lambda e: adjust_selected())
+        
+        search_window.bind('<Return>', lambda e: run_search())
+        entries["Order #"].focus()
+    
+    def show_order_adjustment(self, order_id):
+        """Void, refund items from, or amend a saved order"""
+        if not self.require(Permission.VOID_ORDERS):
+            return
+        order = self.adjuster.net_order(order_id)
+        if order is None:
+            # Found by search but no longer in the hot table
+            messagebox.showerror("Archived Order", f"Order #{order_id} is archived and can no longer be adjusted.")
+            return
+        
+        window = tk.Toplevel(self.root)
+        window.title(f"Adjust Order #{order_id}")
+        window.geometry("600x500")
+        window.configure(bg=self.colors['bg_primary'])
+        
+        status = "VOIDED" if order['voided'] else f"Now ${from_cents(order['total_cents'])}"
+        tk.Label(window, text=f"Order #{order_id} - {order['created_at']} - {status}",
+                font=('Arial', 12, 'bold'), bg=self.colors['bg_primary'],
+                fg=self.colors['text_primary']).pack(pady=(10, 5))
+        for kind, at, username, total, reason in self.adjuster.history(order_id):
+            tk.Label(window, text=f"{at}  {kind} by {username or '-'}  ${total}  {reason}",
+                    font=('Arial', 9), bg=self.colors['bg_primary'],
+                    fg=self.colors['text_secondary']).pack()
+        
+        items_listbox = tk.Listbox(window, font=('Courier', 10), selectmode='multiple',
+                                   bg=self.colors['bg_primary'], fg=self.colors['text_primary'],
+                                   relief='solid', bd=1)
+        items_listbox.pack(fill='both', expand=True, padx=10, pady=10)
+        for item in order['items']:
+            items_listbox.insert(tk.END, f"{item['name']} - ${item['price']}")
+        
+        reason_frame = tk.Frame(window, bg=self.colors['bg_primary'])
+        reason_frame.pack(fill='x', padx=10)
+        tk.Label(reason_frame, text="Reason:", font=('Arial', 10, 'bold'),
+                bg=self.colors['bg_primary'], fg=self.colors['text_primary']).pack(side='left')
+        reason_entry = tk.Entry(reason_frame, font=('Arial', 10), relief='solid', bd=1,
+                                bg=self.colors['bg_primary'], fg=self.colors['text_primary'])
+        reason_entry.pack(side='left', fill='x', expand=True, padx=5)
+        
+        def selected_items():
+            return [order['items'][index] for index in items_listbox.curselection()]
+        
+        def apply(kind, removed=(), added=()):
+            if self.apply_adjustment(order_id, kind, removed, added, reason_entry.get().strip(), parent=window):
+                window.destroy()
+                return True
+            return False
+        
+        def void():
+            if messagebox.askyesno("Void Order", f"Void order #{order_id} completely?", parent=window):
+                apply('void')
+        
+        def refund():
+            removed = selected_items()
+            if not removed:
+                messagebox.showwarning("No Selection", "Select the items to refund", parent=window)
+                return
+            apply('refund', removed)
+        
+        def amend():
+            # Selected items are swapped for what's in the cart
+            if any(item['type'] == 'reward' for item in self.cart):
+                messagebox.showwarning("Rewards", "Rewards can't be added to a saved order", parent=window)
+                return
+            if apply('amend', selected_items(), list(self.cart)):
+                self.cart = []
+                self.update_cart_display()
+        
+        button_frame = tk.Frame(window, bg=self.colors['bg_primary'])
+        button_frame.pack(pady=10)
+        buttons = [("Void Order", self.colors['bg_danger'], void),
+                   ("Refund Selected", self.colors['bg_warning'], refund),
+                   ("Amend with Cart", self.colors['bg_button'], amend)]
+        for text, color, command in buttons:
+            tk.Button(button_frame, text=text, font=('Arial', 11, 'bold'),
+                     bg=color, fg=self.colors['text_button'], relief='raised', bd=2,
+                     state='disabled' if order['voided'] else 'normal', command=command,
+                     activebackground=color,
+                     activeforeground=self.colors['text_button']).pack(side='left', padx=5)
+    
+    def show_order_board(self):
+        """Live board of open pickup and delivery orders"""
+        board = tk.Toplevel(self.root)
+        board.title("Order Board")
+        board.geometry("700x500")
+        board.configure(bg=self.colors['bg_primary'])
+        
+        columns = ('order', 'type', 'status', 'promised')
+        headings = ("Order", "Type", "Status", "Promised")
+        tree = ttk.Treeview(board, columns=columns, show='headings', selectmode='browse')
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=150)
+        tree.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        # Rows are kept sorted by promised time and updated one at a time
+        order_keys = []
+        tree_keys = {}
+        state = {'last_change': self.order_tracker.last_change_id(),
+                 'data_version': self.order_tracker.data_version()}
+        
+        def show_order(order):
+            iid = str(order['order_id'])
+            if iid in tree_keys:
+                order_keys.remove(tree_keys.pop(iid))
+                tree.delete(iid)
+            if order['status'] not in OPEN_STATUSES:
+                return
+            key = (order['promised_time'], order['order_id'])
+            tree_keys[iid] = key
+            index = bisect.bisect_left(order_keys, key)
+            order_keys.insert(index, key)
+            tree.insert('', index, iid=iid, values=(f"#{order['order_id']}", order['fulfilment'].title(),
+                                                     status_label(order['status']),
+                                                     order['promised_time'][11:16]))
+        
+        def catch_up(order=None):
+            # Only history rows newer than the last one seen are read
+            state['last_change'], orders = self.order_tracker.changes_since(state['last_change'])
+            for order in orders:
+                show_order(order)
+        
+        def poll_other_tills():
+            # Other tills' commits are polled; data_version only moves when they write
+            if not board.winfo_exists():
+                return
+            data_version = self.order_tracker.data_version()
+            if data_version != state['data_version']:
+                state['data_version'] = data_version
+                catch_up()
+            board.after(1000, poll_other_tills)
+        
+        def advance():
+            selection = tree.selection()
+            if not selection:
+                messagebox.showwarning("No Selection", "Please select an order to advance", parent=board)
+                return
+            order_id = int(selection[0])
+            self.order_tracker.advance(order_id, self.current_user['id'])
+            self.conn.commit()
+            self.order_tracker.publish(order_id)
+        
+        def on_destroy(event):
+            if event.widget is board:
+                self.order_tracker.unsubscribe(catch_up)
+        
+        for order in self.order_tracker.open_orders():
+            show_order(order)
+        
+        tk.Button(board, text="Advance Status", font=('Arial', 12, 'bold'),
+                 bg=self.colors['bg_success'], fg=self.colors['text_button'], 
+                 relief='raised', bd=2, command=advance,
+                 activebackground=self.colors['bg_success'],
+                 activeforeground=self.colors['text_button']).pack(pady=10)
+        
+        # Changes made on this till arrive straight away and move the feed cursor
+        self.order_tracker.subscribe(catch_up)
+        board.bind('<Destroy>', on_destroy)
+        board.after(1000, poll_other_tills)
+    
+    def show_prep_plan(self):
+        """Forecast a day's demand and the ingredients to prep for it"""
+        if not self.require(Permission.VIEW_REPORTS):
+            return
+        plan_window = tk.Toplevel(self.root)
+        plan_window.title("Prep Plan")
+        plan_window.geometry("700x600")
+        plan_window.configure(bg=self.colors['bg_primary'])
+        
+        form_frame = tk.Frame(plan_window, bg=self.colors['bg_primary'])
+        form_frame.pack(fill='x', padx=10, pady=10)
+        
+        tk.Label(form_frame, text="Date (YYYY-MM-DD):", font=('Arial', 10, 'bold'), 
+                bg=self.colors['bg_primary'], fg=self.colors['text_primary']).pack(side='left')
+        date_entry = tk.Entry(form_frame, font=('Arial', 10), width=12,
+                              relief='solid', bd=1, bg=self.colors['bg_primary'],
+                              fg=self.colors['text_primary'])
+        date_entry.insert(0, (datetime.date.today() + datetime.timedelta(days=1)).isoformat())
+        date_entry.pack(side='left', padx=5)
+        
+        plan_text = tk.Text(plan_window, font=('Courier', 10), bg=self.colors['bg_primary'],
+                            fg=self.colors['text_primary'], relief='solid', bd=1)
+        plan_text.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        def show_plan():
+            try:
+                day = datetime.date.fromisoformat(date_entry.get().strip())
+            except ValueError:
+                messagebox.showerror("Error", "Dates must be in YYYY-MM-DD format", parent=plan_window)
+                return
+            
+            hourly, item_totals, ingredients = self.forecaster.prep_plan(day, self.inventory.recipes)
+            
+            lines = [f"Forecast for {day.strftime('%A %Y-%m-%d')}", "", "Expected sales by hour:"]
+            for hour in range(24):
+                quantity = sum(hours[hour] for hours in hourly.values())
+                if quantity >= 0.5:
+                    lines.append(f"  {hour:02d}:00  {quantity:6.1f}  {'#' * min(round(quantity), 40)}")
+            lines += ["", "Expected sales by item:"]
+            lines += [f"  {item:<20}{quantity:>6}" for item, quantity in
+                      sorted(item_totals.items(), key=lambda entry: -entry[1]) if quantity]
+            lines += ["", "Prep (portions):"]
+            lines += [f"  {name:<20}{quantity:>6}" for name, quantity in sorted(ingredients.items())]
+            if not item_totals:
+                lines = [f"Not enough order history to forecast {day.isoformat()}"]
+            
+            plan_text.config(state='normal')
+            plan_text.delete('1.0', tk.END)
+            plan_text.insert('1.0', "\n".join(lines))
+            plan_text.config(state='disabled')
+        
+        tk.Button(form_frame, text="Forecast", font=('Arial', 10, 'bold'),
+                 bg=self.colors['bg_success'], fg=self.colors['text_button'], 
+                 relief='raised', bd=2, command=show_plan,
+                 activebackground=self.colors['bg_success'],
+                 activeforeground=self.colors['text_button']).pack(side='left', padx=10)
+        
+        show_plan()
+    
+    def view_inventory(self):
+        """View ingredient stock and restock items"""
+        if not self.require(Permission.MANAGE_INVENTORY):
+            return
+        inventory_window = tk.Toplevel(self.root)
+        inventory_window.title("Inventory")
+        inventory_window.geometry("400x450")
+        inventory_window.configure(bg=self.colors['bg_primary'])
+        
+        stock_listbox = tk.Listbox(inventory_window, font=('Arial', 10), height=18,
+                                   bg=self.colors['bg_primary'], fg=self.colors['text_primary'],
+                                   relief='solid', bd=1)
+        stock_listbox.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        def load_stock():
+            stock_listbox.delete(0, tk.END)
+            for name, stock, low_level in self.inventory.stock_levels():
+                flag = " - 86" if stock <= 0 else " - LOW" if stock <= low_level else ""
+                stock_listbox.insert(tk.END, f"{name}: {stock}{flag}")
+        
+        def restock():
+            selection = stock_listbox.curselection()
+            if not selection:
+                messagebox.showwarning("No Selection", "Please select an ingredient to restock")
+                return
+            name = stock_listbox.get(selection[0]).split(':')[0]
+            amount = simpledialog.askinteger("Restock", f"Add how many portions of {name}?",
+                                             minvalue=1, parent=inventory_window)
+            if amount:
+                self.inventory.restock(name, amount)
+                self.conn.commit()
+                load_stock()
+        
+        tk.Button(inventory_window, text="Restock", font=('Arial', 10),
+                 bg=self.colors['bg_success'], fg=self.colors['text_button'], 
+                 relief='raised', bd=2, command=restock,
+                 activebackground=self.colors['bg_success'],
+                 activeforeground=self.colors['text_button']).pack(pady=10)
+        
+        load_stock()
+    
     def logout(self):
         """Logout and return to login screen"""
+        if self.current_shift is not None:
+            self.close_shift()
         self.current_user = None
+        self.current_customer = None
         self.cart = []
+        self.cart_order_uuid = None
         self.show_login()
     
+    def show_my_sales(self):
+        """Show the running totals for the logged-in user's shift"""
+        if not self.require(Permission.VIEW_OWN_SALES):
+            return
+        if self.current_shift is None:
+            messagebox.showinfo("My Sales", "You don't have an open shift.")
+            return
+        messagebox.showinfo("My Sales", render_z_report(self.shifts.z_report(self.current_shift)))
+    
+    def close_shift(self):
+        """Close the current shift with a cash-up and show its Z-report"""
+        report = self.shifts.z_report(self.current_shift)
+        counted_cash = None
+        if report['order_count']:
+            while True:
+                counted = simpledialog.askstring("Cash Up", 
+                                                 f"Expected in drawer: ${report['expected_cash']}\n"
+                                                 "Enter cash counted in drawer (blank to skip):")
+                if not counted or not counted.strip():
+                    break
+                try:
+                    counted_cash = Decimal(counted.strip().lstrip('$'))
+                    break
+                except ArithmeticError:
+                    messagebox.showerror("Error", "Please enter a valid amount")
+        
+        report = self.shifts.close_shift(self.current_shift, counted_cash)
+        self.conn.commit()
+        self.current_shift = None
+        
+        if report['order_count']:
+            messagebox.showinfo("Z-Report", render_z_report(report))
+    
     def run(self):
         """Start the application"""
         self.root.mainloop()
+        self.close()
+    
+    def close(self):
+        """Finish background work and close the database once the window is gone"""
+        self.receipt_spooler.stop()
+        self.ui.stop()
+        if self.backfill_worker:
+            self.backfill_worker.stop()
+        if self.archive_worker:
+            self.archive_worker.stop()
+        if self.backup_worker:
+            self.backup_worker.thread.join()
         self.conn.close()
 
 if __name__ == "__main__":
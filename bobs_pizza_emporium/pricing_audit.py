@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Pricing Audit for Bob's Pizza Emporium
+Checks stored order totals against their items, and cart pricing against random carts,
+spread across every core
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+from decimal import Decimal
+
+from archive import archive_directory
+from loyalty import reward_item
+from menu import STANDARD_PIZZAS, TAX_RATE, cart_totals, custom_pizza_item, drink_item, pizza_item
+from orders import parse_order_items
+from pizza_model import CRUSTS, MODIFIERS, PLACEMENTS, SAUCES, SIZES, PizzaBuild
+from shifts import to_cents
+
+AUDIT_CHUNK_SIZE = 5000  # orders per worker task
+FUZZ_CHUNK_SIZE = 20000  # random carts per worker task
+MAX_CART_ITEMS = 12
+
+
+def expected_cents(items, tax_rate=TAX_RATE):
+    """(subtotal, tax, total) in cents for cart items, worked out in whole numbers
+
+    Deliberately shares nothing with cart_totals: tax is the rate as an
+    exact fraction, rounded half away from zero as ROUND_HALF_UP does.
+    Raises ValueError for a price that isn't a whole number of cents.
+    """
+    subtotal = 0
+    for item in items:
+        cents = Decimal(str(item['price'])).scaleb(2)
+        if cents != cents.to_integral_value():
+            raise ValueError(f"{item['name']} costs ${item['price']}, which isn't a whole number of cents")
+        subtotal += int(cents)
+    numerator, denominator = Decimal(tax_rate).as_integer_ratio()
+    tax = (abs(subtotal) * numerator * 2 + denominator) // (2 * denominator)
+    tax = -tax if subtotal < 0 else tax
+    return subtotal, tax, subtotal + tax
+
+
+def check_order(row, tax_rate=TAX_RATE):
+    """Problems with one stored (id, items, subtotal, tax, total, total_cents) orders row
+
+    The REAL columns must hold exactly the float of the cent amount, so
+    float arithmetic that drifted (21.490000000000002) shows up too.
+    """
+    order_id, items, *stored = row
+    try:
+        expected = expected_cents(parse_order_items(items), tax_rate)
+    except (ValueError, SyntaxError, KeyError, TypeError) as e:
+        return [(order_id, f"items can't be priced: {e}")]
+    problems = []
+    for column, value, cents in zip(('subtotal', 'tax', 'total'), stored, expected):
+        if value != cents / 100:
+            problems.append((order_id, f"{column} is {value!r}, items make it {cents / 100:.2f}"))
+    # Rows the total_cents backfill hasn't reached yet have nothing to compare
+    if stored[3] is not None and stored[3] != expected[2]:
+        problems.append((order_id, f"total_cents is {stored[3]}, items make it {expected[2]}"))
+    return problems
+
+
+def _audit_range(task):
+    db_path, low_id, high_id, tax_rate, total_cents = task
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(f'''
+            SELECT id, items, subtotal, tax, total, {total_cents} FROM orders
+            WHERE id BETWEEN ? AND ? ORDER BY id
+        ''', (low_id, high_id)).fetchall()
+    finally:
+        conn.close()
+    return [problem for row in rows for problem in check_order(row, tax_rate)]
+
+
+def _run(function, tasks, processes):
+    """Map `function` over `tasks`, on a process pool when there's more than one task and process"""
+    processes = processes or os.cpu_count() or 1
+    if len(tasks) < 2 or processes < 2:
+        return [function(task) for task in tasks]
+    with multiprocessing.Pool(min(processes, len(tasks))) as pool:
+        return pool.map(function, tasks)
+
+
+def audit_orders(db_path, tax_rate=TAX_RATE, processes=None, chunk_size=AUDIT_CHUNK_SIZE):
+    """Recompute every order in a database from its items; returns (order id, problem) pairs
+
+    Id ranges are checked in parallel, each on its own read-only connection.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        low, high = conn.execute('SELECT MIN(id), MAX(id) FROM orders').fetchone()
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(orders)')}
+    finally:
+        conn.close()
+    if low is None:
+        return []
+    # Databases from before the exact-totals migration only have the REAL columns
+    total_cents = 'total_cents' if 'total_cents' in columns else 'NULL'
+    tasks = [(os.path.abspath(db_path), start, min(start + chunk_size - 1, high), tax_rate, total_cents)
+             for start in range(low, high + 1, chunk_size)]
+    return sorted(problem for problems in _run(_audit_range, tasks, processes) for problem in problems)
+
+
+def audit_store(db_path, tax_rate=TAX_RATE, processes=None):
+    """audit_orders over a database and each of its monthly archives; returns {path: problems}"""
+    paths = [db_path]
+    directory = archive_directory(db_path)
+    if os.path.isdir(directory):
+        paths += [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                  if name.startswith('orders_') and name.endswith('.db')]
+    return {path: audit_orders(path, tax_rate, processes) for path in paths}
+
+
+def random_prices(rng):
+    """A menu's (size, topping, drink) prices with random cent amounts"""
+    cents = lambda: Decimal(rng.randint(1, 5000)).scaleb(-2)
+    return ({size: cents() for size in SIZES}, {name: cents() for name in MODIFIERS},
+            {name: cents() for name in ('Coca-Cola', 'Pepsi', 'Water')})
+
+
+def random_cart(rng, prices):
+    """A cart of standard pizzas, custom pizzas and drinks at `prices`, sometimes with a reward"""
+    pizza_prices, topping_prices, drink_prices = prices
+    cart = []
+    for _ in range(rng.randint(1, MAX_CART_ITEMS)):
+        kind = rng.random()
+        if kind < 0.4:
+            cart.append(pizza_item(rng.choice(STANDARD_PIZZAS)[0], rng.choice(SIZES), pizza_prices))
+        elif kind < 0.7:
+            build = PizzaBuild(rng.choice(SIZES), rng.choice(CRUSTS), rng.choice(SAUCES))
+            for _ in range(rng.randint(0, 5)):
+                build.add(rng.choice(MODIFIERS), rng.choice(PLACEMENTS), rng.randint(1, 3))
+            cart.append(custom_pizza_item(build, pizza_prices, topping_prices))
+        else:
+            cart.append(drink_item(rng.choice(list(drink_prices)), drink_prices))
+    if rng.random() < 0.1:
+        cart.append(reward_item(1))
+    return cart
+
+
+def check_cart(cart, tax_rate, rng):
+    """Problems with how cart_totals prices one cart"""
+    subtotal, tax, total = cart_totals(cart, tax_rate)
+    problems = []
+    if total != subtotal + tax:
+        problems.append(f"total {total} isn't subtotal {subtotal} + tax {tax}")
+    if any(amount.as_tuple().exponent != -2 for amount in (subtotal, tax, total)):
+        problems.append(f"({subtotal}, {tax}, {total}) aren't all in cents")
+    if tuple(map(to_cents, (subtotal, tax, total))) != expected_cents(cart, tax_rate):
+        problems.append(f"({subtotal}, {tax}, {total}) but whole-cent arithmetic gives "
+                        f"{expected_cents(cart, tax_rate)}")
+    shuffled = rng.sample(cart, len(cart))
+    if cart_totals(shuffled, tax_rate) != (subtotal, tax, total):
+        problems.append(f"reordering the cart changes its totals to {cart_totals(shuffled, tax_rate)}")
+    # What the till stores (float) and shows (Decimal text) must be the same amount
+    if float(total) != to_cents(total) / 100 or round(float(total) * 100) != to_cents(total):
+        problems.append(f"total {total} doesn't survive storage as {float(total)!r}")
+    return problems
+
+
+def _fuzz_chunk(task):
+    seed, count = task
+    rng = random.Random(seed)
+    problems = []
+    for number in range(count):
+        # Half the carts at the store's rate, half at quarter-percent rates, which often land on a half cent
+        tax_rate = TAX_RATE if number % 2 else rng.randint(0, 100) * Decimal('0.0025')
+        cart = random_cart(rng, random_prices(rng))
+        problems += [(seed, number, problem) for problem in check_cart(cart, tax_rate, rng)]
+    return problems
+
+
+def fuzz_carts(count, seed=0, processes=None, chunk_size=FUZZ_CHUNK_SIZE):
+    """Check `count` random carts in parallel; returns (seed, cart number, problem) triples
+
+    Each chunk has its own seed, so a failure can be replayed with _fuzz_chunk.
+    """
+    tasks = [(seed + index, min(chunk_size, count - start))
+             for index, start in enumerate(range(0, count, chunk_size))]
+    return [problem for problems in _run(_fuzz_chunk, tasks, processes) for problem in problems]
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Check stored order totals against their items, "
+                                                 "or check cart pricing on random carts")
+    parser.add_argument('--db', default='pizza_pos.db', help="Path to the store's database")
+    parser.add_argument('--fuzz', type=int, metavar='CARTS', help="Check this many random carts instead")
+    parser.add_argument('--seed', type=int, default=0, help="First seed for --fuzz")
+    parser.add_argument('--processes', type=int, help="Worker processes (default: one per core)")
+    args = parser.parse_args(argv)
+
+    if args.fuzz:
+        problems = fuzz_carts(args.fuzz, args.seed, args.processes)
+        for seed, number, problem in problems[:50]:
+            print(f"seed {seed} cart {number}: {problem}")
+        print(f"{args.fuzz} carts checked, {len(problems)} problem(s)")
+        return 1 if problems else 0
+
+    try:
+        results = audit_store(args.db, processes=args.processes)
+    except sqlite3.Error as e:
+        print(f"Can't audit {args.db} ({e}); start the till once to set it up", file=sys.stderr)
+        return 1
+    found = 0
+    for path, problems in results.items():
+        for order_id, problem in problems:
+            print(f"{os.path.basename(path)} order #{order_id}: {problem}")
+        found += len(problems)
+    print(f"{found} problem(s)")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Receipt Printing for Bob's Pizza Emporium
+Template-based receipt rendering and a background print spooler
+"""
+
+import functools
+import html
+import os
+import queue
+import string
+import threading
+
+STORE_NAME = "Bob's Pizza Emporium"
+
+# Where receipts go: "file:<dir>" (ESC/POS files), "html:<dir>" or "device:<path>"
+PRINTER_SETTING_ENV = 'PIZZA_POS_PRINTER'
+DEFAULT_PRINTER_SETTING = 'file:receipts'
+
+# ESC/POS control sequences
+ESC_INIT = b'\x1b@'
+ESC_BOLD_ON = b'\x1bE\x01'
+ESC_BOLD_OFF = b'\x1bE\x00'
+ESC_CUT = b'\n\n\n\x1dV\x01'
+
+# Receipt templates: a header, one item line per cart item and a footer.
+# Text receipts are 42 columns wide to fit 80mm thermal paper.
+TEMPLATES = {
+    'text': {
+        'header': ("{store:^42}\n"
+                   "Order #{order_id}\n"
+                   "{created_at}\n"
+                   "Server: {staff}\n"
+                   "{rule}\n"),
+        'item': "{name:<32.32}{price:>10}\n",
+        'footer': ("{rule}\n"
+                   "{subtotal_label:<32}{subtotal:>10}\n"
+                   "{tax_label:<32}{tax:>10}\n"
+                   "{total_label:<32}{total:>10}\n"
+                   "{rule}\n"
+                   "{thanks:^42}\n")
+    },
+    'html': {
+        'header': ("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+                   "<title>Order #{order_id}</title></head><body>\n"
+                   "<h2>{store}</h2>\n"
+                   "<p>Order #{order_id}<br>{created_at}<br>Server: {staff}</p>\n"
+                   "<table>\n"),
+        'item': "<tr><td>{name}</td><td align=\"right\">{price}</td></tr>\n",
+        'footer': ("<tr><td>{subtotal_label}</td><td align=\"right\">{subtotal}</td></tr>\n"
+                   "<tr><td>{tax_label}</td><td align=\"right\">{tax}</td></tr>\n"
+                   "<tr><th align=\"left\">{total_label}</th><th align=\"right\">{total}</th></tr>\n"
+                   "</table>\n<p>{thanks}</p>\n</body></html>\n")
+    }
+}
+
+
+@functools.lru_cache(maxsize=None)
+def compile_template(source):
+    """Parse a template section once into (literal, field, format_spec) pieces"""
+    return tuple((literal, field, spec or '')
+                 for literal, field, spec, _ in string.Formatter().parse(source))
+
+
+def render_section(source, values, escape=False):
+    """Render one compiled template section into a list of string parts"""
+    parts = []
+    for literal, field, spec in compile_template(source):
+        parts.append(literal)
+        if field is not None:
+            value = str(values[field])
+            parts.append(format(html.escape(value) if escape else value, spec))
+    return parts
+
+
+def build_receipt(order_id, staff, cart, subtotal, tax, total, created_at):
+    """Collect the values a receipt template needs"""
+    return {
+        'store': STORE_NAME,
+        'order_id': order_id,
+        'staff': staff,
+        'created_at': created_at,
+        'items': [{'name': item['name'], 'price': f"${item['price']}"} for item in cart],
+        'subtotal_label': 'Subtotal',
+        'subtotal': f"${subtotal}",
+        'tax_label': 'Tax',
+        'tax': f"${tax}",
+        'total_label': 'TOTAL',
+        'total': f"${total}",
+        'thanks': 'Thank you!',
+        'rule': '-' * 42
+    }
+
+
+def render_receipt(receipt, fmt='text'):
+    """Render a receipt as text or HTML"""
+    template = TEMPLATES[fmt]
+    escape = fmt == 'html'
+    parts = render_section(template['header'], receipt, escape)
+    for item in receipt['items']:
+        parts += render_section(template['item'], item, escape)
+    parts += render_section(template['footer'], receipt, escape)
+    return ''.join(parts)
+
+
+def render_escpos(receipt):
+    """Render a receipt as ESC/POS bytes for a thermal printer"""
+    text = render_receipt(receipt, 'text').encode('cp437', errors='replace')
+    # Print the store name in bold and cut the paper at the end
+    store_line, rest = text.split(b'\n', 1)
+    return ESC_INIT + ESC_BOLD_ON + store_line + b'\n' + ESC_BOLD_OFF + rest + ESC_CUT
+
+
+class FilePrinter:
+    """Fake printer that writes each job to a file, for offline use and tests"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(data)
+
+
+class DevicePrinter:
+    """ESC/POS printer reachable as a device file (e.g. /dev/usb/lp0)"""
+
+    def __init__(self, device):
+        self.device = device
+
+    def write(self, name, data):
+        with open(self.device, 'wb') as f:
+            f.write(data)
+
+
+def printer_from_setting(setting=None):
+    """Build (printer, format) from a printer setting, defaulting to $PIZZA_POS_PRINTER
+
+    The format is 'escpos' or 'html' and is what `receipt_job` renders.
+    """
+    setting = setting or os.environ.get(PRINTER_SETTING_ENV) or DEFAULT_PRINTER_SETTING
+    kind, _, target = setting.partition(':')
+    if kind == 'file':
+        return FilePrinter(target or 'receipts'), 'escpos'
+    if kind == 'html':
+        return FilePrinter(target or 'receipts'), 'html'
+    if kind == 'device' and target:
+        return DevicePrinter(target), 'escpos'
+    raise ValueError(f"Unknown printer setting: {setting}")
+
+
+def receipt_job(receipt, fmt):
+    """Return (job name, data) for a receipt in a printer's format"""
+    if fmt == 'html':
+        return f"receipt_{receipt['order_id']}.html", render_receipt(receipt, 'html').encode('utf-8')
+    return f"receipt_{receipt['order_id']}.txt", render_escpos(receipt)
+
+
+class ReceiptSpooler:
+    """Sends print jobs to a printer on a background thread
+
+    Printing is slow and can hang on a jammed printer, so the till only
+    queues the job and carries on.
+    """
+
+    def __init__(self, printer):
+        self.printer = printer
+        self.jobs = queue.Queue()
+        self.errors = []
+        self.thread = threading.Thread(target=self._run, name='receipt-spooler', daemon=True)
+        self.thread.start()
+
+    def submit(self, name, data):
+        """Queue a print job"""
+        self.jobs.put((name, data))
+
+    def wait(self):
+        """Block until every queued job has been printed"""
+        self.jobs.join()
+
+    def stop(self):
+        """Finish queued jobs and stop the spooler thread"""
+        self.jobs.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                name, data = job
+                self.printer.write(name, data)
+            except Exception as e:
+                # Never let one bad job kill the thread and hang wait()/stop()
+                self.errors.append((job[0], str(e)))
+            finally:
+                self.jobs.task_done()
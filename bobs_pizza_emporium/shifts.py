@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Shift Tracking for Bob's Pizza Emporium
+Shifts opened at login, running totals per order and Z-reports at logout
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+
+def to_cents(amount):
+    """Convert a money amount to integer cents"""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """Convert integer cents back to a Decimal amount"""
+    return (Decimal(cents) / 100).quantize(Decimal('0.01'))
+
+
+def init_shift_tables(cursor):
+    """Create the shifts table"""
+    # Running totals are integer cents so repeated additions never drift
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shifts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            opened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closed_at TIMESTAMP,
+            order_count INTEGER NOT NULL DEFAULT 0,
+            subtotal_cents INTEGER NOT NULL DEFAULT 0,
+            tax_cents INTEGER NOT NULL DEFAULT 0,
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            cash_cents INTEGER NOT NULL DEFAULT 0,
+            opening_float_cents INTEGER NOT NULL DEFAULT 0,
+            counted_cash_cents INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_shifts_open
+        ON shifts (user_id, closed_at)
+    ''')
+
+
+def render_z_report(report):
+    """Format a Z-report for display"""
+    lines = [
+        f"Shift #{report['shift_id']} - {report['username']}",
+        f"Opened: {report['opened_at']}",
+        f"Closed: {report['closed_at'] or 'open'}",
+        f"Opening float: ${report['opening_float']}",
+        "",
+        f"Orders: {report['order_count']}",
+        f"Subtotal: ${report['subtotal']}",
+        f"Tax: ${report['tax']}",
+        f"Total: ${report['total']}",
+        f"  Cash: ${report['cash_sales']}",
+        f"  Card: ${report['card_sales']}"
+    ]
+    if report['counted_cash'] is not None:
+        lines += [
+            "",
+            f"Expected in drawer: ${report['expected_cash']}",
+            f"Counted in drawer: ${report['counted_cash']}",
+            f"Over/short: ${report['variance']}"
+        ]
+    return "\n".join(lines)
+
+
+class ShiftTracker:
+    """Per-user shifts with totals maintained as orders are placed"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def find_open_shift(self, user_id):
+        """Return the id of the user's open shift, or None"""
+        self.cursor.execute('''
+            SELECT id FROM shifts WHERE user_id = ? AND closed_at IS NULL
+            ORDER BY id DESC LIMIT 1
+        ''', (user_id,))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def open_shift(self, user_id, opening_float=0):
+        """Return the user's open shift, opening a new one with `opening_float` if needed"""
+        shift_id = self.find_open_shift(user_id)
+        if shift_id is not None:
+            return shift_id
+        self.cursor.execute('INSERT INTO shifts (user_id, opening_float_cents) VALUES (?, ?)',
+                            (user_id, to_cents(opening_float)))
+        return self.cursor.lastrowid
+
+    def record_order(self, shift_id, subtotal, tax, total, cash=None, orders=1):
+        """Add an order to the shift totals; the caller owns the transaction
+
+        `cash` is the part of the total paid in cash (all of it by default)
+        and is what the drawer is expected to hold. Adjustments pass
+        negative amounts, with `orders` -1 for a void and 0 otherwise.
+        """
+        self.cursor.execute('''
+            UPDATE shifts
+            SET order_count = order_count + ?,
+                subtotal_cents = subtotal_cents + ?,
+                tax_cents = tax_cents + ?,
+                total_cents = total_cents + ?,
+                cash_cents = cash_cents + ?
+            WHERE id = ?
+        ''', (orders, to_cents(subtotal), to_cents(tax), to_cents(total),
+              to_cents(total if cash is None else cash), shift_id))
+
+    def close_shift(self, shift_id, counted_cash=None):
+        """Close a shift, recording the counted drawer, and return its Z-report"""
+        self.cursor.execute('''
+            UPDATE shifts
+            SET closed_at = CURRENT_TIMESTAMP, counted_cash_cents = ?
+            WHERE id = ? AND closed_at IS NULL
+        ''', (None if counted_cash is None else to_cents(counted_cash), shift_id))
+        return self.z_report(shift_id)
+
+    def z_report(self, shift_id):
+        """Return the Z-report for a shift from its stored running totals"""
+        self.cursor.execute('''
+            SELECT s.id, u.username, s.opened_at, s.closed_at, s.order_count,
+                   s.subtotal_cents, s.tax_cents, s.total_cents, s.counted_cash_cents,
+                   s.opening_float_cents, s.cash_cents
+            FROM shifts s
+            LEFT JOIN users u ON u.id = s.user_id
+            WHERE s.id = ?
+        ''', (shift_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        counted = row[8]
+        expected = row[9] + row[10]
+        return {
+            'shift_id': row[0],
+            'username': row[1],
+            'opened_at': row[2],
+            'closed_at': row[3],
+            'order_count': row[4],
+            'subtotal': from_cents(row[5]),
+            'tax': from_cents(row[6]),
+            'total': from_cents(row[7]),
+            'cash_sales': from_cents(row[10]),
+            'card_sales': from_cents(row[7] - row[10]),
+            'opening_float': from_cents(row[9]),
+            'expected_cash': from_cents(expected),
+            'counted_cash': None if counted is None else from_cents(counted),
+            'variance': None if counted is None else from_cents(counted - expected)
+        }
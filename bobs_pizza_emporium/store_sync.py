@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Multi-Store Sync for Bob's Pizza Emporium
+Ships each store's order and user changes to a central reporting database
+
+Usage:
+    python store_sync.py --store STORE_ID --central central.db [--source pizza_pos.db]
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import zlib
+
+BATCH_SIZE = 500
+
+# Columns captured for each synced table (PINs never leave the store)
+SYNCED_COLUMNS = {
+    'orders': ('id', 'user_id', 'items', 'subtotal', 'tax', 'total', 'created_at'),
+    'users': ('id', 'username', 'is_admin', 'created_at')
+}
+
+
+def _json_row(table, prefix):
+    """json_object(...) expression for a trigger's NEW/OLD row"""
+    return 'json_object({})'.format(
+        ', '.join(f"'{column}', {prefix}.{column}" for column in SYNCED_COLUMNS[table]))
+
+
+def init_sync_tables(cursor):
+    """Create the change-capture outbox and triggers on synced tables"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            payload TEXT
+        )
+    ''')
+
+    # Highest outbox id the central database has acknowledged
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            shipped_through INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    for table in SYNCED_COLUMNS:
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS sync_{table}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO sync_outbox (table_name, row_id, op, payload)
+                VALUES ('{table}', NEW.id, 'upsert', {_json_row(table, 'NEW')});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS sync_{table}_update
+            AFTER UPDATE OF {', '.join(SYNCED_COLUMNS[table])} ON {table}
+            BEGIN
+                INSERT INTO sync_outbox (table_name, row_id, op, payload)
+                VALUES ('{table}', NEW.id, 'upsert', {_json_row(table, 'NEW')});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS sync_{table}_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO sync_outbox (table_name, row_id, op, payload)
+                VALUES ('{table}', OLD.id, 'delete', NULL);
+            END
+        ''')
+
+    # First run: queue a snapshot of rows written before capture existed
+    cursor.execute('SELECT COUNT(*) FROM sync_state')
+    if cursor.fetchone()[0] == 0:
+        for table in SYNCED_COLUMNS:
+            cursor.execute(f'''
+                INSERT INTO sync_outbox (table_name, row_id, op, payload)
+                SELECT '{table}', id, 'upsert', {_json_row(table, table)} FROM {table}
+                ORDER BY id
+            ''')
+        cursor.execute('INSERT INTO sync_state (id, shipped_through) VALUES (1, 0)')
+
+
+def init_central_tables(cursor):
+    """Create the consolidated tables in the central reporting database"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS store_orders (
+            store_id TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            user_id INTEGER,
+            items TEXT NOT NULL,
+            subtotal DECIMAL(10,2) NOT NULL,
+            tax DECIMAL(10,2) NOT NULL,
+            total DECIMAL(10,2) NOT NULL,
+            created_at TIMESTAMP,
+            PRIMARY KEY (store_id, id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS store_users (
+            store_id TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            is_admin BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP,
+            PRIMARY KEY (store_id, id)
+        )
+    ''')
+
+    # Last outbox id applied per store; makes re-sent batches no-ops
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS store_sync_state (
+            store_id TEXT PRIMARY KEY,
+            applied_through INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def export_batch(cursor, limit=BATCH_SIZE):
+    """Return (last outbox id, compressed batch) of unshipped changes, or (None, None)"""
+    cursor.execute('SELECT shipped_through FROM sync_state WHERE id = 1')
+    shipped_through = cursor.fetchone()[0]
+    cursor.execute('''
+        SELECT id, table_name, row_id, op, payload FROM sync_outbox
+        WHERE id > ? ORDER BY id LIMIT ?
+    ''', (shipped_through, limit))
+    events = cursor.fetchall()
+    if not events:
+        return None, None
+    batch = [{'id': event_id, 'table': table, 'row_id': row_id, 'op': op,
+              'row': json.loads(payload) if payload else None}
+             for event_id, table, row_id, op, payload in events]
+    return events[-1][0], zlib.compress(json.dumps(batch).encode('utf-8'))
+
+
+def acknowledge(cursor, through_id):
+    """Mark changes up to `through_id` as shipped and drop them from the outbox"""
+    cursor.execute('UPDATE sync_state SET shipped_through = ? WHERE id = 1', (through_id,))
+    cursor.execute('DELETE FROM sync_outbox WHERE id <= ?', (through_id,))
+
+
+def apply_batch(cursor, store_id, data):
+    """Apply a compressed batch to the central database; the caller owns the transaction
+
+    Events at or below the store's applied id are skipped, so a batch
+    that is delivered twice changes nothing the second time.
+    """
+    cursor.execute('''
+        INSERT INTO store_sync_state (store_id, applied_through) VALUES (?, 0)
+        ON CONFLICT (store_id) DO NOTHING
+    ''', (store_id,))
+    cursor.execute('SELECT applied_through FROM store_sync_state WHERE store_id = ?', (store_id,))
+    applied_through = cursor.fetchone()[0]
+
+    applied = 0
+    for event in json.loads(zlib.decompress(data).decode('utf-8')):
+        if event['id'] <= applied_through:
+            continue
+        target = f"store_{event['table']}"
+        if event['op'] == 'delete':
+            cursor.execute(f'DELETE FROM {target} WHERE store_id = ? AND id = ?',
+                           (store_id, event['row_id']))
+        else:
+            columns = SYNCED_COLUMNS[event['table']]
+            updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != 'id')
+            cursor.execute(f'''
+                INSERT INTO {target} (store_id, {', '.join(columns)})
+                VALUES (?, {', '.join('?' for _ in columns)})
+                ON CONFLICT (store_id, id) DO UPDATE SET {updates}
+            ''', [store_id] + [event['row'][column] for column in columns])
+        applied_through = event['id']
+        applied += 1
+
+    cursor.execute('UPDATE store_sync_state SET applied_through = ? WHERE store_id = ?',
+                   (applied_through, store_id))
+    return applied
+
+
+def sync(source_conn, central_conn, store_id, batch_size=BATCH_SIZE):
+    """Ship every pending change from a store to the central database
+
+    Returns the number of changes applied. Each batch is committed
+    centrally before the store acknowledges it, so an interrupted sync
+    resends at most one batch, which the central side then ignores.
+    """
+    source = source_conn.cursor()
+    central = central_conn.cursor()
+    init_central_tables(central)
+    central_conn.commit()
+
+    total = 0
+    while True:
+        through_id, data = export_batch(source, batch_size)
+        if data is None:
+            return total
+        total += apply_batch(central, store_id, data)
+        central_conn.commit()
+        acknowledge(source, through_id)
+        source_conn.commit()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Sync a store database to the central reporting database")
+    parser.add_argument('--store', required=True, help="Identifier for this store")
+    parser.add_argument('--central', required=True, help="Path to the central SQLite database")
+    parser.add_argument('--source', default='pizza_pos.db', help="Path to this store's database")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    source_conn = sqlite3.connect(args.source)
+    central_conn = sqlite3.connect(args.central)
+    try:
+        init_sync_tables(source_conn.cursor())
+        source_conn.commit()
+        count = sync(source_conn, central_conn, args.store, args.batch_size)
+        print(f"Synced {count} change(s) from store '{args.store}' to {args.central}")
+    finally:
+        source_conn.close()
+        central_conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
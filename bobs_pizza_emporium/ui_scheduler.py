@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+UI Scheduler for Bob's Pizza Emporium
+Coalesces redraws into one pass when Tk goes idle and runs database reads off the Tk thread
+"""
+
+import queue
+import sqlite3
+import threading
+import tkinter as tk
+
+RESULT_POLL_MS = 16  # about one frame
+
+
+class UIScheduler:
+    """Batches widget redraws and marshals background results onto the Tk loop
+
+    `invalidate(key, redraw)` marks something on screen as out of date.
+    Every mark made before Tk next goes idle is redrawn once, in the order
+    first marked, so a burst of taps costs one redraw per widget rather
+    than one per tap. Handlers update the model straight away; only the
+    drawing waits.
+
+    `run_in_background(work, done)` runs `work(cursor)` on a worker thread
+    with its own connection and calls `done(result)` back on the Tk thread.
+    """
+
+    def __init__(self, root, db_path=None):
+        self.root = root
+        self.db_path = db_path
+        self.pending = {}  # key -> redraw, in the order first marked
+        self.flush_scheduled = False
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.outstanding = 0
+        self.polling = False
+        self.worker = None
+
+    def invalidate(self, key, redraw):
+        """Redraw `key` once Tk is idle; marking it again before then changes nothing"""
+        self.pending[key] = redraw
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            self.root.after_idle(self.flush)
+
+    def flush(self):
+        """Run every pending redraw now"""
+        self.flush_scheduled = False
+        pending, self.pending = self.pending, {}
+        for redraw in pending.values():
+            try:
+                redraw()
+            except tk.TclError:
+                # The widget was closed before its redraw came round
+                pass
+
+    def run_in_background(self, work, done):
+        """Run `work(cursor)` on the worker thread, then `done(result)` on the Tk thread
+
+        Meant for reads that only feed the screen: if one fails, `done` is
+        not called and the screen keeps what it showed until the next one.
+        """
+        if self.worker is None:
+            self.worker = threading.Thread(target=self._work, name='ui-worker', daemon=True)
+            self.worker.start()
+        self.jobs.put((work, done))
+        self.outstanding += 1
+        if not self.polling:
+            self.polling = True
+            self.root.after(RESULT_POLL_MS, self._deliver)
+
+    def _work(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                work, done = job
+                try:
+                    self.results.put((done, work(conn.cursor())))
+                except sqlite3.Error:
+                    self.results.put((None, None))
+        finally:
+            conn.close()
+
+    def _deliver(self):
+        while True:
+            try:
+                done, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.outstanding -= 1
+            if done is not None:
+                done(result)
+        if self.outstanding:
+            self.root.after(RESULT_POLL_MS, self._deliver)
+        else:
+            self.polling = False
+
+    def stop(self):
+        """Finish queued background work and close the worker's connection"""
+        if self.worker is not None:
+            self.jobs.put(None)
+            self.worker.join()
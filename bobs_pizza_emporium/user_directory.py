@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+User Directory for Bob's Pizza Emporium
+Paged, prefix-searchable access to staff accounts for large rosters
+"""
+
+import string
+
+PAGE_SIZE = 100
+
+# SQLite's NOCASE collation only folds ASCII letters
+_NOCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def init_user_directory_tables(cursor):
+    """Create the case-insensitive username index used for search and paging"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_username_nocase
+        ON users (username COLLATE NOCASE, id)
+    ''')
+
+
+def sort_key(row):
+    """Sort key for a (id, username, is_admin) row, matching the SQL ordering"""
+    return (row[1].translate(_NOCASE), row[0])
+
+
+def matches_prefix(username, prefix):
+    """Check a username against a search prefix the same way the index does"""
+    return username.translate(_NOCASE).startswith(prefix.translate(_NOCASE))
+
+
+class UserDirectory:
+    """Keyset-paged user queries backed by the username index"""
+
+    def __init__(self, cursor, page_size=PAGE_SIZE):
+        self.cursor = cursor
+        self.page_size = page_size
+
+    def page(self, prefix='', after=None):
+        """Return the next page of (id, username, is_admin) rows
+
+        `after` is the last row of the previous page, so each page is a
+        single index range scan no matter how deep the list is scrolled.
+        """
+        # Deleted accounts stay in the table for history but leave the roster
+        conditions = ['deleted_at IS NULL']
+        params = []
+        if prefix:
+            # Range scan on the index instead of a LIKE over every row
+            conditions.append('username >= ? COLLATE NOCASE AND username < ? COLLATE NOCASE')
+            params += [prefix, prefix + '\uffff']
+        if after is not None:
+            # Spelled out rather than as a row value so the index can seek to `after`
+            conditions.append('username >= ? COLLATE NOCASE AND (username > ? COLLATE NOCASE OR id > ?)')
+            params += [after[1], after[1], after[0]]
+
+        self.cursor.execute(f'''
+            SELECT id, username, is_admin FROM users
+            WHERE {' AND '.join(conditions)}
+            ORDER BY username COLLATE NOCASE, id
+            LIMIT ?
+        ''', params + [self.page_size])
+        return self.cursor.fetchall()
+
+    def get(self, user_id):
+        """Return (id, username, pin, is_admin) for a user id"""
+        self.cursor.execute('SELECT id, username, pin, is_admin FROM users WHERE id = ?', (user_id,))
+        return self.cursor.fetchone()